@@ -3,7 +3,7 @@ import os
 import asyncio
 import time
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Awaitable
 from pydantic import BaseModel, ConfigDict
 from dotenv import load_dotenv
 from datetime import datetime
@@ -13,16 +13,33 @@ from livekit.agents import (
     Agent,
     AgentSession,
     JobContext,
+    JobProcess,
     WorkerOptions,
     RoomInputOptions,
     function_tool,
 )
 from livekit.plugins import openai, noise_cancellation
 from livekit.plugins.openai import realtime
+from livekit.agents.metrics import RealtimeModelMetrics
 
 # --- Local imports
 from db import DatabaseDriver
-from prompts import AGENT_INSTRUCTION, SESSION_INSTRUCTION
+from worker_load import worker_load, WORKER_LOAD_THRESHOLD
+from prewarm import warm_process, warm_http_pools
+from caller_id import CallerIdResolver, CALLER_ID_ORDER_WAIT
+from call_context import CallContext, CallState
+from twilio_client import get_twilio_client
+from outbox import get_order_outbox, start_outbox_replayer
+from drain import (
+    drain_call, track_call, release_call, install_process_exit_hook, WORKER_DRAIN_TIMEOUT, JOB_SHUTDOWN_TIMEOUT
+)
+from menu import resolve_order_item, answer_menu_query
+from intents import fallback_response
+from teardown import TeardownEngine, TeardownStrategy, StrategyUnavailable, TEARDOWN_DEADLINE
+from task_supervisor import TaskSupervisor
+from loop_monitor import start_loop_monitor
+from latency_metrics import TurnLatencyTracker, latency_registry, export_latency_metrics_periodically
+from prompts import get_static_instructions, build_dynamic_suffix
 
 # --- Load environment variables
 load_dotenv()
@@ -30,18 +47,54 @@ load_dotenv()
 # ============================================================
 # 🚀 MODULE-LEVEL PROMPT CACHE: Load once, reuse forever
 # ============================================================
-# Cache combined instructions at module level to avoid any recalculation
-# Prompts are already cached in prompts.py, this ensures combined version is also cached
-_COMBINED_INSTRUCTIONS_CACHE = None
+# The static prefix is compiled once per process and is byte-identical for
+# every session, so the realtime API's prompt cache can hit. Only the small
+# dynamic suffix (time, caller context) is built per session.
+
+# "full" sends the complete prompt with the embedded menu,
+# "slim" sends a compact prompt and answers menu questions via lookup_menu
+PROMPT_VARIANT = os.getenv("PROMPT_VARIANT", "full").lower()
 
 def _get_combined_instructions():
-    """Get cached combined instructions - computed once at module load"""
-    global _COMBINED_INSTRUCTIONS_CACHE
-    if _COMBINED_INSTRUCTIONS_CACHE is None:
-        # AGENT_INSTRUCTION and SESSION_INSTRUCTION are already cached in prompts.py
-        # This is just combining them once and storing in memory
-        _COMBINED_INSTRUCTIONS_CACHE = f"{AGENT_INSTRUCTION}\n\n{SESSION_INSTRUCTION}"
-    return _COMBINED_INSTRUCTIONS_CACHE
+    """Get cached static instruction prefix - computed once per process"""
+    return get_static_instructions(PROMPT_VARIANT)
+
+
+class PromptCacheStats:
+    """Tracks how many realtime input tokens were served from the prompt cache"""
+
+    def __init__(self):
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.responses = 0
+
+    def record(self, metrics):
+        """Add one RealtimeModelMetrics sample"""
+        self.responses += 1
+        self.input_tokens += metrics.input_tokens
+        details = getattr(metrics, "input_token_details", None)
+        if details is not None:
+            self.cached_tokens += details.cached_tokens
+
+    @property
+    def cached_ratio(self) -> float:
+        return self.cached_tokens / self.input_tokens if self.input_tokens else 0.0
+
+# --- Hangup timing
+# Upper bound on waiting for the confirmation / goodbye to finish playing
+HANGUP_PLAYOUT_TIMEOUT = float(os.getenv("HANGUP_PLAYOUT_TIMEOUT", "15"))
+# Silence after the goodbye has played out, before the SIP leg is dropped
+HANGUP_POST_ROLL = float(os.getenv("HANGUP_POST_ROLL", "0.75"))
+HANGUP_DELAY = "agent_hangup_delay_seconds"
+latency_registry.describe(HANGUP_DELAY, "Order saved to hangup start (confirmation + goodbye playout + post-roll)")
+
+# --- Background task deadlines (see task_supervisor.py)
+ORDER_SAVE_TASK_TIMEOUT = float(os.getenv("ORDER_SAVE_TASK_TIMEOUT", "30"))
+# Confirmation + goodbye playout, post-roll and teardown, with some slack
+HANGUP_TASK_TIMEOUT = 2 * HANGUP_PLAYOUT_TIMEOUT + HANGUP_POST_ROLL + TEARDOWN_DEADLINE + 5
+GREETING_TASK_TIMEOUT = 10.0
+# Customer profile prefetch + instruction refresh
+PROFILE_PREFETCH_TIMEOUT = float(os.getenv("PROFILE_PREFETCH_TIMEOUT", "5"))
 
 # --- Production Mode Configuration
 PRODUCTION = os.getenv("ENVIRONMENT") == "production"
@@ -54,21 +107,23 @@ if PRODUCTION:
 else:
     log.setLevel(logging.INFO)
 
-# --- Database (lazy initialization to avoid blocking)
-db_driver = None
+def prewarm(proc: JobProcess):
+    """Warm Mongo, prompts, menu matchers, API clients and audio models before the process takes calls"""
+    warm_process(proc.userdata, PROMPT_VARIANT)
+    # Executor and Mongo client live as long as the process (see drain.py)
+    install_process_exit_hook(proc.userdata)
 
-def get_db_driver():
-    """Get database driver with lazy initialization"""
-    global db_driver
-    if db_driver is None:
-        db_driver = DatabaseDriver()
-    return db_driver
+
+def get_db_driver(proc: JobProcess) -> DatabaseDriver:
+    """Process-wide database driver (created by prewarm, or lazily if prewarm was skipped)"""
+    driver = proc.userdata.get("db_driver")
+    if driver is None:
+        driver = proc.userdata["db_driver"] = DatabaseDriver()
+    return driver
 
 # ------------------------------------------------------------
 # 🧩 FUNCTION TOOLS
 # ------------------------------------------------------------
-current_agent = None
-current_job_context = None
 class OrderItem(BaseModel):
     model_config = ConfigDict(extra="forbid")
     
@@ -87,17 +142,59 @@ class CreateOrderArgs(BaseModel):
 
 
 
-def create_order_tool_factory(agent_instance):
-    """Factory function to create a create_order tool bound to a specific agent instance"""
+@function_tool()
+async def lookup_menu(query: str):
+    """Look up menu items, prices and whether a spice level is needed.
+
+    Args:
+        query: A dish name (e.g. "lamb biryani"), a category (e.g. "veg appetizers"), or "menu" for everything.
+    """
+    return answer_menu_query(query)
+
+
+def _normalize_order_item(item: OrderItem) -> Dict[str, Any]:
+    """Resolve an item against the menu catalog and enforce the menu price"""
+    payload = item.model_dump()
+    menu_item, canonical_name = resolve_order_item(item.name)
+    if menu_item is None:
+        log.warning(f"⚠️ Item not in menu catalog, keeping as ordered: {item.name}")
+        return payload
+    if abs(menu_item.price - item.price) > 0.005:
+        log.warning(f"⚠️ Price for {menu_item.name} corrected from {item.price} to {menu_item.price}")
+    payload["name"] = canonical_name
+    payload["price"] = menu_item.price
+    return payload
+
+
+def create_order_tool_factory(call: CallContext, on_order_placed: Callable[[], Awaitable[None]]):
+    """
+    Create a create_order tool bound to one call.
+
+    Args:
+        call: The call's CallContext (phone, order state, database)
+        on_order_placed: Coroutine function run once the order is saved (e.g. hang up)
+    """
     @function_tool()
     async def create_order(items: List[OrderItem], phone: str | None = None, name: str | None = None, address: str | None = None):
         """Create an order with the provided items."""
-        if agent_instance and agent_instance.order_placed:
+        if call.order_placed or call.state == CallState.SAVING_ORDER:
+            return "I'm sorry, but I can only place one order per call. Your previous order has already been confirmed."
+        if not call.accepting_orders:
+            return "I'm sorry, the call is ending and I can't take an order now."
+
+        if not phone or phone == "unknown":
+            caller_phone = call.caller_phone
+            if not caller_phone and call.caller_id is not None:
+                # Caller ID may still be arriving - wait briefly rather than fall back
+                caller_phone = await call.caller_id.wait(timeout=CALLER_ID_ORDER_WAIT)
+            if caller_phone:
+                phone = caller_phone
+
+        # Claim the call's single order. Two concurrent tool calls can both get
+        # past the checks above (the caller ID wait yields); try_transition is
+        # atomic, so only one of them moves the call to SAVING_ORDER.
+        if not call.try_transition(CallState.SAVING_ORDER):
             return "I'm sorry, but I can only place one order per call. Your previous order has already been confirmed."
-
-        if agent_instance and agent_instance.caller_phone:
-            if not phone or phone == "unknown":
-                phone = agent_instance.caller_phone
 
         try:
             if not phone or phone == "unknown":
@@ -105,39 +202,72 @@ def create_order_tool_factory(agent_instance):
             else:
                 final_phone = phone
 
+            # Normalize names and use server-side menu prices
+            items_payload = [_normalize_order_item(item) for item in items]
+
+            # Durably journal the order BEFORE confirming it to the caller.
+            # If the save below never completes, the outbox replayer will.
+            outbox = get_order_outbox()
+            outbox_id = None
+            try:
+                outbox_id = await outbox.append({
+                    "phone": final_phone,
+                    "items": items_payload,
+                    "name": name,
+                    "address": address,
+                })
+            except Exception as e:
+                log.error(f"Outbox append failed (saving directly): {e}")
+
+            def save_failed():
+                if not outbox_id:
+                    # Nothing durable - the caller may try again
+                    call.try_transition(CallState.ACTIVE)
+                    return
+                # The caller was told the order is placed and the outbox
+                # replayer will store it - re-opening the tool would let a
+                # retry create a second order
+                log.error(f"⚠️ Order save failed - outbox entry {outbox_id} will be replayed")
+                call.order = {"outbox_id": outbox_id, "phone": final_phone, "items": items_payload, "name": name, "address": address}
+                if call.try_transition(CallState.ORDER_PLACED):
+                    call.tasks.spawn(on_order_placed(), "hangup", timeout=HANGUP_TASK_TIMEOUT)
+
             # Make database call non-blocking - don't wait for it
             async def save_order_async():
+                result = None
                 try:
-                    # 🔍 DEBUG: Agent calling save
-                    log.info(f"🔍 DEBUG: Agent save_order_async starting...")
-                    
-                    # Use the new Clover-integrated method (fully async)
-                    items_payload = [item.model_dump() for item in items]
                     log.info(f"🔍 DEBUG: Items payload: {items_payload}")
-                    
-                    # Get database driver (lazy initialization)
-                    driver = get_db_driver()
-                    result = await driver.create_order_with_clover(
-                        final_phone, items_payload, name, address
+                    result = await call.db.create_order_with_clover(
+                        final_phone, items_payload, name, address, outbox_id=outbox_id
                     )
-                    
                     log.info(f"🔍 DEBUG: save result: {result is not None}")
-                    
-                    if result:
-                        agent_instance.order_placed = True
-                        log.info(f"✅ Order saved (MongoDB + Clover POS)")
-                        asyncio.create_task(agent_instance._terminate_call_after_delay())
+                except asyncio.CancelledError:
+                    # ORDER_SAVE_TASK_TIMEOUT (or the drain) cancelled the save -
+                    # don't leave the call stuck in SAVING_ORDER
+                    save_failed()
+                    raise
                 except Exception as e:
                     log.error(f"Async order save failed: {e}")
                     import traceback
                     log.error(f"🔍 DEBUG: Agent traceback: {traceback.format_exc()}")
-            
+
+                if not result:
+                    save_failed()
+                    return
+                if outbox_id:
+                    await outbox.ack(outbox_id)
+                call.order = result
+                if call.try_transition(CallState.ORDER_PLACED):
+                    log.info(f"✅ Order saved (MongoDB, Clover sync queued)")
+                    call.tasks.spawn(on_order_placed(), "hangup", timeout=HANGUP_TASK_TIMEOUT)
+
             # Don't wait for database - respond immediately
-            asyncio.create_task(save_order_async())
+            call.tasks.spawn(save_order_async(), "save_order", timeout=ORDER_SAVE_TASK_TIMEOUT)
 
             return "✅ Order placed successfully! Your order has been confirmed and saved to our system. We will send you the details shortly."
         except Exception as e:
             log.error(f"Order creation failed: {e}")
+            call.try_transition(CallState.ACTIVE)
             return "Sorry, there was an error saving your order. Please try again."
 
     return create_order
@@ -150,41 +280,36 @@ class RestaurantAgent(Agent):
     # Class-level cache (shared across all instances)
     _cached_instructions = None
     
-    def __init__(self, job_context=None):
-        # Use module-level cache to ensure prompts are loaded only once
-        # _get_combined_instructions() guarantees single computation
+    def __init__(self, call: CallContext):
+        # Static prefix is computed once per process; only the suffix is per session
         if RestaurantAgent._cached_instructions is None:
             RestaurantAgent._cached_instructions = _get_combined_instructions()
-        
-        create_order_tool = create_order_tool_factory(self)
+        self._call_context = build_dynamic_suffix()
+        self.call = call
+
+        create_order_tool = create_order_tool_factory(call, self._terminate_call_after_delay)
 
         super().__init__(
-            instructions=RestaurantAgent._cached_instructions,
-            tools=[create_order_tool],
+            instructions=f"{RestaurantAgent._cached_instructions}\n{self._call_context}",
+            tools=[create_order_tool, lookup_menu],
         )
 
-        self.current_session = None
-        self.caller_phone = None
-        self.termination_started = False
-        self.order_placed = False
-        self.job_context = job_context
-
-        global current_agent
-        current_agent = self
-
-    async def _execute_tool(self, tool_call, session):
-        if tool_call.function.name == "create_order":
-            import json, time
-            args = json.loads(tool_call.function.arguments)
-            phone = self.caller_phone
-            if not phone or phone in ["unknown", "extracted_failed"]:
-                phone = f"call_{int(time.time())}"
-            args["phone"] = phone
-            tool_call.function.arguments = json.dumps(args)
-        return await super()._execute_tool(tool_call, session)
+        self.prompt_cache_stats = PromptCacheStats()
+
+    async def refresh_call_context(self):
+        """Rebuild the dynamic instruction suffix (e.g. once the caller phone is known)"""
+        call_context = build_dynamic_suffix(self.call.caller_phone, profile=self.call.profile)
+        if call_context == self._call_context:
+            return
+        self._call_context = call_context
+        try:
+            # Static prefix is unchanged, so the prompt cache still applies
+            await self.update_instructions(f"{RestaurantAgent._cached_instructions}\n{call_context}")
+        except Exception as e:
+            log.warning(f"Could not update call context: {e}")
 
     async def on_message(self, message, session):
-        if self.termination_started:
+        if self.call.terminating:
             return "The call is ending. Thank you for choosing bansari Restaurant!"
         try:
             # Use reasonable timeout - balance between waiting and responsiveness
@@ -203,17 +328,10 @@ class RestaurantAgent(Agent):
             return self._get_smart_fallback_response(message.content or "")
 
     def _get_smart_fallback_response(self, msg: str):
-        msg = msg.lower()
-        if any(x in msg for x in ['order', 'food', 'menu', 'biryani', 'chicken', 'mutton', 'rice', 'curry']):
-            return "I can help you place an order! Please tell me what you'd like to order."
-        if any(x in msg for x in ['hello', 'hi', 'hey']):
-            return "Hello! Welcome to bansari Restaurant. How can I help you today?"
-        if any(x in msg for x in ['price', 'cost', 'how much']):
-            return "Our prices are very reasonable. What specific dish would you like to know the price for?"
-        return "I'm here to help you with your order. What would you like to order?"
+        # Single-pass keyword automaton over menu items and intents (see intents.py)
+        return fallback_response(msg)
 
     async def on_start(self, session: AgentSession):
-        self.current_session = session
         # Start greeting immediately - generate_reply returns a SpeechHandle, not a coroutine
         # Don't await it - let it run in the background
         try:
@@ -228,178 +346,218 @@ class RestaurantAgent(Agent):
     # ------------------------------------------------------------
     # 🧩 FULL TERMINATION SEQUENCE
     # ------------------------------------------------------------
+    async def _wait_for_playout(self, timeout: float):
+        """Wait until the agent has finished speaking (current and follow-up speech), up to timeout"""
+        deadline = time.perf_counter() + timeout
+        while self.call.session:
+            handle = getattr(self.call.session, "current_speech", None)
+            remaining = deadline - time.perf_counter()
+            if handle is None or handle.done() or remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(handle.wait_for_playout(), timeout=remaining)
+            except asyncio.TimeoutError:
+                log.warning(f"⚠️ Playout did not finish within {timeout:.0f}s - hanging up anyway")
+                return
+
     async def _terminate_call_after_delay(self):
-        """Comprehensive call termination logic"""
-        job_context = self.job_context
+        """End the call once the confirmation and goodbye have played out"""
+        call = self.call
         try:
             log.info("🔧 Starting automatic call termination sequence...")
-            await asyncio.sleep(5.0)
-            self.termination_started = True
+            started = time.perf_counter()
+
+            if call.session:
+                # Let the order confirmation finish playing before saying goodbye
+                await self._wait_for_playout(HANGUP_PLAYOUT_TIMEOUT)
+                if not call.try_transition(CallState.TERMINATING):
+                    log.info(f"🔧 Call already {call.state.value} - skipping termination")
+                    return
 
-            if self.current_session:
                 try:
                     if os.getenv("ENABLE_TTS", "1") != "0":
-                        await asyncio.wait_for(
-                            self.current_session.generate_reply(
-                                instructions="Say: Thank you for choosing bansari Restaurant! Goodbye!"
-                            ),
-                            timeout=4.0
+                        goodbye = call.session.generate_reply(
+                            instructions="Say: Thank you for choosing bansari Restaurant! Goodbye!"
                         )
-                    await asyncio.sleep(6.0)
+                        await asyncio.wait_for(goodbye.wait_for_playout(), timeout=HANGUP_PLAYOUT_TIMEOUT)
                 except Exception as e:
                     log.warning(f"⚠️ Could not send final goodbye: {e}")
 
-                # 1️⃣ Disconnect all participants
-                try:
-                    if hasattr(self.current_session, "room") and self.current_session.room:
-                        for pid, p in self.current_session.room.remote_participants.items():
-                            try:
-                                await p.disconnect()
-                            except Exception:
-                                pass
-                except Exception:
-                    pass
-
-                # 2️⃣ Close room
-                try:
-                    if hasattr(self.current_session, "room") and self.current_session.room:
-                        await self.current_session.room.close()
-                except Exception:
-                    pass
-
-                # 3️⃣ Session termination variants
-                for method_name in ["disconnect", "stop", "end", "close", "terminate", "shutdown"]:
-                    if hasattr(self.current_session, method_name):
-                        try:
-                            await getattr(self.current_session, method_name)()
-                            break
-                        except Exception:
-                            continue
-
-                # 4️⃣ Close _room
-                try:
-                    if hasattr(self.current_session, "_room") and self.current_session._room:
-                        await self.current_session._room.close()
-                except Exception:
-                    pass
-
-                # 5️⃣ Stop agent
-                try:
-                    if hasattr(self.current_session, "agent") and self.current_session.agent:
-                        if hasattr(self.current_session.agent, "stop"):
-                            await self.current_session.agent.stop()
-                except Exception:
-                    pass
-
-                # 6️⃣ Force disconnect SIP participants
-                try:
-                    if job_context and hasattr(job_context, "room") and job_context.room:
-                        for pid, participant in job_context.room.remote_participants.items():
-                            if pid.startswith("sip_"):
-                                for m in ["disconnect", "remove", "kick"]:
-                                    if hasattr(participant, m):
-                                        try:
-                                            await getattr(participant, m)()
-                                        except Exception:
-                                            pass
-                except Exception:
-                    pass
-
-                # 7️⃣ room.disconnect_participant
-                try:
-                    if job_context and hasattr(job_context, "room") and job_context.room:
-                        for pid in job_context.room.remote_participants.keys():
-                            if hasattr(job_context.room, "disconnect_participant"):
-                                await job_context.room.disconnect_participant(pid)
-                except Exception:
-                    pass
-
-                # 8️⃣ room.remove_participant
-                try:
-                    if job_context and hasattr(job_context, "room") and job_context.room:
-                        for pid in job_context.room.remote_participants.keys():
-                            if hasattr(job_context.room, "remove_participant"):
-                                await job_context.room.remove_participant(pid)
-                except Exception:
-                    pass
-
-                # 9️⃣ Close connection
-                try:
-                    if job_context and hasattr(job_context, "room") and job_context.room:
-                        room = job_context.room
-                        if hasattr(room, "connection"):
-                            conn = room.connection
-                            if hasattr(conn, "close"):
-                                await conn.close()
-                        elif hasattr(room, "_connection"):
-                            conn = room._connection
-                            if hasattr(conn, "close"):
-                                await conn.close()
-                except Exception:
-                    pass
-
-                # 🔟 Terminate Twilio call via API
-                try:
-                    if job_context and hasattr(job_context, "room") and job_context.room:
-                        room = job_context.room
-                        for pid, participant in room.remote_participants.items():
-                            if pid.startswith("sip_"):
-                                if hasattr(participant, "attributes") and participant.attributes:
-                                    call_sid = participant.attributes.get("sip.twilio.callSid")
-                                    if call_sid:
-                                        log.info(f"🔧 Terminating Twilio call SID: {call_sid}")
-                                        await self._terminate_twilio_call(call_sid)
-                except Exception as e:
-                    log.warning(f"⚠️ Twilio termination failed: {e}")
+                # Short post-roll so the last audio frames reach the caller
+                await asyncio.sleep(HANGUP_POST_ROLL)
+                hangup_delay = time.perf_counter() - started
+                latency_registry.observe(HANGUP_DELAY, hangup_delay, call_id=call.call_id)
+                log.info(f"🔧 Goodbye played out after {hangup_delay:.1f}s - hanging up")
+
+                # Run every teardown strategy concurrently under one deadline
+                # (see teardown.py); stops once the SIP leg is confirmed gone
+                room = call.room
+                engine = TeardownEngine(
+                    self._teardown_strategies(call.job_context),
+                    sip_gone=lambda: self._sip_leg_gone(room),
+                    room=room,
+                    labels={"call_id": call.call_id},
+                )
+                report = await engine.run()
 
-                # 11️⃣ Disconnect job context
-                try:
-                    if hasattr(job_context, "disconnect"):
-                        await job_context.disconnect()
-                except Exception:
-                    pass
+                # Release the session and the job only after the hang-up phase,
+                # so closing the session cannot cut off audio still playing
+                await self._release_call(call.job_context, sip_gone=report.sip_gone)
 
-                # 12️⃣ Clear session reference
-                self.current_session = None
+                call.try_transition(CallState.ENDED)
+                call.session = None
                 log.info("✅ Call termination sequence completed successfully.")
         except Exception as e:
             log.error(f"⚠️ Error in _terminate_call_after_delay: {e}")
 
-    async def _terminate_twilio_call(self, call_sid: str):
-        """Terminate Twilio call using Twilio REST API"""
-        import aiohttp
-
-        account_sid = os.getenv("TWILIO_ACCOUNT_SID")
-        auth_token = os.getenv("TWILIO_AUTH_TOKEN")
+    @staticmethod
+    def _sip_participants(room) -> Dict[str, Any]:
+        """SIP participants currently in the room, by identity"""
+        if room is None:
+            return {}
+        return {pid: p for pid, p in room.remote_participants.items() if pid.startswith("sip_")}
+
+    def _sip_leg_gone(self, room) -> bool:
+        """True once the caller's SIP participant has left a still-connected room"""
+        if room is None or not room.isconnected():
+            return False
+        return not self._sip_participants(room)
+
+    def _teardown_strategies(self, job_context) -> List[TeardownStrategy]:
+        """
+        Build the teardown strategies for this call.
+
+        Each strategy raises StrategyUnavailable when the API it relies on does
+        not exist, so the teardown report shows which ones actually do work.
+        """
+        session = self.call.session
+        room = self.call.room
+        sip_participants = self._sip_participants(room)
+        # Snapshot call SIDs now - attributes are gone once the participant leaves
+        call_sids = [
+            p.attributes.get("sip.twilio.callSid")
+            for p in sip_participants.values()
+            if getattr(p, "attributes", None) and p.attributes.get("sip.twilio.callSid")
+        ]
+
+        async def disconnect_session_participants():
+            session_room = getattr(session, "room", None)
+            if not session_room:
+                raise StrategyUnavailable()
+            for p in list(session_room.remote_participants.values()):
+                if not hasattr(p, "disconnect"):
+                    raise StrategyUnavailable()
+                await p.disconnect()
+
+        async def close_session_room():
+            session_room = getattr(session, "room", None) or getattr(session, "_room", None)
+            if not session_room or not hasattr(session_room, "close"):
+                raise StrategyUnavailable()
+            await session_room.close()
+
+        async def stop_agent():
+            session_agent = getattr(session, "agent", None)
+            if not session_agent or not hasattr(session_agent, "stop"):
+                raise StrategyUnavailable()
+            await session_agent.stop()
+
+        async def disconnect_sip_participants():
+            attempted = False
+            for participant in sip_participants.values():
+                for m in ["disconnect", "remove", "kick"]:
+                    if hasattr(participant, m):
+                        attempted = True
+                        await getattr(participant, m)()
+                        break
+            if not attempted:
+                raise StrategyUnavailable()
+
+        async def room_disconnect_participant():
+            if room is None or not hasattr(room, "disconnect_participant"):
+                raise StrategyUnavailable()
+            for pid in list(sip_participants):
+                await room.disconnect_participant(pid)
+
+        async def room_remove_participant():
+            if room is None or not hasattr(room, "remove_participant"):
+                raise StrategyUnavailable()
+            for pid in list(sip_participants):
+                await room.remove_participant(pid)
+
+        async def api_remove_sip_participant():
+            if room is None or not sip_participants or not hasattr(job_context, "api"):
+                raise StrategyUnavailable()
+            from livekit import api
+            for pid in list(sip_participants):
+                await job_context.api.room.remove_participant(
+                    api.RoomParticipantIdentity(room=room.name, identity=pid)
+                )
 
-        if not account_sid or not auth_token:
-            log.warning("⚠️ Twilio credentials missing.")
+        async def close_room_connection():
+            conn = getattr(room, "connection", None) or getattr(room, "_connection", None)
+            if conn is None or not hasattr(conn, "close"):
+                raise StrategyUnavailable()
+            await conn.close()
+
+        async def twilio_hangup():
+            if not call_sids or not (os.getenv("TWILIO_ACCOUNT_SID") and os.getenv("TWILIO_AUTH_TOKEN")):
+                raise StrategyUnavailable()
+            results = await asyncio.gather(*(self._terminate_twilio_call(sid) for sid in call_sids))
+            if not all(results):
+                raise RuntimeError("Twilio did not confirm hangup")
+
+        return [
+            TeardownStrategy("twilio_hangup", twilio_hangup, confirms_hangup=True),
+            TeardownStrategy("api_remove_sip_participant", api_remove_sip_participant, confirms_hangup=True),
+            TeardownStrategy("disconnect_sip_participants", disconnect_sip_participants),
+            TeardownStrategy("room_disconnect_participant", room_disconnect_participant),
+            TeardownStrategy("room_remove_participant", room_remove_participant),
+            TeardownStrategy("disconnect_session_participants", disconnect_session_participants),
+            TeardownStrategy("close_session_room", close_session_room),
+            TeardownStrategy("stop_agent", stop_agent),
+            TeardownStrategy("close_room_connection", close_room_connection),
+        ]
+
+    async def _release_call(self, job_context, sip_gone: bool):
+        """
+        Close the session, then end the job.
+
+        Args:
+            job_context: The call's JobContext
+            sip_gone: Whether the hang-up strategies confirmed the SIP leg gone
+        """
+        session = self.call.session
+        if session is not None:
+            try:
+                await asyncio.wait_for(session.aclose(), timeout=TEARDOWN_DEADLINE)
+            except Exception as e:
+                log.warning(f"⚠️ Could not close the session: {e}")
+        if job_context is None:
             return
-
+        if not sip_gone:
+            # Deleting the room drops the caller even when no hang-up worked
+            try:
+                await asyncio.wait_for(job_context.delete_room(), timeout=TEARDOWN_DEADLINE)
+            except Exception as e:
+                log.warning(f"⚠️ Could not delete room: {e}")
+        job_context.shutdown(reason="call ended")
+
+    async def _terminate_twilio_call(self, call_sid: str) -> bool:
+        """Terminate Twilio call via the pooled REST client (True if Twilio confirmed)"""
         try:
-            url = f"https://api.twilio.com/2010-04-01/Accounts/{account_sid}/Calls/{call_sid}.json"
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    url,
-                    auth=aiohttp.BasicAuth(account_sid, auth_token),
-                    data={"Status": "completed"},
-                ) as resp:
-                    if resp.status == 200:
-                        log.info(f"✅ Twilio call {call_sid} terminated.")
-                    else:
-                        body = await resp.text()
-                        log.warning(f"⚠️ Twilio API failed: {resp.status} - {body}")
+            return await get_twilio_client().end_call(call_sid)
+        except ValueError:
+            log.warning("⚠️ Twilio credentials missing.")
+            return False
         except Exception as e:
             log.error(f"⚠️ Error terminating Twilio call: {e}")
+            return False
 
 
 # ------------------------------------------------------------
 # 🚀 ENTRYPOINT
 # ------------------------------------------------------------
 async def entrypoint(ctx: JobContext):
-    global current_job_context
-    current_job_context = ctx
-
     openai_api_key = os.getenv("OPENAI_API_KEY")
     if not openai_api_key:
         raise RuntimeError("Missing OPENAI_API_KEY in environment variables!")
@@ -420,8 +578,19 @@ async def entrypoint(ctx: JobContext):
         },
     )
 
+    # Per-turn latency histograms, exported as Prometheus text (see latency_metrics.py)
+    latency_tracker = TurnLatencyTracker(call_id=ctx.room.name)
+
+    # Everything specific to this call lives on its CallContext (see call_context.py)
+    db_driver = get_db_driver(ctx.proc)
+    install_process_exit_hook(ctx.proc.userdata)
+    track_call(ctx.proc.userdata)
+    call = CallContext(
+        call_id=ctx.room.name, job_context=ctx, db=db_driver, tasks=TaskSupervisor(latency_tracker.labels)
+    )
+
     # Create Agent with RealtimeModel (no separate STT/TTS/LLM needed)
-    agent = RestaurantAgent(job_context=ctx)
+    agent = RestaurantAgent(call)
     
     # Override agent's LLM with RealtimeModel
     agent._llm = realtime_model
@@ -431,77 +600,94 @@ async def entrypoint(ctx: JobContext):
         stt=None,  # RealtimeModel handles STT
         tts=None,  # RealtimeModel handles TTS
         llm=realtime_model,  # RealtimeModel handles LLM
+        userdata=call,
     )
+    call.session = session
     
+    # Open the API keep-alive connections while the greeting plays
+    call.tasks.spawn(warm_http_pools(), "warm_http_pools", timeout=GREETING_TASK_TIMEOUT)
+
+    # Drain any orders left in the local outbox (e.g. by a crashed worker)
+    start_outbox_replayer(db_driver.replay_outbox_order, db_driver.resume_clover_syncs)
+
     await ctx.connect()
 
-    # Extract caller phone number (non-blocking - done in parallel with session start)
-    async def extract_phone_number():
-        caller_phone = None
-        try:
-            # Try immediately first
-            room = ctx.room
-            if room:
-                for pid, participant in room.remote_participants.items():
-                    if pid.startswith("sip_"):
-                        phone = pid.replace("sip_", "")
-                        if phone.startswith("+"):
-                            caller_phone = phone
-                            break
-                    if hasattr(participant, "attributes") and participant.attributes:
-                        sip_phone = participant.attributes.get("sip.phoneNumber")
-                        if sip_phone:
-                            caller_phone = sip_phone
-                            break
-                    if hasattr(participant, "metadata") and participant.metadata:
-                        phone_metadata = participant.metadata.get("phoneNumber") or participant.metadata.get("from")
-                        if phone_metadata:
-                            caller_phone = phone_metadata
-                            break
-            
-            # If not found, wait briefly and try again (but don't block session start)
-            if not caller_phone:
-                await asyncio.sleep(0.3)
-                room = ctx.room
-                if room:
-                    for pid, participant in room.remote_participants.items():
-                        if pid.startswith("sip_"):
-                            phone = pid.replace("sip_", "")
-                            if phone.startswith("+"):
-                                caller_phone = phone
-                                break
-                        if hasattr(participant, "attributes") and participant.attributes:
-                            sip_phone = participant.attributes.get("sip.phoneNumber")
-                            if sip_phone:
-                                caller_phone = sip_phone
-                                break
-                        if hasattr(participant, "metadata") and participant.metadata:
-                            phone_metadata = participant.metadata.get("phoneNumber") or participant.metadata.get("from")
-                            if phone_metadata:
-                                caller_phone = phone_metadata
-                                break
-        except Exception:
-            pass
-        
-        if caller_phone:
-            agent.caller_phone = caller_phone
-        else:
-            agent.caller_phone = "extracted_failed"
+    # Resolve the caller phone number from room events (SIP attributes may arrive late)
+    caller_id = CallerIdResolver(ctx.room)
+    call.caller_id = caller_id
+
+    async def load_caller_context(phone):
+        # Profile comes from one Mongo read, made while the session starts
+        call.profile = await db_driver.get_customer_profile(phone)
+        if call.profile:
+            log.info(f"👤 Returning customer {phone}: {call.profile.get('order_count')} previous order(s)")
+        await agent.refresh_call_context()
+
+    def _on_caller_id(phone):
+        if phone:
+            call.caller_phone = phone
+            call.tasks.spawn(load_caller_context(phone), "load_caller_context", timeout=PROFILE_PREFETCH_TIMEOUT)
+
+    caller_id.add_done_callback(_on_caller_id)
+    caller_id.start()
+
+    async def close_caller_id():
+        caller_id.close()
+
+    ctx.add_shutdown_callback(close_caller_id)
+
+    # Report how much of each response's input was served from the prompt cache
+    @session.on("metrics_collected")
+    def _on_metrics_collected(ev):
+        if isinstance(ev.metrics, RealtimeModelMetrics):
+            agent.prompt_cache_stats.record(ev.metrics)
+            latency_tracker.on_metrics(ev.metrics)
+
+    async def log_prompt_cache_stats():
+        stats = agent.prompt_cache_stats
+        log.info(
+            f"📊 Prompt cache: {stats.cached_tokens}/{stats.input_tokens} input tokens cached "
+            f"({stats.cached_ratio:.0%}) over {stats.responses} responses"
+        )
+
+    ctx.add_shutdown_callback(log_prompt_cache_stats)
+
+    latency_tracker.attach(session)
+    call.tasks.spawn(export_latency_metrics_periodically(), "export_latency_metrics", daemon=True)
+    # Event-loop lag histogram + stack dumps of whatever blocks the loop (see loop_monitor.py)
+    loop_monitor = start_loop_monitor(latency_tracker.labels)
+
+    async def flush_latency_metrics():
+        if loop_monitor is not None:
+            await loop_monitor.stop()
+            log.info(f"🐢 Event loop: {loop_monitor.summary()}")
+        latency_tracker.log_summary()
+        log.info(f"📞 Call summary: {call.summary()}")
+        log.info(f"🧵 Background tasks: {call.tasks.summary()}")
+        latency_registry.write_textfile()
+        # The final export above has the call's series; don't carry them
+        # into later exports from this process
+        latency_tracker.close()
+
+    # One ordered drain of this call's work; the last call out also closes
+    # the shared outbox replayer, Clover sync queue and HTTP pools (see drain.py)
+    async def drain():
+        await drain_call(call, flush_latency_metrics)
+        await release_call(ctx.proc.userdata, db_driver)
+
+    ctx.add_shutdown_callback(drain)
 
     # Start session immediately without blocking
     await session.start(
         room=ctx.room,
         agent=agent,
         room_input_options=RoomInputOptions(
-            noise_cancellation=noise_cancellation.BVC(),
+            noise_cancellation=ctx.proc.userdata.get("noise_cancellation") or noise_cancellation.BVC(),
         ),
     )
 
-    # Extract phone number in parallel (non-blocking)
-    asyncio.create_task(extract_phone_number())
-    
     # Start greeting immediately
-    asyncio.create_task(agent.on_start(session))
+    call.tasks.spawn(agent.on_start(session), "greeting", timeout=GREETING_TASK_TIMEOUT)
 
 
 # ------------------------------------------------------------
@@ -511,6 +697,13 @@ if __name__ == "__main__":
     agents.cli.run_app(
         WorkerOptions(
             entrypoint_fnc=entrypoint,
+            prewarm_fnc=prewarm,
+            # Stop taking calls at WORKER_MAX_CALLS or high CPU (see worker_load.py)
+            load_fnc=worker_load,
+            load_threshold=WORKER_LOAD_THRESHOLD,
+            # On SIGTERM stop taking calls, let running ones finish, then drain each job (see drain.py)
+            drain_timeout=WORKER_DRAIN_TIMEOUT,
+            shutdown_process_timeout=JOB_SHUTDOWN_TIMEOUT,
             agent_name="inbound_agent",
         )
     )
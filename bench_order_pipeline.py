@@ -0,0 +1,381 @@
+"""
+Offline benchmark for the order pipeline.
+
+Drives the real create_order tool (create_order_tool_factory) through
+DatabaseDriver.create_order_with_clover, the outbox and the Clover sync queue
+into CloverClient - against a local fake Clover HTTP server and an in-memory
+stand-in for the Mongo orders collection. No network or database needed.
+
+For each concurrency level it reports:
+- orders/sec (end to end: saved in Mongo and synced to Clover)
+- p50/p95/p99 of confirmation (tool return), Mongo save and Clover sync latency
+- event-loop stall time (how long the loop was late waking a 5ms ticker)
+
+Usage:
+    python bench_order_pipeline.py
+    python bench_order_pipeline.py --levels 1 10 100 --orders 200 \\
+        --clover-latency-ms 80 --clover-jitter-ms 40 --clover-error-rate 0.05 \\
+        --mongo-latency-ms 15 --mongo-error-rate 0.01
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+from typing import Dict, Any, List, Optional
+
+# ---------- Offline environment (must be set before importing the pipeline) ----------
+# Removed when the run finishes (see __main__)
+_BENCH_DIR = tempfile.TemporaryDirectory(prefix="bench_orders_")
+os.environ["MONGO_URI"] = "mongodb://bench.invalid:27017"
+os.environ["CLOVER_MERCHANT_ID"] = "BENCHMERCHANT"
+os.environ["CLOVER_ACCESS_TOKEN"] = "bench-token"
+os.environ["OUTBOX_DIR"] = os.path.join(_BENCH_DIR.name, "outbox")
+os.environ["METRICS_DIR"] = ""
+os.environ.setdefault("CLOVER_SYNC_BASE_DELAY", "0.05")
+os.environ.setdefault("CLOVER_SYNC_MAX_DELAY", "0.5")
+
+from aiohttp import web
+from bson.objectid import ObjectId
+from pymongo.errors import PyMongoError
+
+import db
+import clover
+import agent
+from db import DatabaseDriver, get_db_executor_stats
+from call_context import CallContext
+from latency_metrics import Histogram
+
+log = logging.getLogger("order_bench")
+
+BENCH_ITEMS = [
+    {"name": "Chicken Biryani - Hot", "price": 18.00, "quantity": 2},
+    {"name": "Samosa", "price": 6.00, "quantity": 1},
+]
+
+
+# ---------- Fake backends ----------
+
+class FakeCloverServer:
+    """Local aiohttp server implementing the Clover order endpoints the client uses."""
+
+    def __init__(self, latency_ms: float = 50, jitter_ms: float = 0, error_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._next_id = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = None
+
+    async def _simulate(self) -> Optional[web.Response]:
+        self.requests += 1
+        delay = max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response({"message": "injected failure"}, status=500)
+        return None
+
+    def _new_id(self) -> str:
+        self._next_id += 1
+        return f"BENCH{self._next_id:08d}"
+
+    async def _create_order(self, request: web.Request) -> web.Response:
+        await request.read()
+        return await self._simulate() or web.json_response({"id": self._new_id()})
+
+    async def _ok(self, request: web.Request) -> web.Response:
+        await request.read()
+        return await self._simulate() or web.json_response({})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/v3/merchants/{mid}/atomic_order/orders", self._create_order)
+        app.router.add_post("/v3/merchants/{mid}/orders", self._create_order)
+        app.router.add_post("/v3/merchants/{mid}/orders/{oid}/bulk_line_items", self._ok)
+        app.router.add_delete("/v3/merchants/{mid}/orders/{oid}", self._ok)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+class InMemoryOrdersCollection:
+    """
+    Thread-safe stand-in for the pymongo orders collection.
+
+    Calls block for the injected latency (like a real pymongo round trip), so
+    they exercise the database executor exactly as production does.
+    """
+
+    def __init__(self, latency_ms: float = 10, error_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.docs: Dict[ObjectId, Dict[str, Any]] = {}
+        self.synced_at: Dict[ObjectId, float] = {}
+        self._lock = threading.Lock()
+
+    def _round_trip(self):
+        time.sleep(self.latency_ms / 1000)
+        if random.random() < self.error_rate:
+            raise PyMongoError("injected failure")
+
+    def create_index(self, *args, **kwargs):
+        return "bench_index"
+
+    def insert_one(self, doc: Dict[str, Any]):
+        self._round_trip()
+        with self._lock:
+            doc_id = ObjectId()
+            self.docs[doc_id] = dict(doc, _id=doc_id)
+        return type("InsertOneResult", (), {"inserted_id": doc_id})()
+
+    def insert_many(self, docs: List[Dict[str, Any]], ordered: bool = True):
+        # One round trip for the whole batch, like a real insert_many
+        self._round_trip()
+        with self._lock:
+            ids = []
+            for doc in docs:
+                doc_id = doc.setdefault("_id", ObjectId())
+                self.docs[doc_id] = dict(doc)
+                ids.append(doc_id)
+        return type("InsertManyResult", (), {"inserted_ids": ids})()
+
+    def update_one(self, query: Dict[str, Any], update: Dict[str, Any]):
+        self._round_trip()
+        with self._lock:
+            doc = self.docs.get(query.get("_id"))
+            if doc is not None:
+                for key, value in update.get("$set", {}).items():
+                    # Dotted keys set a field of a subdocument, as in Mongo
+                    target = doc
+                    *parents, field = key.split(".")
+                    for parent in parents:
+                        target = target.setdefault(parent, {})
+                    target[field] = value
+                if "clover_sync.status" in update.get("$set", {}):
+                    self.synced_at[doc["_id"]] = time.perf_counter()
+
+    def find_one(self, query: Dict[str, Any], *args, **kwargs):
+        self._round_trip()
+        with self._lock:
+            for doc in self.docs.values():
+                if all(doc.get(k) == v for k, v in query.items()):
+                    return dict(doc)
+        return None
+
+
+class LoopStallMonitor:
+    """Measures how late the event loop wakes a short periodic sleep."""
+
+    def __init__(self, interval: float = 0.005, threshold: float = 0.010):
+        self.interval = interval
+        self.threshold = threshold
+        self.total_stall = 0.0
+        self.max_stall = 0.0
+        self.stalls = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - started - self.interval
+            if lag > self.threshold:
+                self.stalls += 1
+                self.total_stall += lag
+            self.max_stall = max(self.max_stall, lag)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+class SaveProbe:
+    """Stands in for the agent's hangup: records when the order was saved."""
+
+    def __init__(self):
+        self.saved_at: Optional[float] = None
+        self.saved = asyncio.Event()
+
+    async def on_order_placed(self):
+        self.saved_at = time.perf_counter()
+        self.saved.set()
+
+
+# ---------- Benchmark ----------
+
+async def run_level(concurrency: int, orders: int, driver: DatabaseDriver, collection: InMemoryOrdersCollection, save_timeout: float) -> Dict[str, Any]:
+    """Place `orders` orders with at most `concurrency` in flight."""
+    confirm, save, sync = Histogram(), Histogram(), Histogram()
+    started_at: Dict[str, float] = {}
+    failed_saves = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    monitor = LoopStallMonitor()
+
+    async def place_order(n: int):
+        nonlocal failed_saves
+        async with semaphore:
+            name = f"bench-{concurrency}-{n}"
+            probe = SaveProbe()
+            call = CallContext(call_id=name, db=driver)
+            tool = agent.create_order_tool_factory(call, probe.on_order_placed)
+            items = [agent.OrderItem(**item) for item in BENCH_ITEMS]
+            started = started_at[name] = time.perf_counter()
+            await tool(items=items, phone=f"+1555{n:07d}", name=name)
+            confirm.observe(time.perf_counter() - started)
+            try:
+                await asyncio.wait_for(probe.saved.wait(), timeout=save_timeout)
+            except asyncio.TimeoutError:
+                failed_saves += 1
+                return
+            if "_id" in call.order:
+                save.observe(probe.saved_at - started)
+            else:
+                # Left in the outbox for the replayer
+                failed_saves += 1
+
+    monitor.start()
+    wall_started = time.perf_counter()
+    await asyncio.gather(*(place_order(n) for n in range(orders)))
+    drained = await driver.drain_clover_sync(timeout=save_timeout * 4)
+    wall = time.perf_counter() - wall_started
+    await monitor.stop()
+
+    synced = dead_lettered = 0
+    for doc_id, synced_time in collection.synced_at.items():
+        doc = collection.docs[doc_id]
+        name = doc.get("name", "")
+        if not name.startswith(f"bench-{concurrency}-"):
+            continue
+        if doc["clover_sync"]["status"] == "synced":
+            synced += 1
+            sync.observe(synced_time - started_at[name])
+        else:
+            dead_lettered += 1
+
+    return {
+        "concurrency": concurrency,
+        "orders": orders,
+        "wall": wall,
+        "orders_per_sec": synced / wall if wall else 0.0,
+        "confirm": confirm,
+        "save": save,
+        "sync": sync,
+        "failed_saves": failed_saves,
+        "synced": synced,
+        "dead_lettered": dead_lettered,
+        "drained": drained,
+        "stall_total": monitor.total_stall,
+        "stall_max": monitor.max_stall,
+        "stalls": monitor.stalls,
+    }
+
+
+def _ms(histogram: Histogram, q: float) -> str:
+    value = histogram.quantile(q)
+    return f"{value * 1000:8.1f}" if value is not None else "       -"
+
+
+def print_report(results: List[Dict[str, Any]], args: argparse.Namespace, driver: DatabaseDriver):
+    print("\n" + "=" * 78)
+    print("ORDER PIPELINE BENCHMARK")
+    print("=" * 78)
+    print(
+        f"Clover: {args.clover_latency_ms}ms ±{args.clover_jitter_ms}ms, error rate {args.clover_error_rate:.0%} | "
+        f"Mongo: {args.mongo_latency_ms}ms, error rate {args.mongo_error_rate:.0%} | "
+        f"DB workers: {db.DB_EXECUTOR_WORKERS}"
+    )
+    for r in results:
+        print("\n" + "-" * 78)
+        print(
+            f"concurrency={r['concurrency']:<4} orders={r['orders']:<5} wall={r['wall']:.2f}s  "
+            f"throughput={r['orders_per_sec']:.1f} orders/s"
+        )
+        print(f"  {'latency (ms)':<22}{'p50':>8}{'p95':>8}{'p99':>8}{'n':>7}")
+        for label, histogram in (("confirm (tool return)", r["confirm"]), ("saved to Mongo", r["save"]), ("synced to Clover", r["sync"])):
+            print(f"  {label:<22}{_ms(histogram, 0.5)}{_ms(histogram, 0.95)}{_ms(histogram, 0.99)}{histogram.count:>7}")
+        print(
+            f"  synced={r['synced']} dead_lettered={r['dead_lettered']} failed_saves={r['failed_saves']} "
+            f"drained={r['drained']}"
+        )
+        print(
+            f"  loop stall: total={r['stall_total'] * 1000:.1f}ms max={r['stall_max'] * 1000:.1f}ms "
+            f"stalls>10ms={r['stalls']}"
+        )
+    print("\nDB executor:", get_db_executor_stats())
+    if driver._group_commit is not None:
+        print("Group commit:", driver._group_commit.stats())
+
+
+async def main(args: argparse.Namespace) -> int:
+    random.seed(args.seed)
+    server = FakeCloverServer(args.clover_latency_ms, args.clover_jitter_ms, args.clover_error_rate)
+    await server.start()
+
+    collection = InMemoryOrdersCollection(args.mongo_latency_ms, args.mongo_error_rate)
+    db.CLOVER_ENABLED = True
+    clover._clover_client = clover.CloverClient(base_url=server.base_url)
+    driver = DatabaseDriver()
+    driver.group_commit = args.group_commit
+    driver.collection = collection
+    # Customer profile and rollup upserts are not part of this benchmark
+    driver.customers = None
+    driver.rollups = None
+
+    results = []
+    try:
+        for level in args.levels:
+            orders = max(args.orders, level)
+            results.append(await run_level(level, orders, driver, collection, args.save_timeout))
+    finally:
+        if driver._clover_sync is not None:
+            await driver._clover_sync.stop()
+        await clover.close_clover_client()
+        await server.stop()
+
+    print_report(results, args, driver)
+    print(f"Fake Clover: {server.requests} requests, {server.errors} injected errors")
+    # Lost saves are only expected when Mongo failures are being injected
+    if not args.mongo_error_rate and any(r["failed_saves"] for r in results):
+        return 1
+    return 0
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline order pipeline benchmark")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 10, 100], help="Concurrent orders per run")
+    parser.add_argument("--orders", type=int, default=100, help="Orders per concurrency level")
+    parser.add_argument("--clover-latency-ms", type=float, default=80)
+    parser.add_argument("--clover-jitter-ms", type=float, default=20)
+    parser.add_argument("--clover-error-rate", type=float, default=0.0)
+    parser.add_argument("--mongo-latency-ms", type=float, default=10)
+    parser.add_argument("--mongo-error-rate", type=float, default=0.0)
+    parser.add_argument("--save-timeout", type=float, default=30.0, help="Seconds to wait for each order to reach Mongo")
+    parser.add_argument("--group-commit", action="store_true", help="Batch order inserts (DB_GROUP_COMMIT=1)")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    agent.log.setLevel(logging.ERROR)
+    with _BENCH_DIR:
+        exit_code = asyncio.run(main(parse_args()))
+    sys.exit(exit_code)
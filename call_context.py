@@ -0,0 +1,128 @@
+# Per-Call Context
+#
+# Everything that belongs to one call - caller identity, order state, the
+# session and job handles, timings - lives on a CallContext owned by that
+# call's AgentSession (session.userdata) and is handed to the agent and its
+# tools explicitly. Nothing call-specific is kept in module globals, so one
+# process can host several concurrent calls safely.
+import time
+import logging
+from enum import Enum
+from typing import Dict, Any, Optional
+
+from task_supervisor import TaskSupervisor
+
+# Logger
+log = logging.getLogger("realtime_restaurant_agent")
+
+
+class CallState(str, Enum):
+    """Lifecycle of a call."""
+    ACTIVE = "active"                # Conversation in progress, no order yet
+    SAVING_ORDER = "saving_order"    # create_order accepted, save in flight
+    ORDER_PLACED = "order_placed"    # Order stored, goodbye pending
+    TERMINATING = "terminating"      # Goodbye / hangup in progress
+    ENDED = "ended"                  # Call is over
+
+
+# Allowed transitions (anything else is a bug)
+_TRANSITIONS = {
+    CallState.ACTIVE: {CallState.SAVING_ORDER, CallState.TERMINATING, CallState.ENDED},
+    CallState.SAVING_ORDER: {CallState.ORDER_PLACED, CallState.ACTIVE, CallState.TERMINATING, CallState.ENDED},
+    CallState.ORDER_PLACED: {CallState.TERMINATING, CallState.ENDED},
+    CallState.TERMINATING: {CallState.ENDED},
+    CallState.ENDED: set(),
+}
+
+
+class InvalidCallTransition(Exception):
+    """Raised when a call is moved to a state it cannot reach from its current one."""
+
+
+class CallContext:
+    """State for one call (one AgentSession)."""
+
+    def __init__(self, call_id: str, job_context=None, db=None, tasks: TaskSupervisor = None):
+        """
+        Initialize the call context.
+
+        Args:
+            call_id: Room name (used in logs and metric labels)
+            job_context: LiveKit JobContext for this call (None in tests/benchmarks)
+            db: DatabaseDriver orders are saved through
+            tasks: Supervisor for the call's background tasks (one is created if omitted)
+        """
+        self.call_id = call_id
+        self.job_context = job_context
+        self.db = db
+        self.tasks = tasks or TaskSupervisor({"call_id": call_id})
+        self.session = None
+        self.caller_phone: Optional[str] = None
+        self.caller_id = None
+        # Returning caller's customer profile (None for new callers / until prefetched)
+        self.profile: Optional[Dict[str, Any]] = None
+        self.order: Optional[Dict[str, Any]] = None
+        self.state = CallState.ACTIVE
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        # Seconds since call start at which each state was entered
+        self.state_times: Dict[str, float] = {CallState.ACTIVE.value: 0.0}
+
+    # ---------- State machine ----------
+
+    def can_transition(self, new_state: CallState) -> bool:
+        return new_state in _TRANSITIONS[self.state]
+
+    def transition(self, new_state: CallState):
+        """
+        Move the call to a new state.
+
+        Raises:
+            InvalidCallTransition: If new_state is not reachable from the current state
+        """
+        if not self.can_transition(new_state):
+            raise InvalidCallTransition(f"Call {self.call_id}: {self.state.value} -> {new_state.value}")
+        log.info(f"📞 Call {self.call_id}: {self.state.value} -> {new_state.value}")
+        self.state = new_state
+        self.state_times.setdefault(new_state.value, self.elapsed)
+
+    def try_transition(self, new_state: CallState) -> bool:
+        """Transition if allowed; returns False (without raising) otherwise."""
+        if not self.can_transition(new_state):
+            return False
+        self.transition(new_state)
+        return True
+
+    # ---------- Convenience views ----------
+
+    @property
+    def accepting_orders(self) -> bool:
+        return self.state == CallState.ACTIVE
+
+    @property
+    def order_placed(self) -> bool:
+        return self.order is not None
+
+    @property
+    def terminating(self) -> bool:
+        return self.state in (CallState.TERMINATING, CallState.ENDED)
+
+    @property
+    def room(self):
+        return getattr(self.job_context, "room", None) if self.job_context else None
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the call started."""
+        return time.perf_counter() - self._started
+
+    def summary(self) -> Dict[str, Any]:
+        """Snapshot for logs."""
+        return {
+            "call_id": self.call_id,
+            "state": self.state.value,
+            "caller_phone": self.caller_phone,
+            "order_id": self.order.get("_id") if self.order else None,
+            "duration_s": round(self.elapsed, 1),
+            "state_times": {state: round(t, 2) for state, t in self.state_times.items()},
+        }
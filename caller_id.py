@@ -0,0 +1,170 @@
+# Caller ID Extraction
+#
+# Resolves the caller's phone number from room events instead of polling.
+# SIP participants can join, or have their sip.* attributes filled in, after
+# the session starts; the resolver watches participant_connected and the
+# attribute/metadata change events until a number shows up or the deadline
+# passes, and exposes an awaitable for code (e.g. create_order) that needs it.
+import os
+import json
+import asyncio
+import logging
+from typing import Optional, Callable, List
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Logger
+log = logging.getLogger("realtime_restaurant_agent")
+
+# ---------- Caller ID settings ----------
+# Give up waiting for SIP attributes after this many seconds
+CALLER_ID_DEADLINE = float(os.getenv("CALLER_ID_DEADLINE", "10"))
+# How long create_order may wait for a still-pending caller ID
+CALLER_ID_ORDER_WAIT = float(os.getenv("CALLER_ID_ORDER_WAIT", "1.5"))
+
+_PHONE_EVENTS = ("participant_connected", "participant_attributes_changed", "participant_metadata_changed")
+
+
+def phone_from_participant(participant) -> Optional[str]:
+    """
+    Extract a caller phone number from a participant, if it carries one.
+
+    Checks, in order: a "sip_+<number>" identity, the sip.phoneNumber
+    attribute, and phoneNumber/from in JSON metadata.
+    """
+    identity = getattr(participant, "identity", "") or ""
+    if identity.startswith("sip_"):
+        phone = identity[len("sip_"):]
+        if phone.startswith("+"):
+            return phone
+
+    attributes = getattr(participant, "attributes", None)
+    if attributes:
+        sip_phone = attributes.get("sip.phoneNumber")
+        if sip_phone:
+            return sip_phone
+
+    metadata = getattr(participant, "metadata", None)
+    if metadata:
+        if isinstance(metadata, str):
+            try:
+                metadata = json.loads(metadata)
+            except ValueError:
+                return None
+        if isinstance(metadata, dict):
+            return metadata.get("phoneNumber") or metadata.get("from")
+    return None
+
+
+class CallerIdResolver:
+    """Resolves the caller's phone number once, from current state or later room events."""
+
+    def __init__(self, room, deadline: float = None):
+        """
+        Initialize the resolver.
+
+        Args:
+            room: rtc.Room to watch
+            deadline: Seconds to wait for a number before giving up (defaults to env var)
+        """
+        self.room = room
+        self.deadline = CALLER_ID_DEADLINE if deadline is None else deadline
+        self._future: Optional[asyncio.Future] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._callbacks: List[Callable[[Optional[str]], None]] = []
+
+    @property
+    def phone(self) -> Optional[str]:
+        """The resolved phone number (None while pending or if not found)."""
+        if self._future is None or not self._future.done():
+            return None
+        return self._future.result()
+
+    @property
+    def done(self) -> bool:
+        return self._future is not None and self._future.done()
+
+    def start(self):
+        """Check participants already in the room, then listen for changes."""
+        loop = asyncio.get_running_loop()
+        self._future = loop.create_future()
+        for participant in list(self.room.remote_participants.values()):
+            if self._try_participant(participant):
+                return
+        for event in _PHONE_EVENTS:
+            self.room.on(event, self._on_room_event)
+        self._timer = loop.call_later(self.deadline, self._resolve, None)
+
+    def add_done_callback(self, callback: Callable[[Optional[str]], None]):
+        """Call callback(phone_or_None) once resolution finishes."""
+        if self.done:
+            callback(self.phone)
+        else:
+            self._callbacks.append(callback)
+
+    async def wait(self, timeout: float = None) -> Optional[str]:
+        """
+        Wait for the caller's phone number.
+
+        Args:
+            timeout: Maximum seconds to wait (None waits until the deadline)
+
+        Returns:
+            The phone number, or None if it is not (yet) known
+        """
+        if self._future is None:
+            return None
+        try:
+            return await asyncio.wait_for(asyncio.shield(self._future), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def _on_room_event(self, *args):
+        # participant_connected(p), participant_attributes_changed(changed, p),
+        # participant_metadata_changed(p, old, new)
+        for arg in args:
+            if hasattr(arg, "identity"):
+                self._try_participant(arg)
+                return
+
+    def _try_participant(self, participant) -> bool:
+        try:
+            phone = phone_from_participant(participant)
+        except Exception as e:
+            log.debug(f"Caller ID extraction failed for {getattr(participant, 'identity', '?')}: {e}")
+            return False
+        if phone:
+            self._resolve(phone)
+            return True
+        return False
+
+    def _resolve(self, phone: Optional[str]):
+        if self._future is None or self._future.done():
+            return
+        self._future.set_result(phone)
+        self.close()
+        if phone:
+            log.info(f"📞 Caller ID resolved: {phone}")
+        else:
+            log.warning(f"⚠️ Caller ID not found within {self.deadline:.1f}s")
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(phone)
+            except Exception as e:
+                log.error(f"Caller ID callback error: {e}")
+
+    def close(self):
+        """Stop listening for room events (the result, if any, is kept)."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for event in _PHONE_EVENTS:
+            try:
+                self.room.off(event, self._on_room_event)
+            except Exception:
+                pass
+        if self._future is not None and not self._future.done():
+            self._future.set_result(None)
@@ -1,8 +1,9 @@
 # Clover POS Integration Module
 import os
+import asyncio
 import logging
 import aiohttp
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -11,6 +12,22 @@ load_dotenv()
 # Logger
 log = logging.getLogger("realtime_restaurant_agent")
 
+# ---------- Connection pool settings ----------
+# One pooled session per client keeps DNS, TCP and TLS warm between orders
+CLOVER_POOL_LIMIT = int(os.getenv("CLOVER_POOL_LIMIT", "20"))
+CLOVER_POOL_LIMIT_PER_HOST = int(os.getenv("CLOVER_POOL_LIMIT_PER_HOST", "10"))
+CLOVER_DNS_CACHE_TTL = int(os.getenv("CLOVER_DNS_CACHE_TTL", "300"))
+CLOVER_KEEPALIVE_TIMEOUT = float(os.getenv("CLOVER_KEEPALIVE_TIMEOUT", "60"))
+CLOVER_REQUEST_TIMEOUT = float(os.getenv("CLOVER_REQUEST_TIMEOUT", "10"))
+
+# ---------- Atomic order settings ----------
+# Create order + line items in one request; falls back to the two-step flow
+# automatically if the merchant/environment does not support the atomic API
+CLOVER_ATOMIC_ORDERS = os.getenv("CLOVER_ATOMIC_ORDERS", "1") != "0"
+
+# HTTP statuses that mean "this endpoint is not available here"
+_ATOMIC_UNSUPPORTED_STATUSES = {404, 405, 501}
+
 
 class CloverClient:
     """
@@ -23,7 +40,8 @@ class CloverClient:
         self,
         merchant_id: str = None,
         access_token: str = None,
-        base_url: str = None
+        base_url: str = None,
+        use_atomic_orders: bool = None
     ):
         """
         Initialize Clover API client.
@@ -32,6 +50,7 @@ class CloverClient:
             merchant_id: Clover merchant ID (defaults to env var)
             access_token: Clover API access token (defaults to env var)
             base_url: Clover API base URL (defaults to env var or sandbox)
+            use_atomic_orders: Use the atomic order API (defaults to env var)
         """
         self.merchant_id = merchant_id or os.getenv("CLOVER_MERCHANT_ID")
         self.access_token = access_token or os.getenv("CLOVER_ACCESS_TOKEN")
@@ -47,8 +66,48 @@ class CloverClient:
             log.error("🔍 DEBUG: CLOVER_ACCESS_TOKEN not found in environment")
             raise ValueError("CLOVER_ACCESS_TOKEN environment variable not set")
         
+        self.use_atomic_orders = CLOVER_ATOMIC_ORDERS if use_atomic_orders is None else use_atomic_orders
+        
+        # Shared HTTP session (created lazily on first request)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+        
         log.info(f"🔍 DEBUG: Clover client initialized - merchant: {self.merchant_id}, base_url: {self.base_url}")
     
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+        Get the pooled HTTP session, creating it on first use.
+        
+        The session is bound to the running event loop, so a new one is
+        created if the previous session was closed or belongs to another loop.
+        
+        Returns:
+            Shared aiohttp.ClientSession with keep-alive and DNS caching
+        """
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=CLOVER_POOL_LIMIT,
+                limit_per_host=CLOVER_POOL_LIMIT_PER_HOST,
+                ttl_dns_cache=CLOVER_DNS_CACHE_TTL,
+                keepalive_timeout=CLOVER_KEEPALIVE_TIMEOUT,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self._get_headers(),
+                timeout=aiohttp.ClientTimeout(total=CLOVER_REQUEST_TIMEOUT),
+            )
+            self._session_loop = loop
+        return self._session
+    
+    async def close(self):
+        """Close the pooled HTTP session (call on worker shutdown)."""
+        session = self._session
+        self._session = None
+        self._session_loop = None
+        if session is not None and not session.closed:
+            await session.close()
+    
     def _get_headers(self) -> Dict[str, str]:
         """Get common headers for API requests."""
         return {
@@ -56,6 +115,32 @@ class CloverClient:
             "Content-Type": "application/json"
         }
     
+    @staticmethod
+    def _order_title(name: str = None) -> str:
+        """Build the order title shown in the POS."""
+        title = "Phone Order"
+        if name:
+            title += f" - {name}"
+        return title
+    
+    @staticmethod
+    def _to_clover_line_items(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Convert order items to Clover line items.
+        
+        Clover expects:
+        - Prices in CENTS (multiply by 100)
+        - Quantities in units of 1000 (multiply by 1000)
+        """
+        clover_items = []
+        for item in items:
+            clover_items.append({
+                "name": item["name"],
+                "price": int(round(item["price"] * 100)),  # Convert dollars to cents
+                "unitQty": int(item["quantity"] * 1000)  # Convert to Clover unit format
+            })
+        return clover_items
+    
     async def create_order(
         self,
         phone: str,
@@ -79,6 +164,18 @@ class CloverClient:
             # 🔍 DEBUG: Entry point
             log.info(f"🔍 DEBUG: Clover create_order - phone={phone}, items={items}")
             
+            # Preferred path: order + line items in a single atomic request
+            if self.use_atomic_orders:
+                order_id, supported = await self._create_atomic_order(phone, items, name)
+                if supported:
+                    if not order_id:
+                        log.error("Failed to create atomic order in Clover")
+                        return None
+                    log.info(f"✅ Clover order complete (atomic): {order_id}")
+                    return order_id
+                log.warning("Clover atomic order API unsupported - falling back to two-step order creation")
+                self.use_atomic_orders = False
+            
             # Step 1: Create the order
             log.info(f"🔍 DEBUG: Creating base order...")
             order_id = await self._create_order_base(phone, name)
@@ -93,6 +190,8 @@ class CloverClient:
             success = await self._add_line_items(order_id, items)
             if not success:
                 log.error(f"Failed to add items to Clover order {order_id}")
+                # Don't leave an empty open order behind in the POS
+                await self._delete_order(order_id)
                 return None
             
             log.info(f"🔍 DEBUG: Items added successfully")
@@ -109,6 +208,76 @@ class CloverClient:
             log.error(f"🔍 DEBUG: Clover traceback: {traceback.format_exc()}")
             return None
     
+    async def _create_atomic_order(
+        self,
+        phone: str,
+        items: List[Dict[str, Any]],
+        name: str = None
+    ) -> Tuple[Optional[str], bool]:
+        """
+        Create an order with its line items in one request (Clover atomic order API).
+        
+        Args:
+            phone: Customer phone number
+            items: List of items with name, price, quantity
+            name: Customer name
+        
+        Returns:
+            (order_id, supported) - order_id is None on failure; supported is
+            False if the atomic endpoint is not available for this merchant
+        """
+        url = f"{self.base_url}/v3/merchants/{self.merchant_id}/atomic_order/orders"
+        
+        payload = {
+            "orderCart": {
+                "title": self._order_title(name),
+                "note": f"Phone: {phone}",
+                "lineItems": self._to_clover_line_items(items)
+            }
+        }
+        
+        try:
+            session = self._get_session()
+            async with session.post(url, json=payload) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    return data.get("id"), True
+                error_text = await response.text()
+                if response.status in _ATOMIC_UNSUPPORTED_STATUSES:
+                    log.warning(f"Clover atomic order unavailable ({response.status}): {error_text}")
+                    return None, False
+                log.error(f"Clover atomic order error ({response.status}): {error_text}")
+                return None, True
+        except Exception as e:
+            log.error(f"Error creating Clover atomic order: {e}")
+            return None, True
+    
+    async def _delete_order(self, order_id: str) -> bool:
+        """
+        Delete an order (used to clean up a half-created two-step order).
+        
+        Args:
+            order_id: Clover order ID
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        url = f"{self.base_url}/v3/merchants/{self.merchant_id}/orders/{order_id}"
+        
+        try:
+            session = self._get_session()
+            async with session.delete(url) as response:
+                if response.status == 200:
+                    log.info(f"Deleted incomplete Clover order {order_id}")
+                    return True
+                else:
+                    error_text = await response.text()
+                    log.warning(f"Failed to delete Clover order {order_id} ({response.status}): {error_text}")
+                    return False
+        except Exception as e:
+            log.warning(f"Error deleting Clover order {order_id}: {e}")
+            return False
+    
     async def _create_order_base(
         self,
         phone: str,
@@ -126,35 +295,22 @@ class CloverClient:
         """
         url = f"{self.base_url}/v3/merchants/{self.merchant_id}/orders"
         
-        # Build order title
-        title = f"Phone Order"
-        if name:
-            title += f" - {name}"
-        
-        # Build order note with phone number
-        note = f"Phone: {phone}"
-        
         payload = {
             "state": "open",
-            "title": title,
-            "note": note
+            "title": self._order_title(name),
+            "note": f"Phone: {phone}"  # Order note with phone number
         }
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    url,
-                    headers=self._get_headers(),
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return data.get("id")
-                    else:
-                        error_text = await response.text()
-                        log.error(f"Clover API error ({response.status}): {error_text}")
-                        return None
+            session = self._get_session()
+            async with session.post(url, json=payload) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    return data.get("id")
+                else:
+                    error_text = await response.text()
+                    log.error(f"Clover API error ({response.status}): {error_text}")
+                    return None
         except Exception as e:
             log.error(f"Error creating Clover order: {e}")
             return None
@@ -176,34 +332,17 @@ class CloverClient:
         """
         url = f"{self.base_url}/v3/merchants/{self.merchant_id}/orders/{order_id}/bulk_line_items"
         
-        # Convert items to Clover format
-        # Clover expects:
-        # - Prices in CENTS (multiply by 100)
-        # - Quantities in units of 1000 (multiply by 1000)
-        clover_items = []
-        for item in items:
-            clover_items.append({
-                "name": item["name"],
-                "price": int(item["price"] * 100),  # Convert dollars to cents
-                "unitQty": int(item["quantity"] * 1000)  # Convert to Clover unit format
-            })
-        
-        payload = {"items": clover_items}
+        payload = {"items": self._to_clover_line_items(items)}
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    url,
-                    headers=self._get_headers(),
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as response:
-                    if response.status == 200:
-                        return True
-                    else:
-                        error_text = await response.text()
-                        log.error(f"Clover add items error ({response.status}): {error_text}")
-                        return False
+            session = self._get_session()
+            async with session.post(url, json=payload) as response:
+                if response.status == 200:
+                    return True
+                else:
+                    error_text = await response.text()
+                    log.error(f"Clover add items error ({response.status}): {error_text}")
+                    return False
         except Exception as e:
             log.error(f"Error adding items to Clover order: {e}")
             return False
@@ -221,19 +360,15 @@ class CloverClient:
         url = f"{self.base_url}/v3/merchants/{self.merchant_id}/orders/{order_id}/fire"
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    url,
-                    headers=self._get_headers(),
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as response:
-                    if response.status == 200:
-                        log.info(f"Order {order_id} fired to kitchen")
-                        return True
-                    else:
-                        error_text = await response.text()
-                        log.warning(f"Failed to fire order ({response.status}): {error_text}")
-                        return False
+            session = self._get_session()
+            async with session.post(url) as response:
+                if response.status == 200:
+                    log.info(f"Order {order_id} fired to kitchen")
+                    return True
+                else:
+                    error_text = await response.text()
+                    log.warning(f"Failed to fire order ({response.status}): {error_text}")
+                    return False
         except Exception as e:
             log.warning(f"Error firing order to kitchen: {e}")
             return False
@@ -248,18 +383,14 @@ class CloverClient:
         url = f"{self.base_url}/v3/merchants/{self.merchant_id}"
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    url,
-                    headers=self._get_headers(),
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as response:
-                    if response.status == 200:
-                        return await response.json()
-                    else:
-                        error_text = await response.text()
-                        log.error(f"Failed to get merchant info ({response.status}): {error_text}")
-                        return None
+            session = self._get_session()
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return await response.json()
+                else:
+                    error_text = await response.text()
+                    log.error(f"Failed to get merchant info ({response.status}): {error_text}")
+                    return None
         except Exception as e:
             log.error(f"Error getting merchant info: {e}")
             return None
@@ -281,3 +412,13 @@ def get_clover_client() -> CloverClient:
         _clover_client = CloverClient()
     return _clover_client
 
+
+
+async def close_clover_client():
+    """
+    Close the singleton Clover client's connection pool, if one was created.
+    
+    Safe to call when Clover was never used (e.g. missing credentials).
+    """
+    if _clover_client is not None:
+        await _clover_client.close()
@@ -0,0 +1,348 @@
+# Background Clover POS Sync Queue
+#
+# Order capture finishes as soon as MongoDB acks the insert. Syncing to the
+# POS happens here, on a bounded pool of workers with retries, so a slow or
+# failing Clover API never holds up a call or piles up per-order tasks.
+#
+# The queue itself lives in memory, so every order is saved with a
+# clover_sync record ({status: "pending", owner, claimed_at, sweeps}) that
+# the outbox replayer sweeps: an order still pending (or dead-lettered)
+# once its claim is older than CLOVER_SYNC_LEASE - its process died or gave
+# up - is claimed again and re-queued, at most CLOVER_SYNC_MAX_SWEEPS times.
+# A process that shuts down mid-sync releases its claim instead; released
+# syncs are picked up on the next sweep and do not count as a sweep.
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import List, Dict, Any, Optional, Callable, Awaitable, Set
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Logger
+log = logging.getLogger("realtime_restaurant_agent")
+
+# ---------- Sync queue settings ----------
+CLOVER_SYNC_CONCURRENCY = int(os.getenv("CLOVER_SYNC_CONCURRENCY", "4"))
+CLOVER_SYNC_QUEUE_SIZE = int(os.getenv("CLOVER_SYNC_QUEUE_SIZE", "500"))
+CLOVER_SYNC_MAX_ATTEMPTS = int(os.getenv("CLOVER_SYNC_MAX_ATTEMPTS", "6"))
+CLOVER_SYNC_BASE_DELAY = float(os.getenv("CLOVER_SYNC_BASE_DELAY", "1.0"))
+CLOVER_SYNC_MAX_DELAY = float(os.getenv("CLOVER_SYNC_MAX_DELAY", "60"))
+# Seconds a process owns an order's sync before another may take it over
+# (must cover a full round of attempts plus time spent queued)
+CLOVER_SYNC_LEASE = float(os.getenv("CLOVER_SYNC_LEASE", "600"))
+# Times the sweep re-drives one order before leaving it dead-lettered
+CLOVER_SYNC_MAX_SWEEPS = int(os.getenv("CLOVER_SYNC_MAX_SWEEPS", "3"))
+
+
+def pending_sync_record(now: float = None) -> Dict[str, Any]:
+    """clover_sync field for a newly saved order (claimed by this process)."""
+    return {"status": "pending", "owner": os.getpid(), "claimed_at": now or time.time(), "sweeps": 0}
+
+
+def sweep_query(now: float = None, released: bool = False) -> Dict[str, Any]:
+    """
+    Orders whose sync is unfinished and may be taken over.
+
+    Args:
+        now: Override for the current time
+        released: Match syncs handed back by a shutting-down process
+            (claimed_at 0) instead of claims whose lease has expired
+    """
+    if released:
+        return {"clover_sync.status": "pending", "clover_sync.claimed_at": 0}
+    now = now or time.time()
+    return {
+        "clover_sync.status": {"$in": ["pending", "dead_letter"]},
+        "clover_sync.claimed_at": {"$gt": 0, "$lt": now - CLOVER_SYNC_LEASE},
+        "clover_sync.sweeps": {"$lt": CLOVER_SYNC_MAX_SWEEPS},
+    }
+
+
+def sweep_claim(now: float = None, released: bool = False) -> Dict[str, Any]:
+    """
+    Update that claims a swept order for this process.
+
+    Only an expired lease counts towards CLOVER_SYNC_MAX_SWEEPS: a sync
+    released on shutdown never got its full round of attempts.
+    """
+    update: Dict[str, Any] = {
+        "$set": {
+            "clover_sync.status": "pending",
+            "clover_sync.owner": os.getpid(),
+            "clover_sync.claimed_at": now or time.time(),
+        },
+    }
+    if not released:
+        update["$inc"] = {"clover_sync.sweeps": 1}
+    return update
+
+
+class CloverSyncJob:
+    """A single order waiting to be pushed to Clover."""
+
+    def __init__(self, order_id: str, phone: str, items: List[Dict[str, Any]], name: str = None, address: str = None, clover_order_id: str = None):
+        self.order_id = order_id
+        self.phone = phone
+        self.items = items
+        self.name = name
+        self.address = address
+        # Set once Clover has the order, so a retry only repeats the Mongo update
+        self.clover_order_id = clover_order_id
+        self.attempts = 0
+        self.enqueued_at = time.time()
+        self.last_error: Optional[str] = None
+
+
+class CloverSyncQueue:
+    """
+    Bounded in-process queue that syncs saved orders to Clover POS.
+
+    Each job is retried with exponential backoff and full jitter. Results are
+    written back to the Mongo order document through ``update_order``:
+    ``clover_order_id`` on success, or a dead_letter ``clover_sync`` status
+    once all attempts are exhausted. The Clover order is created at most once
+    per job; later attempts only retry the write-back.
+    """
+
+    def __init__(
+        self,
+        create_clover_order: Callable[..., Awaitable[Optional[str]]],
+        update_order: Callable[[str, Dict[str, Any]], Awaitable[Any]],
+        concurrency: int = None,
+        max_size: int = None
+    ):
+        """
+        Initialize the sync queue.
+
+        Args:
+            create_clover_order: Async callable(phone, items, name, address) returning a Clover order ID or None
+            update_order: Async callable(order_id, fields) that $sets fields on the Mongo order
+            concurrency: Number of sync workers (defaults to env var)
+            max_size: Maximum queued jobs (defaults to env var)
+        """
+        self.create_clover_order = create_clover_order
+        self.update_order = update_order
+        self.concurrency = concurrency or CLOVER_SYNC_CONCURRENCY
+        self.max_size = max_size or CLOVER_SYNC_QUEUE_SIZE
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        # Jobs a worker is currently processing (not in the queue any more)
+        self._active: Set[CloverSyncJob] = set()
+        # Dead-letter writes for jobs rejected by a full queue
+        self._rejections: Set[asyncio.Task] = set()
+        # Set when an order's job finishes (synced, dead-lettered or released)
+        self._finished: Dict[str, asyncio.Event] = {}
+        self.synced = 0
+        self.retried = 0
+        self.dead_lettered = 0
+
+    def _ensure_started(self):
+        """Create the queue and worker tasks on the running event loop."""
+        if self._queue is None or not self._workers or all(w.done() for w in self._workers):
+            self._queue = asyncio.Queue(maxsize=self.max_size)
+            self._workers = [
+                asyncio.create_task(self._worker(i)) for i in range(self.concurrency)
+            ]
+
+    def enqueue(self, job: CloverSyncJob) -> bool:
+        """
+        Queue an order for Clover sync without waiting.
+
+        Returns:
+            True if queued, False if the queue is full (the order is dead-lettered)
+        """
+        self._ensure_started()
+        self._finished.setdefault(job.order_id, asyncio.Event())
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except asyncio.QueueFull:
+            log.error(f"⚠️ Clover sync queue full - dead-lettering order {job.order_id}")
+            job.last_error = "sync queue full"
+            # Keep a reference until the write finishes (see task_supervisor.py for why)
+            task = asyncio.get_running_loop().create_task(self._dead_letter(job))
+            self._rejections.add(task)
+            task.add_done_callback(self._rejections.discard)
+            task.add_done_callback(lambda _: self._finish(job))
+            return False
+
+    def _finish(self, job: CloverSyncJob):
+        event = self._finished.pop(job.order_id, None)
+        if event is not None:
+            event.set()
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given attempt number."""
+        return random.uniform(0, min(CLOVER_SYNC_MAX_DELAY, CLOVER_SYNC_BASE_DELAY * (2 ** attempt)))
+
+    async def _worker(self, worker_id: int):
+        """Process jobs until cancelled."""
+        while True:
+            job = await self._queue.get()
+            self._active.add(job)
+            try:
+                await self._process(job)
+            except Exception as e:
+                log.error(f"Clover sync worker {worker_id} error: {e}")
+            finally:
+                self._active.discard(job)
+                self._queue.task_done()
+                self._finish(job)
+
+    async def _process(self, job: CloverSyncJob):
+        """Sync one order, retrying with backoff until success or dead-letter."""
+        while job.attempts < CLOVER_SYNC_MAX_ATTEMPTS:
+            job.attempts += 1
+            try:
+                if job.clover_order_id is None:
+                    job.clover_order_id = await self.create_clover_order(
+                        phone=job.phone,
+                        items=job.items,
+                        name=job.name,
+                        address=job.address
+                    )
+                if job.clover_order_id:
+                    await self.update_order(job.order_id, {
+                        "clover_order_id": job.clover_order_id,
+                        "clover_sync.status": "synced",
+                        "clover_sync.attempts": job.attempts,
+                    })
+                    self.synced += 1
+                    log.info(f"✅ Order {job.order_id} synced to Clover POS: {job.clover_order_id}")
+                    return
+                job.clover_order_id = None
+                job.last_error = "Clover API returned no order ID"
+            except Exception as e:
+                job.last_error = str(e)
+
+            if job.attempts < CLOVER_SYNC_MAX_ATTEMPTS:
+                self.retried += 1
+                delay = self._backoff_delay(job.attempts - 1)
+                log.warning(f"⚠️ Clover sync attempt {job.attempts} failed for {job.order_id}: {job.last_error} - retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+        await self._dead_letter(job)
+
+    async def _dead_letter(self, job: CloverSyncJob):
+        """Record a permanent sync failure on the Mongo order document."""
+        self.dead_lettered += 1
+        log.error(f"⚠️ Clover sync gave up on order {job.order_id} after {job.attempts} attempt(s): {job.last_error}")
+        fields = {
+            "clover_sync.status": "dead_letter",
+            "clover_sync.attempts": job.attempts,
+            "clover_sync.last_error": job.last_error,
+            "clover_sync.failed_at": time.time(),
+        }
+        if job.clover_order_id:
+            fields["clover_order_id"] = job.clover_order_id
+        try:
+            await self.update_order(job.order_id, fields)
+        except Exception as e:
+            log.error(f"Could not record Clover dead letter for {job.order_id}: {e}")
+
+    async def _release(self, job: CloverSyncJob):
+        """Give an unfinished sync back so the next sweep (in any process) picks it up."""
+        fields = {"clover_sync.claimed_at": 0, "clover_sync.last_error": job.last_error or "worker shut down before sync"}
+        if job.clover_order_id:
+            fields["clover_order_id"] = job.clover_order_id
+        try:
+            await self.update_order(job.order_id, fields)
+        except Exception as e:
+            # Still pending: it is swept once the lease expires
+            log.error(f"Could not release Clover sync for {job.order_id}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Get queue depth and outcome counters."""
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "workers": self.concurrency,
+            "synced": self.synced,
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+        }
+
+    async def drain(self, timeout: float = None) -> bool:
+        """
+        Wait until every queued job has finished.
+
+        Args:
+            timeout: Maximum seconds to wait (None waits forever)
+
+        Returns:
+            True if the queue drained, False on timeout
+        """
+        if self._queue is None:
+            return True
+
+        async def _wait():
+            await self._queue.join()
+            await self._wait_rejections()
+
+        try:
+            await asyncio.wait_for(_wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def wait_for_orders(self, order_ids: List[str], timeout: float = None) -> bool:
+        """
+        Wait until the given orders' jobs have finished, ignoring everything else queued.
+
+        Args:
+            order_ids: Mongo order IDs (orders not queued here count as finished)
+            timeout: Maximum seconds to wait (None waits forever)
+
+        Returns:
+            True if they all finished, False on timeout
+        """
+        events = [self._finished[order_id] for order_id in order_ids if order_id in self._finished]
+        if not events:
+            return True
+        try:
+            await asyncio.wait_for(asyncio.gather(*(event.wait() for event in events)), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _wait_rejections(self):
+        if self._rejections:
+            await asyncio.gather(*list(self._rejections), return_exceptions=True)
+
+    async def shutdown(self, timeout: float = None) -> int:
+        """
+        Drain the queue, then hand back anything still unsynced and stop the workers.
+
+        Used when the process is going away: an order that could not be synced
+        in time keeps its pending clover_sync status with the claim released,
+        so the next outbox sweep in a live process re-queues it.
+
+        Args:
+            timeout: Maximum seconds to wait for the queue to drain
+
+        Returns:
+            Number of jobs handed back because of the shutdown
+        """
+        if await self.drain(timeout):
+            await self.stop()
+            return 0
+        abandoned = list(self._active)
+        while not self._queue.empty():
+            abandoned.append(self._queue.get_nowait())
+            self._queue.task_done()
+        await self.stop()
+        for job in abandoned:
+            await self._release(job)
+            self._finish(job)
+        return len(abandoned)
+
+    async def stop(self):
+        """Cancel all sync workers (queued jobs are abandoned; pending dead-letter writes finish)."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await self._wait_rejections()
@@ -0,0 +1,144 @@
+# Customer Profiles
+#
+# One document per caller in the "customers" collection, keyed by the
+# normalized E.164 phone number and upserted on every saved order:
+#
+#   {_id: "+15551234567", name, address, order_count, item_counts: {item: qty},
+#    last_order: {order_id, items, created_at}, first_order_at, updated_at}
+#
+# The profile is prefetched with one read as soon as the caller ID is known,
+# so "same as last time" is answered from the call's instructions with no
+# database round trip mid-conversation. It is not cached: each job process
+# serves a single call, so a per-process cache would never be hit twice.
+#
+# This module is storage-agnostic: db.DatabaseDriver does the Mongo calls.
+import os
+import re
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# ---------- Profile settings ----------
+# Country code assumed for numbers given without one (the restaurant's locale)
+DEFAULT_COUNTRY_CODE = os.getenv("DEFAULT_COUNTRY_CODE", "91")
+# Favorite items listed in the call instructions
+PROFILE_FAVORITES = int(os.getenv("PROFILE_FAVORITES", "3"))
+
+_NON_DIGITS = re.compile(r"\D")
+
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """
+    Normalize a phone number to E.164 ("+<country><number>").
+
+    National numbers get DEFAULT_COUNTRY_CODE, after dropping a trunk "0"
+    prefix ("09876543210" -> "+919876543210").
+
+    Returns None for anything that is not a phone number, e.g. the
+    "call_<timestamp>" placeholder used when the caller ID is unknown.
+    """
+    if not phone or phone.startswith("call_"):
+        return None
+    phone = phone.strip()
+    if phone.startswith("sip_"):
+        phone = phone[len("sip_"):]
+    digits = _NON_DIGITS.sub("", phone)
+    if phone.startswith("+"):
+        pass
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    else:
+        if digits.startswith("0"):
+            digits = digits[1:]
+        if len(digits) == 10:
+            digits = DEFAULT_COUNTRY_CODE + digits
+    # No country code starts with 0
+    if not 8 <= len(digits) <= 15 or digits.startswith("0"):
+        return None
+    return f"+{digits}"
+
+
+def mongo_field_key(name: str) -> str:
+    # Mongo field names cannot contain "." or start with "$"
+    return name.replace(".", "．").lstrip("$")
+
+
+def build_profile_update(order: Dict[str, Any], now: datetime = None) -> Dict[str, Any]:
+    """
+    Build the upsert for a saved order.
+
+    Args:
+        order: Order document as returned by DatabaseDriver.create_order
+        now: Override for the update time
+
+    Returns:
+        Mongo update document ($set / $inc / $setOnInsert)
+    """
+    now = now or datetime.now(timezone.utc)
+    items = [{"name": item.get("name"), "quantity": item.get("quantity", 1), "price": item.get("price")}
+             for item in order.get("items", [])]
+    update: Dict[str, Any] = {
+        "$set": {
+            "last_order": {
+                "order_id": str(order.get("_id")) if order.get("_id") else None,
+                "items": items,
+                "created_at": order.get("created_at"),
+            },
+            "updated_at": now,
+        },
+        "$inc": {"order_count": 1},
+        "$setOnInsert": {"first_order_at": now},
+    }
+    for field in ("name", "address"):
+        if order.get(field):
+            update["$set"][field] = order[field]
+    for item in items:
+        if item["name"]:
+            key = f"item_counts.{mongo_field_key(item['name'])}"
+            update["$inc"][key] = update["$inc"].get(key, 0) + (item["quantity"] or 1)
+    return update
+
+
+def profile_from_order(phone: str, order: Dict[str, Any]) -> Dict[str, Any]:
+    """Minimal profile for a caller who has orders from before profiles existed."""
+    return {
+        "_id": phone,
+        "name": order.get("name"),
+        "address": order.get("address"),
+        "order_count": 1,
+        "item_counts": {},
+        "last_order": {
+            "order_id": str(order.get("_id")) if order.get("_id") else None,
+            "items": order.get("items", []),
+            "created_at": order.get("created_at"),
+        },
+    }
+
+
+def favorite_items(profile: Dict[str, Any], limit: int = None) -> List[str]:
+    """Most-ordered item names, most frequent first."""
+    counts = profile.get("item_counts") or {}
+    ranked = sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))
+    return [name.replace("．", ".") for name, _ in ranked[:limit or PROFILE_FAVORITES]]
+
+
+def describe_profile(profile: Optional[Dict[str, Any]]) -> List[str]:
+    """Instruction lines describing a returning customer (empty for new callers)."""
+    if not profile:
+        return []
+    lines = []
+    count = profile.get("order_count") or 0
+    name = f" ({profile['name']})" if profile.get("name") else ""
+    lines.append(f"- Returning customer{name}: {count} previous order(s).")
+    last_items = (profile.get("last_order") or {}).get("items") or []
+    if last_items:
+        summary = ", ".join(f"{item.get('quantity', 1)}x {item.get('name')}" for item in last_items)
+        lines.append(f'- Their last order was: {summary}. Use it if they ask for "the same as last time" (confirm it first).')
+    favorites = favorite_items(profile)
+    if len(favorites) > 1:
+        lines.append(f"- Their favorites: {', '.join(favorites)}.")
+    return lines
+
@@ -6,14 +6,20 @@ from dotenv import load_dotenv
 
 # MongoDB client and error classes
 from pymongo import MongoClient
-from pymongo.errors import PyMongoError
+from pymongo.errors import PyMongoError, DuplicateKeyError, OperationFailure
 
 # Typing helper for optional return values
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable
 import logging
 
-# Import datetime for timestamps
-from datetime import datetime
+# Thread pool for running blocking pymongo calls off the event loop
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from group_commit import GroupCommitWriter, DB_GROUP_COMMIT
+from order_rollups import order_timestamps, build_rollup_update
+from customer_profiles import normalize_phone, build_profile_update, profile_from_order
 
 # Import Clover integration
 CLOVER_ENABLED = False
@@ -21,7 +27,9 @@ _clover_import_error = None
 
 try:
     from clover import get_clover_client
-    CLOVER_ENABLED = False
+    from clover_sync import CloverSyncQueue, CloverSyncJob, pending_sync_record, sweep_query, sweep_claim
+    # POS sync is opt-in: CLOVER_ENABLED=1 pushes every saved order to Clover
+    CLOVER_ENABLED = os.getenv("CLOVER_ENABLED", "0") == "1"
 except Exception as e:
     _clover_import_error = str(e)
     # Don't log here - will log later when actually used
@@ -56,39 +64,225 @@ try:
     # Access the 'orders' collection within the 'restaurant' database
     orders_collection = db["orders"]
 
+    # One profile per caller, keyed by E.164 phone (see customer_profiles.py)
+    customers_collection = db["customers"]
+
+    # Per-business-day order/revenue/item totals (see order_rollups.py)
+    rollups_collection = db["order_rollups"]
+
 except (PyMongoError, ValueError) as e:
     # Re-raise, but also log for visibility
     logging.getLogger("realtime_restaurant_agent").error(f"Mongo init failed: {e}")
     raise
 
+# ---------- Async Write Executor ----------
+
+# pymongo is synchronous, so every write runs on a small dedicated thread pool.
+# This keeps a slow primary or an election from stalling the LiveKit event loop.
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "4"))
+
+_db_executor: Optional[ThreadPoolExecutor] = None
+
+
+class DbExecutorMetrics:
+    """Counters and timings for database calls run on the executor."""
+
+    def __init__(self):
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.total_queue_wait = 0.0
+        self.max_queue_wait = 0.0
+        self.total_run_time = 0.0
+        self.max_run_time = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a point-in-time copy of the metrics."""
+        finished = self.completed + self.failed
+        return {
+            "workers": DB_EXECUTOR_WORKERS,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "avg_queue_wait_ms": (self.total_queue_wait / finished * 1000) if finished else 0.0,
+            "max_queue_wait_ms": self.max_queue_wait * 1000,
+            "avg_run_time_ms": (self.total_run_time / finished * 1000) if finished else 0.0,
+            "max_run_time_ms": self.max_run_time * 1000,
+        }
+
+
+db_executor_metrics = DbExecutorMetrics()
+
+
+def _get_db_executor() -> ThreadPoolExecutor:
+    """Get or create the shared database executor."""
+    global _db_executor
+    if _db_executor is None:
+        _db_executor = ThreadPoolExecutor(
+            max_workers=DB_EXECUTOR_WORKERS,
+            thread_name_prefix="mongo-io",
+        )
+    return _db_executor
+
+
+async def run_db_call(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking database call on the executor and await its result.
+
+    Args:
+        fn: Blocking callable (e.g. a pymongo collection method)
+        *args, **kwargs: Arguments passed to fn
+
+    Returns:
+        Whatever fn returns (exceptions are re-raised)
+    """
+    metrics = db_executor_metrics
+    metrics.submitted += 1
+    metrics.in_flight += 1
+    metrics.max_in_flight = max(metrics.max_in_flight, metrics.in_flight)
+
+    submitted_at = time.perf_counter()
+    timings = {}
+
+    def _timed_call():
+        timings["started_at"] = time.perf_counter()
+        return fn(*args, **kwargs)
+
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(_get_db_executor(), _timed_call)
+        metrics.completed += 1
+        return result
+    except Exception:
+        metrics.failed += 1
+        raise
+    finally:
+        finished_at = time.perf_counter()
+        started_at = timings.get("started_at", finished_at)
+        queue_wait = started_at - submitted_at
+        run_time = finished_at - started_at
+        metrics.in_flight -= 1
+        metrics.total_queue_wait += queue_wait
+        metrics.max_queue_wait = max(metrics.max_queue_wait, queue_wait)
+        metrics.total_run_time += run_time
+        metrics.max_run_time = max(metrics.max_run_time, run_time)
+
+
+def get_db_executor_stats() -> Dict[str, Any]:
+    """Get a snapshot of database executor metrics."""
+    return db_executor_metrics.snapshot()
+
+
+def shutdown_db_executor(wait: bool = True):
+    """Shut down the database executor (call on worker shutdown)."""
+    global _db_executor
+    if _db_executor is not None:
+        _db_executor.shutdown(wait=wait)
+        _db_executor = None
+
+
+def close_mongo_client():
+    """Close the MongoDB connection pool (at process exit - see drain.close_process_resources)."""
+    client.close()
+
+
 # ---------- Order Database Driver Class ----------
 
 class DatabaseDriver:
     def __init__(self):
         # Initialize the collection reference to use in other methods
         self.collection = orders_collection
+        self.customers = customers_collection
+        self.rollups = rollups_collection
         self.log = logging.getLogger("realtime_restaurant_agent")
         self._indexes_created = False
+        self._clover_sync = None
+        self.group_commit = DB_GROUP_COMMIT
+        self._group_commit = None
         
         # Don't create indexes here - do it lazily on first use to avoid blocking
     
     def _ensure_indexes(self):
-        """Create indexes lazily (only once, non-blocking)"""
-        if not self._indexes_created:
-            try:
-                # Create indexes in background (non-blocking)
-                self.collection.create_index("phone", background=True)
-                self.collection.create_index("created_at", background=True)
-                self._indexes_created = True
-            except Exception:
-                # Silently ignore - indexes are optional optimization
-                pass
+        """Create indexes lazily (attempted once per driver, non-blocking)"""
+        if self._indexes_created:
+            return
+        # One attempt per driver - a failing build must not retry on every insert
+        self._indexes_created = True
 
-    # Create a new order in the MongoDB collection
-    def create_order(self, phone: str, items: List[Dict[str, Any]], name: str = None, address: str = None, caller_phone: str = None) -> Optional[dict]:
-        # Ensure indexes exist (lazy, non-blocking)
-        self._ensure_indexes()
-        
+        # Required: without it a replayed outbox entry can be inserted twice
+        try:
+            self._ensure_outbox_index()
+        except Exception as e:
+            self.log.error(f"❌ Database: Unique outbox_id index could not be created - replayed orders may be duplicated: {e}")
+
+        try:
+            # Create indexes in background (non-blocking)
+            self.collection.create_index("phone", background=True)
+            self.collection.create_index("created_at", background=True)
+            self.collection.create_index([("business_day", 1), ("business_hour", 1)], background=True)
+            # Lets the profile lookup fall back to the latest order by phone
+            self.collection.create_index([("phone", 1), ("_id", -1)], background=True)
+            # Clover sync sweep
+            self.collection.create_index([("clover_sync.status", 1), ("clover_sync.claimed_at", 1)], background=True, sparse=True)
+        except Exception:
+            # Silently ignore - these indexes are an optional optimization
+            pass
+
+    def _ensure_outbox_index(self):
+        """Unique outbox_id index - a replayed outbox entry can never be inserted twice"""
+        try:
+            self.collection.create_index("outbox_id", background=True, sparse=True, unique=True)
+        except OperationFailure as e:
+            # 85/86: the older non-unique index of the same name is still there
+            if e.code not in (85, 86):
+                raise
+            self.collection.drop_index("outbox_id_1")
+            self.collection.create_index("outbox_id", background=True, sparse=True, unique=True)
+
+    def _get_clover_sync(self) -> "CloverSyncQueue":
+        """Get the background Clover sync queue (created on first use)"""
+        if self._clover_sync is None:
+            self._clover_sync = CloverSyncQueue(
+                create_clover_order=lambda **kwargs: get_clover_client().create_order(**kwargs),
+                update_order=self._update_order_fields
+            )
+        return self._clover_sync
+    
+    async def drain_clover_sync(self, timeout: float = None) -> bool:
+        """Wait for queued Clover syncs to finish (True if drained before timeout)"""
+        if self._clover_sync is None:
+            return True
+        return await self._clover_sync.drain(timeout)
+
+    async def wait_for_clover_sync(self, order_ids: List[str], timeout: float = None) -> bool:
+        """Wait for the given orders' Clover syncs only (True if they finished before timeout)"""
+        if self._clover_sync is None:
+            return True
+        return await self._clover_sync.wait_for_orders(order_ids, timeout)
+
+    async def shutdown_clover_sync(self, timeout: float = None) -> int:
+        """Drain the Clover sync queue and stop it; returns orders handed back for another worker"""
+        if self._clover_sync is None:
+            return 0
+        abandoned = await self._clover_sync.shutdown(timeout)
+        self._clover_sync = None
+        return abandoned
+    
+    async def _update_order_fields(self, order_id: str, fields: Dict[str, Any]):
+        """$set fields on an order document (runs on the database executor)"""
+        from bson.objectid import ObjectId
+        await run_db_call(
+            self.collection.update_one,
+            {"_id": ObjectId(order_id)},
+            {"$set": fields}
+        )
+    
+    # Build the order document for create_order / create_order_async
+    def _build_order(self, phone: str, items: List[Dict[str, Any]], name: str = None, address: str = None, caller_phone: str = None, outbox_id: str = None) -> dict:
         self.log.info(f"Database: Received phone parameter: {phone}")
         self.log.info(f"Database: Phone parameter type: {type(phone)}")
         self.log.info(f"Database: Phone parameter is None: {phone is None}")
@@ -106,7 +300,8 @@ class DatabaseDriver:
             "phone": phone,
             "items": items,
             "status": "confirmed",
-            "created_at": datetime.now().isoformat(),
+            # UTC BSON date + restaurant-local business_day / business_hour
+            **order_timestamps(),
             "order_type": "phone_only"  # Indicates this is a phone-only order
         }
         
@@ -123,6 +318,23 @@ class DatabaseDriver:
         else:
             order["phone_source"] = "provided_by_customer"
         
+        # Link back to the local outbox entry so replays are idempotent
+        if outbox_id:
+            order["outbox_id"] = outbox_id
+        
+        # Swept and re-queued if this process never finishes the sync
+        if CLOVER_ENABLED:
+            order["clover_sync"] = pending_sync_record()
+        
+        return order
+    
+    # Create a new order in the MongoDB collection
+    def create_order(self, phone: str, items: List[Dict[str, Any]], name: str = None, address: str = None, caller_phone: str = None, outbox_id: str = None) -> Optional[dict]:
+        # Ensure indexes exist (lazy, non-blocking)
+        self._ensure_indexes()
+        
+        order = self._build_order(phone, items, name, address, caller_phone, outbox_id)
+        
         try:
             self.log.info(f"Database: Inserting order with phone: {order.get('phone')}")
             self.log.info(f"Database: Full order document: {order}")
@@ -134,18 +346,81 @@ class DatabaseDriver:
             order["_id"] = str(result.inserted_id)
             
             return order
+        except DuplicateKeyError:
+            # Only outbox_id is unique besides _id: this entry is already stored
+            raise
         except PyMongoError as e:
             self.log.error(f"Database: Insert failed: {e}")
             return None
     
+    def _get_group_commit(self) -> GroupCommitWriter:
+        """Get the group-commit insert writer (created on first use)"""
+        if self._group_commit is None:
+            self._group_commit = GroupCommitWriter(
+                insert_many=lambda docs: run_db_call(self.collection.insert_many, docs, ordered=False)
+            )
+        return self._group_commit
+    
+    async def flush_group_commit(self):
+        """Write any batched inserts now and wait for them (no-op without group commit)"""
+        if self._group_commit is not None:
+            await self._group_commit.flush()
+    
+    # Create a new order without blocking the event loop
+    async def create_order_async(self, phone: str, items: List[Dict[str, Any]], name: str = None, address: str = None, caller_phone: str = None, outbox_id: str = None) -> Optional[dict]:
+        """
+        Async version of create_order - the insert runs on the database executor.
+        
+        With DB_GROUP_COMMIT=1 the insert joins a batch with other orders saved
+        at the same moment (see group_commit.py); the result is the same.
+        
+        Returns:
+            Order document if successful, None otherwise (the business-day
+            rollup is updated before returning)
+        
+        Raises:
+            DuplicateKeyError: If an order with this outbox_id is already stored
+        """
+        if not self.group_commit:
+            order = await run_db_call(self.create_order, phone, items, name, address, caller_phone, outbox_id)
+            if order:
+                await self.record_order_rollup(order)
+            return order
+        
+        if not self._indexes_created:
+            await run_db_call(self._ensure_indexes)
+        order = self._build_order(phone, items, name, address, caller_phone, outbox_id)
+        try:
+            inserted_id = await self._get_group_commit().insert(order)
+        except DuplicateKeyError:
+            raise
+        except PyMongoError as e:
+            self.log.error(f"Database: Insert failed: {e}")
+            return None
+        self.log.info(f"Database: Insert result: {inserted_id}")
+        order["_id"] = str(inserted_id)
+        await self.record_order_rollup(order)
+        return order
+    
+    async def record_order_rollup(self, order: Dict[str, Any]):
+        """Add a saved order to its business day's rollup (a failure never fails the order)"""
+        if self.rollups is None or "business_day" not in order:
+            return
+        try:
+            await run_db_call(
+                self.rollups.update_one, {"_id": order["business_day"]}, build_rollup_update(order), upsert=True
+            )
+        except Exception as e:
+            self.log.error(f"Order rollup update failed for {order['business_day']}: {e}")
+    
     # Create order and sync to Clover POS (async version)
-    async def create_order_with_clover(self, phone: str, items: List[Dict[str, Any]], name: str = None, address: str = None, caller_phone: str = None) -> Optional[dict]:
+    async def create_order_with_clover(self, phone: str, items: List[Dict[str, Any]], name: str = None, address: str = None, caller_phone: str = None, outbox_id: str = None) -> Optional[dict]:
         """
         Create order in MongoDB and sync to Clover POS.
         
         This is an async wrapper that:
         1. Saves order to MongoDB (your database)
-        2. Sends order to Clover POS (restaurant system)
+        2. Queues the order for background sync to Clover POS (restaurant system)
         
         Args:
             phone: Customer phone number
@@ -153,6 +428,7 @@ class DatabaseDriver:
             name: Customer name (optional)
             address: Delivery address (optional)
             caller_phone: Extracted caller phone (optional)
+            outbox_id: Local outbox entry ID (optional)
         
         Returns:
             Order document if successful, None otherwise
@@ -160,8 +436,22 @@ class DatabaseDriver:
         # 🔍 DEBUG: Entry point
         self.log.info(f"🔍 DEBUG: create_order_with_clover called - phone={phone}, items_count={len(items)}")
         
-        # Step 1: Save to MongoDB (always do this first)
-        order = self.create_order(phone, items, name, address, caller_phone)
+        # Step 1: Save to MongoDB (always do this first, off the event loop)
+        try:
+            order = await self.create_order_async(phone, items, name, address, caller_phone, outbox_id)
+        except DuplicateKeyError:
+            # The outbox replay (or the live save) got there first and owns the
+            # order's follow-up work. It is normally still running it, so it is
+            # not repeated here (the profile and rollup updates are $inc and
+            # would double count). If that writer died after its insert, the
+            # Clover sync is resumed by the sweep (clover_sync.py) and the
+            # rollups are rebuilt by `order_rollups.py --backfill`; the profile
+            # update is lost.
+            self.log.info(f"Order for outbox entry {outbox_id} already stored")
+            existing = await run_db_call(self.collection.find_one, {"outbox_id": outbox_id})
+            if existing:
+                existing["_id"] = str(existing["_id"])
+            return existing
         
         if not order:
             self.log.error("Failed to save order to MongoDB")
@@ -170,51 +460,155 @@ class DatabaseDriver:
         # 🔍 DEBUG: MongoDB save status
         self.log.info(f"🔍 DEBUG: MongoDB save OK, order_id={order.get('_id')}")
         
-        # Step 2: Sync to Clover POS (don't fail if this doesn't work)
-        # 🔍 DEBUG: Check if Clover is enabled
-        if CLOVER_ENABLED:
-            self.log.info(f"🔍 DEBUG: ✅ Clover integration ENABLED")
-        else:
-            self.log.warning(f"🔍 DEBUG: ⚠️ Clover integration DISABLED - {_clover_import_error or 'check .env file'}")
-        
+        # Step 2: Queue Clover POS sync in the background (retries + dead letter)
+        # Order capture is done once MongoDB has acked the insert
         if CLOVER_ENABLED:
             try:
-                self.log.info(f"🔍 DEBUG: Getting Clover client...")
-                clover_client = get_clover_client()
-                
-                self.log.info(f"🔍 DEBUG: Calling clover_client.create_order...")
-                clover_order_id = await clover_client.create_order(
+                queued = self._get_clover_sync().enqueue(CloverSyncJob(
+                    order_id=order["_id"],
                     phone=phone,
                     items=items,
                     name=name,
                     address=address
-                )
-                
-                self.log.info(f"🔍 DEBUG: Clover API returned: {clover_order_id}")
-                
-                if clover_order_id:
-                    self.log.info(f"✅ Order synced to Clover POS: {clover_order_id}")
-                    # Update MongoDB with Clover order ID
-                    try:
-                        from bson.objectid import ObjectId
-                        self.collection.update_one(
-                            {"_id": ObjectId(order["_id"])},
-                            {"$set": {"clover_order_id": clover_order_id}}
-                        )
-                        order["clover_order_id"] = clover_order_id
-                    except Exception as e:
-                        self.log.warning(f"Could not update Clover order ID in MongoDB: {e}")
-                else:
-                    self.log.warning("⚠️ Failed to sync order to Clover (order saved in MongoDB)")
+                ))
+                self.log.info(f"🔍 DEBUG: Clover sync queued={queued} for order {order['_id']}")
             except Exception as e:
                 self.log.error(f"⚠️ Clover sync error: {e} (order saved in MongoDB)")
-                import traceback
-                self.log.error(f"🔍 DEBUG: Traceback: {traceback.format_exc()}")
         else:
-            self.log.warning("🔍 DEBUG: Clover integration DISABLED - check .env file")
+            self.log.warning(f"🔍 DEBUG: ⚠️ Clover integration DISABLED - {_clover_import_error or 'set CLOVER_ENABLED=1 in .env'}")
+        
+        # Step 3: Update the caller's profile (a failure here never fails the order)
+        await self.record_customer_order(order)
         
         return order
 
+    def claim_clover_sync(self, released: bool = False) -> Optional[dict]:
+        """
+        Claim one order whose Clover sync was never finished (None when there is none).
+        
+        Args:
+            released: Claim a sync handed back on shutdown rather than an expired lease
+        """
+        from pymongo import ReturnDocument
+        return self.collection.find_one_and_update(
+            sweep_query(released=released),
+            sweep_claim(released=released),
+            projection={"phone": 1, "items": 1, "name": 1, "address": 1, "clover_order_id": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def resume_clover_syncs(self, limit: int = 50) -> int:
+        """
+        Re-queue orders whose Clover sync was left unfinished by a dead,
+        shut down or failed sync (called from the outbox replayer's loop).
+        
+        Args:
+            limit: Maximum orders claimed per call
+        
+        Returns:
+            Number of orders re-queued
+        """
+        if not CLOVER_ENABLED:
+            return 0
+        resumed = 0
+        # Syncs released by a shutdown first, then expired leases
+        released = True
+        while resumed < limit:
+            order = await run_db_call(self.claim_clover_sync, released)
+            if order is None:
+                if not released:
+                    break
+                released = False
+                continue
+            self._get_clover_sync().enqueue(CloverSyncJob(
+                order_id=str(order["_id"]),
+                phone=order.get("phone"),
+                items=order.get("items", []),
+                name=order.get("name"),
+                address=order.get("address"),
+                clover_order_id=order.get("clover_order_id"),
+            ))
+            resumed += 1
+        if resumed:
+            self.log.info(f"🔁 Re-queued {resumed} unfinished Clover sync(s)")
+        return resumed
+
+    # ---------- Customer profiles ----------
+
+    def upsert_customer_profile(self, phone: str, order: Dict[str, Any]) -> Optional[dict]:
+        """Apply an order to the caller's profile and return the updated profile"""
+        from pymongo import ReturnDocument
+        return self.customers.find_one_and_update(
+            {"_id": phone},
+            build_profile_update(order),
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def record_customer_order(self, order: Dict[str, Any]) -> Optional[dict]:
+        """
+        Upsert the profile for the order's phone.
+        
+        Returns:
+            The updated profile, or None if the phone is not a real number or the update failed
+        """
+        phone = normalize_phone(order.get("caller_phone") or order.get("phone"))
+        if phone is None or self.customers is None:
+            return None
+        try:
+            profile = await run_db_call(self.upsert_customer_profile, phone, order)
+        except Exception as e:
+            self.log.error(f"Customer profile update failed for {phone}: {e}")
+            return None
+        return profile
+
+    def load_customer_profile(self, phone: str) -> Optional[dict]:
+        """Profile for an E.164 phone, seeded from the latest order for callers without one"""
+        profile = self.customers.find_one({"_id": phone})
+        if profile is not None:
+            return profile
+        order = self.get_order_by_phone(phone)
+        return profile_from_order(phone, order) if order else None
+
+    async def get_customer_profile(self, phone: str) -> Optional[dict]:
+        """
+        Caller profile from MongoDB (one read, made at call start).
+        
+        Args:
+            phone: Caller phone in any format
+        
+        Returns:
+            Profile document, or None for new callers and non-phone IDs
+        """
+        phone = normalize_phone(phone)
+        if phone is None or self.customers is None:
+            return None
+        try:
+            return await run_db_call(self.load_customer_profile, phone)
+        except Exception as e:
+            self.log.warning(f"Customer profile lookup failed for {phone}: {e}")
+            return None
+
+    # Replay an order from the local outbox (idempotent on outbox_id)
+    async def replay_outbox_order(self, entry_id: str, order: Dict[str, Any]) -> bool:
+        """
+        Persist an outbox entry unless it already reached MongoDB.
+        
+        Args:
+            entry_id: Outbox entry ID
+            order: Keyword arguments originally passed to create_order_with_clover
+        
+        Returns:
+            True if the order is now stored in MongoDB
+        """
+        existing = await run_db_call(self.collection.find_one, {"outbox_id": entry_id}, {"_id": 1})
+        if existing:
+            return True
+        # A concurrent insert of the same entry hits the unique outbox_id index
+        # and returns the stored order instead of creating a second one
+        result = await self.create_order_with_clover(outbox_id=entry_id, **order)
+        return result is not None
+
     # Retrieve an order document by phone number
     def get_order_by_phone(self, phone: str) -> Optional[dict]:
         try:
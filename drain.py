@@ -0,0 +1,195 @@
+# Graceful Drain
+#
+# What happens when a call's job process shuts down, e.g. during a rolling
+# deploy. The worker stops taking new calls and lets running ones finish
+# (WorkerOptions drain_timeout). Each call then runs drain_call() as its one
+# ordered shutdown step, which only touches that call's own work:
+#
+#   1. close the call to new orders (CallContext -> ENDED)
+#   2. write any group-commit batch now (see group_commit.py), then wait for
+#      in-flight background work - order saves, the hangup - up to
+#      DRAIN_TASK_GRACE, then cancel it
+#   3. wait for the Clover sync of the call's order up to DRAIN_SYNC_TIMEOUT
+#   4. flush metrics
+#
+# Resources shared by every call in the process are closed separately and
+# only once (both steps are idempotent):
+#
+#   - release_call(): when the last call on the event loop has drained, stop
+#     the outbox replayer, flush the group-commit writer, hand unsynced Clover orders back for the next
+#     worker's sweep, compact the outbox journal (unacknowledged orders stay
+#     in it for replay) and close the Clover / Twilio HTTP pools - all of
+#     them are bound to this loop and are recreated lazily by a later call
+#   - close_process_resources(): at interpreter exit (atexit, installed from
+#     prewarm), shut down the DB executor and close the Mongo client
+#
+# The steps used to be independent shutdown callbacks, which LiveKit runs
+# concurrently, so the HTTP pools could close under a sync still in flight.
+import os
+import time
+import atexit
+import logging
+from typing import Callable, Awaitable, Dict, Any, Optional
+from dotenv import load_dotenv
+
+from latency_metrics import latency_registry
+
+# Load environment variables
+load_dotenv()
+
+# Logger
+log = logging.getLogger("realtime_restaurant_agent")
+
+# ---------- Drain settings ----------
+# Seconds in-flight order saves / hangups get to finish
+DRAIN_TASK_GRACE = float(os.getenv("DRAIN_TASK_GRACE", "5"))
+# Seconds the call's own Clover sync gets to finish
+DRAIN_SYNC_TIMEOUT = float(os.getenv("DRAIN_SYNC_TIMEOUT", "10"))
+# Seconds a draining worker waits for running calls before shutting down
+WORKER_DRAIN_TIMEOUT = int(os.getenv("WORKER_DRAIN_TIMEOUT", "1800"))
+# Seconds LiveKit gives a job process to shut down (must cover the drain)
+JOB_SHUTDOWN_TIMEOUT = DRAIN_TASK_GRACE + DRAIN_SYNC_TIMEOUT + 10
+
+DRAIN_PHASE_SECONDS = "agent_drain_phase_seconds"
+latency_registry.describe(DRAIN_PHASE_SECONDS, "Job shutdown drain time per phase")
+
+
+async def _phase(name: str, fn: Callable[[], Awaitable], timings: Dict[str, Optional[float]]):
+    """Run one drain phase; a failing phase is logged and does not stop the rest."""
+    started = time.perf_counter()
+    try:
+        result = await fn()
+    except Exception as e:
+        timings[name] = None
+        log.error(f"⚠️ Drain phase {name} failed: {e}")
+        return None
+    timings[name] = time.perf_counter() - started
+    latency_registry.observe(DRAIN_PHASE_SECONDS, timings[name], phase=name)
+    return result
+
+
+def _log_timings(label: str, started: float, timings: Dict[str, Optional[float]]):
+    total = time.perf_counter() - started
+    phases = ", ".join(
+        f"{name}={elapsed * 1000:.0f}ms" if elapsed is not None else f"{name}=failed"
+        for name, elapsed in timings.items()
+    )
+    log.info(f"🚰 {label} in {total:.2f}s: {phases}")
+
+
+async def drain_call(call, flush_metrics: Callable[[], Awaitable[None]]) -> Dict[str, Optional[float]]:
+    """
+    Drain one call's in-flight work before its job ends.
+
+    Process-shared resources are left alone (see release_call and
+    close_process_resources), and only this call's own Clover sync is
+    waited for - syncs queued for other orders are handed back by
+    release_call if the process goes idle.
+
+    Args:
+        call: The call's CallContext (its state, background tasks and database)
+        flush_metrics: Coroutine function that writes final metrics
+
+    Returns:
+        {phase: seconds or None if the phase failed}
+    """
+    from call_context import CallState
+
+    timings: Dict[str, Optional[float]] = {}
+    started = time.perf_counter()
+
+    call.try_transition(CallState.ENDED)
+    # Don't let a pending order insert sit out its batching window
+    await _phase("group_commit", call.db.flush_group_commit, timings)
+    await _phase("tasks", lambda: call.tasks.aclose(DRAIN_TASK_GRACE), timings)
+
+    # Only this call's order - the queue may also hold syncs re-queued for older orders
+    order_ids = [str(call.order["_id"])] if call.order and call.order.get("_id") else []
+    drained = await _phase("clover_sync", lambda: call.db.wait_for_clover_sync(order_ids, DRAIN_SYNC_TIMEOUT), timings)
+    if drained is False:
+        log.warning(f"⚠️ Clover sync for order {order_ids[0]} still running after the drain timeout - handed back when the process shuts down")
+
+    await _phase("metrics", flush_metrics, timings)
+
+    _log_timings(f"Drained call {call.call_id}", started, timings)
+    return timings
+
+
+def track_call(userdata: Dict[str, Any]):
+    """Count a call starting in this process (paired with release_call)."""
+    userdata["active_calls"] = userdata.get("active_calls", 0) + 1
+
+
+async def release_call(userdata: Dict[str, Any], db_driver) -> Optional[Dict[str, Optional[float]]]:
+    """
+    Count a drained call out; the last one closes the loop-bound shared resources.
+
+    Args:
+        userdata: JobProcess.userdata (holds the active call count)
+        db_driver: The process's DatabaseDriver
+
+    Returns:
+        {phase: seconds or None if the phase failed}, or None while other
+        calls are still running
+    """
+    from clover import close_clover_client
+    from twilio_client import close_twilio_client
+    from outbox import get_order_outbox, stop_outbox_replayer
+
+    userdata["active_calls"] = max(0, userdata.get("active_calls", 0) - 1)
+    if userdata["active_calls"]:
+        return None
+
+    timings: Dict[str, Optional[float]] = {}
+    started = time.perf_counter()
+
+    await _phase("replayer", stop_outbox_replayer, timings)
+    await _phase("group_commit", db_driver.flush_group_commit, timings)
+
+    abandoned = await _phase("clover_handback", lambda: db_driver.shutdown_clover_sync(0), timings)
+    if abandoned:
+        log.warning(f"⚠️ {abandoned} order(s) not synced to Clover before shutdown - left for the next worker")
+
+    async def flush_outbox():
+        outbox = get_order_outbox()
+        await outbox.compact_async()
+        pending = len(await outbox.pending_async())
+        if pending:
+            log.warning(f"⚠️ {pending} unacknowledged order(s) left in {outbox.path} for replay")
+
+    await _phase("outbox", flush_outbox, timings)
+
+    async def close_pools():
+        await close_clover_client()
+        await close_twilio_client()
+
+    await _phase("pools", close_pools, timings)
+
+    _log_timings("Released shared resources", started, timings)
+    return timings
+
+
+_process_closed = False
+
+
+def close_process_resources():
+    """Shut down the DB executor and close Mongo (idempotent; runs at interpreter exit)."""
+    global _process_closed
+    if _process_closed:
+        return
+    _process_closed = True
+    from db import shutdown_db_executor, close_mongo_client
+
+    try:
+        # Waits for any database call still running on the executor
+        shutdown_db_executor(True)
+        close_mongo_client()
+    except Exception as e:
+        log.error(f"⚠️ Closing database resources failed: {e}")
+
+
+def install_process_exit_hook(userdata: Dict[str, Any]):
+    """Register close_process_resources with atexit once per process."""
+    if not userdata.get("exit_hook_installed"):
+        atexit.register(close_process_resources)
+        userdata["exit_hook_installed"] = True
@@ -0,0 +1,141 @@
+# Group-Commit Order Inserts
+#
+# Optional writer that coalesces order inserts arriving within a short window
+# into one unordered insert_many, instead of one insert_one round trip per
+# order. Each caller still awaits its own insert and gets its own ObjectId
+# (or its own error); the only cost is up to DB_GROUP_COMMIT_WINDOW_MS of
+# added latency, and a full batch is flushed immediately without waiting.
+#
+# Batching only helps when several orders are saved in the same process at
+# once (outbox replays, benchmarks, workers hosting more than one call), so
+# it is off by default: DB_GROUP_COMMIT=1 enables it.
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
+from dotenv import load_dotenv
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+# Load environment variables
+load_dotenv()
+
+# Logger
+log = logging.getLogger("realtime_restaurant_agent")
+
+# ---------- Group-commit settings ----------
+DB_GROUP_COMMIT = os.getenv("DB_GROUP_COMMIT", "0") == "1"
+# Longest an insert waits for others to join its batch
+DB_GROUP_COMMIT_WINDOW_MS = float(os.getenv("DB_GROUP_COMMIT_WINDOW_MS", "5"))
+# Batches are flushed as soon as they reach this size
+DB_GROUP_COMMIT_MAX_BATCH = int(os.getenv("DB_GROUP_COMMIT_MAX_BATCH", "50"))
+
+
+class GroupCommitWriter:
+    """Coalesces concurrent single-document inserts into unordered insert_many calls."""
+
+    def __init__(
+        self,
+        insert_many: Callable[[List[Dict[str, Any]]], Awaitable[Any]],
+        window_ms: float = None,
+        max_batch: int = None
+    ):
+        """
+        Initialize the writer.
+
+        Args:
+            insert_many: Async callable(docs) running collection.insert_many(docs, ordered=False)
+            window_ms: Batching window in milliseconds (defaults to env var)
+            max_batch: Maximum documents per insert_many (defaults to env var)
+        """
+        self.insert_many = insert_many
+        self.window = (DB_GROUP_COMMIT_WINDOW_MS if window_ms is None else window_ms) / 1000
+        self.max_batch = max_batch or DB_GROUP_COMMIT_MAX_BATCH
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes = set()
+        self.batches = 0
+        self.documents = 0
+        self.max_batch_seen = 0
+
+    async def insert(self, doc: Dict[str, Any]) -> Any:
+        """
+        Insert one document as part of the next batch.
+
+        Returns:
+            The inserted document's _id
+
+        Raises:
+            DuplicateKeyError: If this document violates a unique index
+            PyMongoError: If this document failed to insert
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((doc, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        # Keep a reference until the write finishes (see task_supervisor.py for why)
+        task = asyncio.get_running_loop().create_task(self._write(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _write(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        docs = [doc for doc, _ in batch]
+        started = time.perf_counter()
+        failed: Dict[int, Exception] = {}
+        try:
+            result = await self.insert_many(docs)
+            ids = list(result.inserted_ids)
+        except BulkWriteError as e:
+            # Unordered: every document without a write error was inserted
+            for error in e.details.get("writeErrors", []):
+                if error.get("code") == 11000:
+                    failed[error["index"]] = DuplicateKeyError(error.get("errmsg", "duplicate key"), 11000, error)
+                else:
+                    failed[error["index"]] = BulkWriteError({"writeErrors": [error]})
+            ids = [doc.get("_id") for doc in docs]
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            log.error(f"Group-commit insert of {len(batch)} order(s) failed: {e}")
+            return
+
+        self.batches += 1
+        self.documents += len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        log.debug(f"Group-commit: {len(batch)} order(s) in {(time.perf_counter() - started) * 1000:.1f}ms")
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if index in failed:
+                future.set_exception(failed[index])
+            else:
+                future.set_result(ids[index])
+
+    async def flush(self):
+        """Write anything pending now and wait for in-flight batches."""
+        self._flush()
+        if self._flushes:
+            await asyncio.gather(*list(self._flushes), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Batch counters."""
+        return {
+            "batches": self.batches,
+            "documents": self.documents,
+            "avg_batch": self.documents / self.batches if self.batches else 0.0,
+            "max_batch": self.max_batch_seen,
+            "pending": len(self._pending),
+        }
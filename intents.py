@@ -0,0 +1,254 @@
+# Keyword Intent Engine
+#
+# Precompiled multi-pattern matcher (Aho-Corasick) over menu item names and
+# intent keywords. Used by RestaurantAgent's timeout fallback so a slow model
+# turn still gets a menu-aware answer that moves the order forward. Matching
+# is a single pass over the message, constant work per character.
+import re
+from dataclasses import dataclass, field
+from typing import List, Dict, Tuple, Optional, Any
+
+from menu import MenuItem, MENU_ITEMS, CATEGORIES, SPICE_LEVELS, normalize_name, phonetic_key, get_menu_index
+
+# Intent keywords (matched on normalized text, whole words only)
+_INTENT_KEYWORDS = {
+    "greeting": ["hello", "hi", "hey", "namaste", "good morning", "good evening", "good afternoon"],
+    "price": ["price", "prices", "cost", "how much", "rate"],
+    "menu": ["menu", "what do you have", "options", "what is available", "what s available", "recommend"],
+    "order": [
+        "order", "want", "like to", "get me", "give me", "i ll have", "i will have", "i ll take",
+        "i d like", "i would like", "can i get", "could i get", "can i have", "could i have", "may i have",
+    ],
+    "confirm": ["yes", "yeah", "confirm", "go ahead", "okay", "ok", "correct", "place order", "place it"],
+    "done": ["that s all", "thats all", "that s it", "nothing else", "no more", "done", "final order"],
+    "delivery": ["delivery", "deliver"],
+}
+
+# A whole-word number in the space-padded normalized text
+_NUMBER = re.compile(r"(?<= )[0-9]+(?= )")
+
+_QUANTITY_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+}
+
+# Spoken category names -> catalog category
+_CATEGORY_KEYWORDS = {
+    "veg appetizers": "VEG APPETIZERS", "veg appetizer": "VEG APPETIZERS", "veg starters": "VEG APPETIZERS",
+    "non veg appetizers": "NON-VEG APPETIZERS", "non veg appetizer": "NON-VEG APPETIZERS", "non veg starters": "NON-VEG APPETIZERS",
+    "veg biryanis": "VEG BIRYANIS", "veg biryani options": "VEG BIRYANIS",
+    "non veg biryanis": "NON-VEG BIRYANIS", "non veg biryani": "NON-VEG BIRYANIS",
+    "appetizers": "APPETIZERS", "starters": "APPETIZERS", "biryanis": "BIRYANIS",
+}
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton over string patterns.
+
+    Patterns are added with a payload, compiled once with build(), and then
+    every occurrence in a text is found in one left-to-right pass.
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, Any]]] = [[]]
+        self._built = False
+
+    def add(self, pattern: str, payload: Any):
+        """Add a pattern (must be called before build())."""
+        if self._built:
+            raise RuntimeError("Cannot add patterns after build()")
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(pattern), payload))
+
+    def build(self):
+        """Compute failure links (breadth-first)."""
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                if node:
+                    fail = self._fail[node]
+                    while fail and ch not in self._goto[fail]:
+                        fail = self._fail[fail]
+                    self._fail[child] = self._goto[fail].get(ch, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+        self._built = True
+
+    def search(self, text: str) -> List[Tuple[int, int, Any]]:
+        """
+        Find all pattern occurrences.
+
+        Returns:
+            [(start, end, payload), ...] in order of end position
+        """
+        matches = []
+        node = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for length, payload in out[node]:
+                matches.append((i - length + 1, i + 1, payload))
+        return matches
+
+
+@dataclass
+class IntentResult:
+    """What a single customer message mentions."""
+    intents: List[str] = field(default_factory=list)
+    items: List[MenuItem] = field(default_factory=list)
+    quantity: Optional[int] = None
+    spice: Optional[str] = None
+    category: Optional[str] = None
+
+
+class IntentEngine:
+    """Matches menu items, categories, spice levels, quantities and intents in one pass."""
+
+    def __init__(self, items: List[MenuItem] = None):
+        self._automaton = AhoCorasick()
+        # Second automaton over phonetic keys catches mis-heard names ("lam biryani")
+        self._phonetic_automaton = AhoCorasick()
+        items = items if items is not None else MENU_ITEMS
+        for item in items:
+            normalized = normalize_name(item.name)
+            self._add(normalized, ("item", item))
+            self._phonetic_automaton.add(f" {phonetic_key(normalized)} ", item)
+        self._phonetic_automaton.build()
+        for intent, keywords in _INTENT_KEYWORDS.items():
+            for keyword in keywords:
+                self._add(keyword, ("intent", intent))
+        for spoken, category in _CATEGORY_KEYWORDS.items():
+            self._add(spoken, ("category", category))
+        for level in SPICE_LEVELS:
+            self._add(level.lower(), ("spice", level.lower()))
+        for word, number in _QUANTITY_WORDS.items():
+            self._add(word, ("quantity", number))
+        self._automaton.build()
+
+    def _add(self, pattern: str, payload: Tuple[str, Any]):
+        # Space-padded so that only whole words/phrases match
+        self._automaton.add(f" {pattern} ", payload)
+
+    def analyze(self, message: str) -> IntentResult:
+        """
+        Analyze a customer message.
+
+        Overlapping matches are resolved leftmost-longest, so "pani puri water"
+        wins over "pani puri" and "chicken 65" is not read as a quantity of 65.
+        """
+        normalized = normalize_name(message)
+        text = f" {normalized} "
+        matches = self._automaton.search(text)
+        # Numeric quantities of any size, spanned like a padded pattern
+        for number in _NUMBER.finditer(text):
+            if int(number.group()) > 0:
+                matches.append((number.start() - 1, number.end() + 1, ("quantity", int(number.group()))))
+        # Leftmost-longest, non-overlapping (pads may touch)
+        matches.sort(key=lambda m: (m[0], -(m[1] - m[0])))
+        result = IntentResult()
+        last_end = 0
+        for start, end, (kind, value) in matches:
+            if start + 1 < last_end:
+                continue
+            last_end = end
+            if kind == "item" and value not in result.items:
+                result.items.append(value)
+            elif kind == "intent" and value not in result.intents:
+                result.intents.append(value)
+            elif kind == "spice":
+                # "extra hot" also contains "hot" - keep the longer level
+                if result.spice is None or len(value) > len(result.spice):
+                    result.spice = value
+            elif kind == "quantity" and result.quantity is None:
+                result.quantity = value
+            elif kind == "category" and result.category is None:
+                result.category = value
+
+        if not result.items:
+            phonetic_matches = self._phonetic_automaton.search(f" {phonetic_key(normalized)} ")
+            phonetic_matches.sort(key=lambda m: (m[0], -(m[1] - m[0])))
+            for _, _, item in phonetic_matches[:1]:
+                result.items.append(item)
+        return result
+
+
+def _price_list(items: List[MenuItem], limit: int = 5) -> str:
+    """'Chicken Biryani ($18.00), Lamb Biryani ($24.00) ...' for up to limit items."""
+    return ", ".join(f"{item.name} (${item.price:.2f})" for item in items[:limit])
+
+
+def fallback_response(message: str) -> str:
+    """
+    Menu-aware canned reply used when the model times out.
+
+    Answers price questions with the real price and asks for the next
+    missing detail (quantity, then spice level) for the dish mentioned.
+    """
+    result = get_intent_engine().analyze(message or "")
+    index = get_menu_index()
+
+    if result.items:
+        item = result.items[0]
+        if "price" in result.intents:
+            return f"{item.name} is ${item.price:.2f}. How many would you like?"
+        if result.quantity is None:
+            return f"Sure, {item.name} is ${item.price:.2f}. How many plates would you like?"
+        if item.needs_spice and result.spice is None:
+            return f"{result.quantity} {item.name}. What spice level would you like? Mild, Medium, Hot, or Extra Hot?"
+        name = f"{item.name} - {result.spice}" if item.needs_spice and result.spice else item.name
+        total = item.price * result.quantity
+        return f"{result.quantity} {name} comes to ${total:.2f}. Shall I add that to your order?"
+
+    if result.category:
+        if result.category in CATEGORIES:
+            items = index.in_category(result.category)
+        else:
+            items = [item for item in index.items if result.category.rstrip("S") in item.category]
+        return f"We have {_price_list(items)}. Which one would you like?"
+    if "delivery" in result.intents:
+        return "Currently we only accept orders for collection. You can collect your order directly from bansari Restaurant."
+    if "done" in result.intents or "confirm" in result.intents:
+        return "Thank you! Let me read back your order with the total so you can confirm it."
+    if "price" in result.intents:
+        return "Sure! What specific dish would you like to know the price for?"
+    if "menu" in result.intents:
+        return "We have veg and non-veg appetizers, and veg and non-veg biryanis. Which would you like to hear about?"
+    if "order" in result.intents:
+        return "Sure! Which dish would you like to order?"
+    if "greeting" in result.intents:
+        return "Hello! Welcome to bansari Restaurant. How can I help you today?"
+    return "I'm here to help you with your order. What would you like to order?"
+
+
+# Singleton engine (automaton built once per process)
+_intent_engine = None
+
+
+def get_intent_engine() -> IntentEngine:
+    """
+    Get or build the singleton intent engine.
+
+    Returns:
+        IntentEngine over the menu catalog
+    """
+    global _intent_engine
+    if _intent_engine is None:
+        _intent_engine = IntentEngine()
+    return _intent_engine
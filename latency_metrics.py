@@ -0,0 +1,397 @@
+# Per-Turn Latency Metrics
+#
+# Records where each conversational turn spends its time - end of user speech
+# to the agent's first audio, model time-to-first-token, model response time
+# and tool execution - into in-process histograms, and exports them in the
+# Prometheus text format (textfile-collector style) labeled by call and worker.
+#
+# A call's series are dropped from the registry once the call has been
+# flushed, and each process deletes its .prom file when it exits; files left
+# by processes that died without cleaning up are swept by the exporter.
+import os
+import re
+import math
+import time
+import atexit
+import asyncio
+import socket
+import logging
+import threading
+from collections import deque
+from typing import Dict, Tuple, List, Optional, Any
+from dotenv import load_dotenv
+
+from outbox import _pid_alive
+
+# Load environment variables
+load_dotenv()
+
+# Logger
+log = logging.getLogger("realtime_restaurant_agent")
+
+# ---------- Metrics settings ----------
+# Directory for the exported .prom files (empty disables export)
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "metrics"))
+# Seconds between background exports while a call is running
+METRICS_EXPORT_INTERVAL = float(os.getenv("METRICS_EXPORT_INTERVAL", "15"))
+# Recent samples kept per histogram for p50/p95/p99
+METRICS_SAMPLE_WINDOW = int(os.getenv("METRICS_SAMPLE_WINDOW", "1024"))
+# Worker label (defaults to host:pid of the job process)
+METRICS_WORKER_ID = os.getenv("METRICS_WORKER_ID")
+
+# Bucket upper bounds in seconds - dense around the 0.3s-2s range that callers notice
+LATENCY_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+_TEXTFILE_NAME = re.compile(r"^agent_latency-(\d+)\.prom(\.tmp)?$")
+
+
+class Histogram:
+    """
+    Cumulative bucket histogram with a sliding sample window.
+
+    Buckets, sum and count are exported as a Prometheus histogram; the sample
+    window gives exact recent quantiles for logs and the summary lines.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS, window: int = None):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.samples = deque(maxlen=window or METRICS_SAMPLE_WINDOW)
+
+    def observe(self, value: float):
+        """Record one sample (seconds)."""
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Nearest-rank quantile over the sample window (None if empty)."""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        rank = max(0, min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1))
+        return ordered[rank]
+
+
+class LatencyRegistry:
+    """Process-wide set of labeled latency histograms."""
+
+    def __init__(self):
+        self._histograms: Dict[Tuple[str, LabelSet], Histogram] = {}
+        self._help: Dict[str, str] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        # Plain counters / gauges alongside the histograms: {(name, labels): value}
+        self._values: Dict[Tuple[str, LabelSet], float] = {}
+        self._types: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, help_text: str, buckets: Tuple[float, ...] = None):
+        """Set the HELP text (and optionally non-default buckets) for a metric name."""
+        self._help[name] = help_text
+        if buckets is not None:
+            self._buckets[name] = buckets
+
+    def observe(self, name: str, seconds: float, **labels: str):
+        """Record a latency sample for a metric and label set."""
+        if seconds is None or seconds < 0:
+            return
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self._buckets.get(name, LATENCY_BUCKETS))
+            histogram.observe(seconds)
+
+    def increment(self, name: str, amount: float = 1, **labels: str):
+        """Add to a counter."""
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._types[name] = "counter"
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_gauge(self, name: str, value: float, **labels: str):
+        """Set a gauge to its current value."""
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._types[name] = "gauge"
+            self._values[key] = value
+
+    def value(self, name: str, **labels: str) -> Optional[float]:
+        """Current value of a counter or gauge (None if never set)."""
+        return self._values.get((name, tuple(sorted((k, str(v)) for k, v in labels.items()))))
+
+    def remove(self, **labels: str) -> int:
+        """
+        Drop every histogram, counter and gauge whose labels include the given ones.
+
+        Returns:
+            Number of series removed
+        """
+        wanted = {(k, str(v)) for k, v in labels.items()}
+        with self._lock:
+            keys = [key for key in self._histograms if wanted.issubset(key[1])]
+            for key in keys:
+                del self._histograms[key]
+            value_keys = [key for key in self._values if wanted.issubset(key[1])]
+            for key in value_keys:
+                del self._values[key]
+        return len(keys) + len(value_keys)
+
+    def get(self, name: str, **labels: str) -> Optional[Histogram]:
+        """Look up a histogram by name and exact label set."""
+        return self._histograms.get((name, tuple(sorted((k, str(v)) for k, v in labels.items()))))
+
+    def summary(self, **labels: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Count and p50/p95/p99 for every metric whose labels include the given ones.
+
+        Returns:
+            {"metric{extra labels}": {"count": n, "p50": s, "p95": s, "p99": s}, ...}
+        """
+        wanted = {(k, str(v)) for k, v in labels.items()}
+        result = {}
+        with self._lock:
+            for (name, label_set), histogram in sorted(self._histograms.items()):
+                if not wanted.issubset(label_set):
+                    continue
+                extra = ",".join(f"{k}={v}" for k, v in label_set if (k, v) not in wanted)
+                entry = {"count": histogram.count}
+                for q in QUANTILES:
+                    entry[f"p{int(q * 100)}"] = histogram.quantile(q)
+                result[f"{name}{{{extra}}}" if extra else name] = entry
+        return result
+
+    def render_prometheus(self) -> str:
+        """Render all histograms, counters and gauges in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            by_name: Dict[str, List[Tuple[LabelSet, Histogram]]] = {}
+            for (name, label_set), histogram in sorted(self._histograms.items()):
+                by_name.setdefault(name, []).append((label_set, histogram))
+
+            for name, series in by_name.items():
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for label_set, histogram in series:
+                    for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                        lines.append(f"{name}_bucket{_format_labels(label_set, le=_format_float(bound))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(label_set, le='+Inf')} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(label_set)} {_format_float(histogram.sum)}")
+                    lines.append(f"{name}_count{_format_labels(label_set)} {histogram.count}")
+
+                # Sample-window quantiles as a companion gauge
+                lines.append(f"# TYPE {name}_window gauge")
+                for label_set, histogram in series:
+                    for q in QUANTILES:
+                        value = histogram.quantile(q)
+                        if value is not None:
+                            lines.append(f"{name}_window{_format_labels(label_set, quantile=str(q))} {_format_float(value)}")
+
+            values_by_name: Dict[str, List[Tuple[LabelSet, float]]] = {}
+            for (name, label_set), value in sorted(self._values.items()):
+                values_by_name.setdefault(name, []).append((label_set, value))
+            for name, series in values_by_name.items():
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {self._types[name]}")
+                for label_set, value in series:
+                    lines.append(f"{name}{_format_labels(label_set)} {_format_float(value)}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str = None) -> Optional[str]:
+        """
+        Atomically write the Prometheus text to a file.
+
+        Args:
+            path: Target file (defaults to METRICS_DIR/agent_latency-<pid>.prom)
+
+        Returns:
+            The path written, or None if export is disabled or failed
+        """
+        if path is None:
+            if not METRICS_DIR:
+                return None
+            path = _own_textfile()
+            _register_textfile_cleanup()
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.render_prometheus())
+            os.replace(tmp_path, path)
+            return path
+        except OSError as e:
+            log.warning(f"Could not write latency metrics to {path}: {e}")
+            return None
+
+
+def _own_textfile() -> str:
+    return os.path.join(METRICS_DIR, f"agent_latency-{os.getpid()}.prom")
+
+
+_cleanup_registered = False
+
+
+def _register_textfile_cleanup():
+    global _cleanup_registered
+    if not _cleanup_registered:
+        atexit.register(remove_textfile)
+        _cleanup_registered = True
+
+
+def remove_textfile():
+    """Delete this process's .prom file (runs at interpreter exit)."""
+    if not METRICS_DIR:
+        return
+    for path in (_own_textfile(), _own_textfile() + ".tmp"):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.warning(f"Could not remove {path}: {e}")
+
+
+def sweep_stale_textfiles() -> int:
+    """
+    Delete .prom files written by processes that are no longer running.
+
+    Returns:
+        Number of files removed
+    """
+    if not METRICS_DIR or not os.path.isdir(METRICS_DIR):
+        return 0
+    removed = 0
+    for filename in os.listdir(METRICS_DIR):
+        match = _TEXTFILE_NAME.match(filename)
+        if match is None or _pid_alive(int(match.group(1))):
+            continue
+        try:
+            os.remove(os.path.join(METRICS_DIR, filename))
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.warning(f"Could not remove stale metrics file {filename}: {e}")
+    return removed
+
+
+def _format_float(value: float) -> str:
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(label_set: LabelSet, **extra: str) -> str:
+    pairs = list(label_set) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(str(v))}"' for k, v in pairs) + "}"
+
+
+# ---------- Metric names ----------
+TURN_FIRST_AUDIO = "agent_turn_first_audio_seconds"
+TURN_THINKING = "agent_turn_thinking_seconds"
+MODEL_TTFT = "agent_model_ttft_seconds"
+MODEL_RESPONSE = "agent_model_response_seconds"
+TOOL_EXECUTION = "agent_tool_execution_seconds"
+
+# Singleton registry (one per worker process)
+latency_registry = LatencyRegistry()
+latency_registry.describe(TURN_FIRST_AUDIO, "End of user speech to the agent starting to speak")
+latency_registry.describe(TURN_THINKING, "End of user speech to the agent entering the thinking state")
+latency_registry.describe(MODEL_TTFT, "Realtime model time to first token")
+latency_registry.describe(MODEL_RESPONSE, "Realtime model total response duration")
+latency_registry.describe(TOOL_EXECUTION, "Function tool execution time")
+
+
+class TurnLatencyTracker:
+    """
+    Turns AgentSession events into per-turn latency samples for one call.
+
+    A turn starts when the user state goes speaking -> listening (end of
+    speech) and closes when the agent state becomes "speaking" (first audio).
+    """
+
+    def __init__(self, call_id: str, registry: LatencyRegistry = None, worker: str = None):
+        self.call_id = call_id
+        self.worker = worker or METRICS_WORKER_ID or f"{socket.gethostname()}:{os.getpid()}"
+        self.registry = registry or latency_registry
+        self.turns = 0
+        self._end_of_speech: Optional[float] = None
+        self._thinking_recorded = False
+
+    @property
+    def labels(self) -> Dict[str, str]:
+        return {"call_id": self.call_id, "worker": self.worker}
+
+    def attach(self, session):
+        """Subscribe to the session events that mark turn boundaries."""
+        session.on("user_state_changed", self.on_user_state_changed)
+        session.on("agent_state_changed", self.on_agent_state_changed)
+        session.on("function_tools_executed", self.on_function_tools_executed)
+
+    def on_user_state_changed(self, ev):
+        if ev.old_state == "speaking" and ev.new_state == "listening":
+            self._end_of_speech = time.perf_counter()
+            self._thinking_recorded = False
+        elif ev.new_state == "speaking":
+            # User barged in again before we answered - restart the turn
+            self._end_of_speech = None
+
+    def on_agent_state_changed(self, ev):
+        if self._end_of_speech is None:
+            return
+        elapsed = time.perf_counter() - self._end_of_speech
+        if ev.new_state == "thinking" and not self._thinking_recorded:
+            self._thinking_recorded = True
+            self.registry.observe(TURN_THINKING, elapsed, **self.labels)
+        elif ev.new_state == "speaking":
+            self.turns += 1
+            self._end_of_speech = None
+            self.registry.observe(TURN_FIRST_AUDIO, elapsed, **self.labels)
+
+    def on_metrics(self, metrics):
+        """Record a RealtimeModelMetrics sample."""
+        if getattr(metrics, "cancelled", False):
+            return
+        self.registry.observe(MODEL_TTFT, metrics.ttft, **self.labels)
+        self.registry.observe(MODEL_RESPONSE, metrics.duration, **self.labels)
+
+    def on_function_tools_executed(self, ev):
+        for call, output in zip(ev.function_calls, ev.function_call_outputs):
+            if output is None:
+                continue
+            self.registry.observe(TOOL_EXECUTION, output.created_at - call.created_at, tool=call.name, **self.labels)
+
+    def close(self) -> int:
+        """Drop this call's series (every metric labeled with its call_id) from the registry."""
+        return self.registry.remove(call_id=self.call_id)
+
+    def log_summary(self):
+        """Log p50/p95/p99 for this call."""
+        for name, stats in self.registry.summary(**self.labels).items():
+            quantiles = " ".join(
+                f"{key}={value * 1000:.0f}ms" for key, value in stats.items() if key != "count" and value is not None
+            )
+            log.info(f"⏱️ {name}: n={stats['count']} {quantiles}")
+
+
+async def export_latency_metrics_periodically(interval: float = None):
+    """Write the textfile every interval seconds until cancelled."""
+    interval = interval or METRICS_EXPORT_INTERVAL
+    sweep_stale_textfiles()
+    while True:
+        await asyncio.sleep(interval)
+        latency_registry.write_textfile()
@@ -0,0 +1,150 @@
+# Event-Loop Lag Monitor
+#
+# Every call in a job process shares one asyncio loop, so one blocking call
+# (sync pymongo, heavy log formatting, a CPU-bound parse) delays audio for the
+# whole call. This monitor:
+#
+#   - samples loop scheduling delay with a short periodic sleep and records it
+#     in the latency histograms (p50/p95/p99 next to the per-turn metrics)
+#   - runs a watchdog thread that, when the loop has not ticked for longer
+#     than LOOP_SLOW_CALLBACK_THRESHOLD, captures the loop thread's stack -
+#     i.e. the code that is blocking it - and logs it (rate limited)
+#
+# Cost is one timer wake-up per LOOP_MONITOR_INTERVAL plus a thread that
+# mostly sleeps, so it is meant to stay on in production.
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from typing import Dict, Any, Optional
+from dotenv import load_dotenv
+
+from latency_metrics import latency_registry
+
+# Load environment variables
+load_dotenv()
+
+# Logger
+log = logging.getLogger("realtime_restaurant_agent")
+
+# ---------- Monitor settings ----------
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "1") != "0"
+# Seconds between lag samples
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.1"))
+# A loop blocked for longer than this is reported with its stack
+LOOP_SLOW_CALLBACK_THRESHOLD = float(os.getenv("LOOP_SLOW_CALLBACK_THRESHOLD", "0.1"))
+# At most one stack log per this many seconds (the rest are counted)
+LOOP_SLOW_LOG_INTERVAL = float(os.getenv("LOOP_SLOW_LOG_INTERVAL", "10"))
+# Stack frames included in each report
+LOOP_SLOW_STACK_DEPTH = int(os.getenv("LOOP_SLOW_STACK_DEPTH", "12"))
+
+LOOP_LAG = "agent_event_loop_lag_seconds"
+LOOP_LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1.0)
+latency_registry.describe(LOOP_LAG, "Event-loop scheduling delay", buckets=LOOP_LAG_BUCKETS)
+
+
+class LoopMonitor:
+    """Samples event-loop lag and reports what was blocking the loop when it stalls."""
+
+    def __init__(self, labels: Dict[str, str] = None):
+        """
+        Initialize the monitor.
+
+        Args:
+            labels: Metric labels for the lag histogram (e.g. call_id, worker)
+        """
+        self.labels = labels or {}
+        self.slow_callbacks = 0
+        self.suppressed = 0
+        self.max_lag = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_tick = 0.0
+        self._stall_reported = False
+        self._last_log = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start sampling on the running loop (call from the loop thread)."""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.perf_counter()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._sample())
+        self._watchdog = threading.Thread(target=self._watch, daemon=True, name="loop_monitor_watchdog")
+        self._watchdog.start()
+
+    async def stop(self):
+        """Stop sampling and the watchdog."""
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _sample(self):
+        interval = LOOP_MONITOR_INTERVAL
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            now = time.perf_counter()
+            lag = max(0.0, now - started - interval)
+            self._last_tick = now
+            self._stall_reported = False
+            self.max_lag = max(self.max_lag, lag)
+            latency_registry.observe(LOOP_LAG, lag, **self.labels)
+
+    def _watch(self):
+        # Runs on its own thread; only reads shared floats and the loop thread's frame
+        while not self._stopped.wait(LOOP_SLOW_CALLBACK_THRESHOLD / 2):
+            blocked_for = time.perf_counter() - self._last_tick - LOOP_MONITOR_INTERVAL
+            if blocked_for < LOOP_SLOW_CALLBACK_THRESHOLD or self._stall_reported:
+                continue
+            self._stall_reported = True
+            self.slow_callbacks += 1
+            now = time.monotonic()
+            if now - self._last_log < LOOP_SLOW_LOG_INTERVAL:
+                self.suppressed += 1
+                continue
+            self._last_log = now
+            self._report(blocked_for)
+
+    def _report(self, blocked_for: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            stack = "  <no frame>\n"
+        else:
+            # asyncio's own run/dispatch frames are the same for every stall - drop them
+            frames = [f for f in traceback.extract_stack(frame) if f"{os.sep}asyncio{os.sep}" not in f.filename]
+            stack = "".join(traceback.format_list(frames[-LOOP_SLOW_STACK_DEPTH:]))
+        suppressed, self.suppressed = self.suppressed, 0
+        note = f" ({suppressed} more stall(s) since last report)" if suppressed else ""
+        log.warning(
+            f"🐢 Event loop blocked for {blocked_for * 1000:.0f}ms+{note} - loop thread stack:\n{stack.rstrip()}"
+        )
+
+    def summary(self) -> Dict[str, Any]:
+        """Lag percentiles and stall counters."""
+        histogram = latency_registry.get(LOOP_LAG, **self.labels)
+        result = {"slow_callbacks": self.slow_callbacks, "max_lag_ms": self.max_lag * 1000}
+        if histogram is not None:
+            for q in (0.5, 0.95, 0.99):
+                value = histogram.quantile(q)
+                result[f"p{int(q * 100)}_ms"] = value * 1000 if value is not None else None
+        return result
+
+
+def start_loop_monitor(labels: Dict[str, str] = None) -> Optional[LoopMonitor]:
+    """Start a loop monitor on the running loop (None if disabled by LOOP_MONITOR_ENABLED=0)."""
+    if not LOOP_MONITOR_ENABLED:
+        return None
+    monitor = LoopMonitor(labels)
+    monitor.start()
+    return monitor
@@ -0,0 +1,391 @@
+# Menu Catalog Module
+#
+# Structured source of truth for the bansari Restaurant menu. The prompt menu
+# is rendered from here, and create_order uses the prebuilt index to resolve
+# mis-heard item names and enforce server-side prices without a model round-trip.
+import re
+import difflib
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Tuple
+
+# ============================================================
+# 🍴 Items that do NOT need spice level
+# ============================================================
+NO_SPICE_ITEMS = [
+    "Pani Puri", "Dahi Batata Puri", "Pav Bhaji", "Samosa", "Samosa Chaat",
+    "Aloo Tikki Chaat", "Chinese Bhel", "Puri", "Extra Tamarind Chutney",
+    "Extra Green Chutney", "Pani Puri Water", "Chaat", "Bhel"
+]
+
+SPICE_LEVELS = ["Mild", "Medium", "Hot", "Extra Hot"]
+
+
+@dataclass(frozen=True)
+class MenuItem:
+    """A single dish on the menu."""
+    name: str
+    price: float
+    category: str
+
+    @property
+    def base_name(self) -> str:
+        """Name without size/portion notes, e.g. 'Puri (8 Pcs)' -> 'Puri'."""
+        return _strip_portion(self.name)
+
+    @property
+    def needs_spice(self) -> bool:
+        """True if the customer must be asked for a spice level."""
+        return self.base_name not in NO_SPICE_ITEMS
+
+
+# Categories in menu order: (category, [(name, price), ...])
+_MENU_DATA = [
+    ("VEG APPETIZERS", [
+        ("Puri (8 Pcs)", 3.00),
+        ("Extra Tamarind Chutney 4oz", 1.75),
+        ("Extra Green Chutney 4oz", 1.75),
+        ("Pani Puri Water", 2.50),
+        ("Dahi Batata Puri", 10.00),
+        ("Pani Puri", 9.00),
+        ("Samosa Chaat", 10.00),
+        ("Samosa", 6.00),
+        ("Aloo Tikki Chaat", 10.00),
+        ("Chinese Bhel", 11.00),
+        ("Chili Gobi", 11.00),
+        ("Chili Paneer", 11.00),
+        ("Gobi 65", 11.00),
+        ("Paneer 65", 10.00),
+        ("Gobi Manchurian Dry", 12.00),
+        ("Pav Bhaji", 10.00),
+    ]),
+    ("NON-VEG APPETIZERS", [
+        ("Chicken 65", 11.00),
+        ("Chilli Chicken", 11.00),
+        ("Chilli Shrimp", 12.00),
+        ("Egg Tapori", 10.00),
+    ]),
+    ("VEG BIRYANIS", [
+        ("Paneer Biryani", 16.00),
+        ("Veg Biryani", 14.00),
+    ]),
+    ("NON-VEG BIRYANIS", [
+        ("Shrimp Biryani", 19.00),
+        ("Lamb Biryani", 24.00),
+        ("Egg Biryani", 14.00),
+        ("Goat Biryani", 25.00),
+        ("Chicken Biryani", 18.00),
+    ]),
+]
+
+MENU_ITEMS: List[MenuItem] = [
+    MenuItem(name=name, price=price, category=category)
+    for category, entries in _MENU_DATA
+    for name, price in entries
+]
+
+CATEGORIES: List[str] = [category for category, _ in _MENU_DATA]
+
+# Common spoken/spelling variants mapped to the menu spelling
+_TOKEN_ALIASES = {
+    "chilli": "chili",
+    "chillie": "chili",
+    "gobhi": "gobi",
+    "biriyani": "biryani",
+    "briyani": "biryani",
+    "biriani": "biryani",
+    "panner": "paneer",
+    "prawn": "shrimp",
+    "prawns": "shrimp",
+    "sixty": "65",
+    "pcs": "",
+    "pieces": "",
+    "plate": "",
+    "plates": "",
+    "of": "",
+    "the": "",
+}
+
+
+def _strip_portion(name: str) -> str:
+    """Remove portion notes like '(8 Pcs)' and sizes like '4oz'."""
+    name = re.sub(r"\([^)]*\)", "", name)
+    name = re.sub(r"\b\d+\s*oz\b", "", name, flags=re.IGNORECASE)
+    return " ".join(name.split())
+
+
+def normalize_name(text: str) -> str:
+    """
+    Normalize an item name for matching.
+
+    Lowercases, drops portion notes and punctuation, and maps common
+    spelling variants (e.g. 'chilli' -> 'chili', 'sixty five' -> '65').
+    """
+    text = _strip_portion(text).lower()
+    text = text.replace("sixty five", "65").replace("sixty-five", "65")
+    tokens = re.findall(r"[a-z0-9]+", text)
+    out = []
+    for token in tokens:
+        token = _TOKEN_ALIASES.get(token, token)
+        if token:
+            out.append(token)
+    return " ".join(out)
+
+
+def phonetic_key(text: str) -> str:
+    """
+    Coarse phonetic key for a (normalized) name.
+
+    Collapses sound-alike spellings so 'lam biryani', 'lamb biriyani' and
+    'lamb briyani' share a key: silent letters and vowels are dropped
+    after the first letter, and similar consonants are merged.
+    """
+    words = []
+    for word in text.split():
+        if word.isdigit():
+            words.append(word)
+            continue
+        w = word
+        w = re.sub(r"mb$", "m", w)
+        for src, dst in (("ph", "f"), ("ck", "k"), ("kh", "k"), ("gh", "g"),
+                         ("bh", "b"), ("dh", "d"), ("th", "t"), ("sh", "s"),
+                         ("ch", "c"), ("q", "k"), ("z", "s"), ("w", "v")):
+            w = w.replace(src, dst)
+        w = w.replace("c", "k")
+        head, tail = w[:1], re.sub(r"[aeiouyh]", "", w[1:])
+        w = head + tail
+        w = re.sub(r"(.)\1+", r"\1", w)
+        words.append(w)
+    return " ".join(words)
+
+
+# Lookup results kept per MenuIndex
+_LOOKUP_CACHE_SIZE = 1024
+
+
+class MenuIndex:
+    """
+    Prebuilt lookup index over the menu.
+
+    Resolution order: exact normalized name, phonetic key, then fuzzy
+    token alignment over candidates that share a token or phonetic token.
+    Ambiguous fuzzy matches return None rather than a guess.
+    """
+
+    def __init__(self, items: List[MenuItem], cutoff: float = 0.75, token_cutoff: float = 0.75, margin: float = 0.08):
+        """
+        Build the index.
+
+        Args:
+            items: Menu items to index
+            cutoff: Minimum overall similarity (0-1) for a fuzzy match
+            token_cutoff: Minimum similarity for every spoken token
+            margin: Required lead of the best match over the runner-up
+        """
+        self.items = items
+        self.cutoff = cutoff
+        self.token_cutoff = token_cutoff
+        self.margin = margin
+        self._by_normalized: Dict[str, MenuItem] = {}
+        self._by_phonetic: Dict[str, MenuItem] = {}
+        self._by_token: Dict[str, List[MenuItem]] = {}
+        self._normalized: Dict[MenuItem, str] = {}
+        self._phonetic: Dict[MenuItem, str] = {}
+        # Per-index lookup results by normalized query (bounded, oldest evicted first)
+        self._lookups: Dict[str, Optional[MenuItem]] = {}
+
+        for item in items:
+            normalized = normalize_name(item.name)
+            phonetic = phonetic_key(normalized)
+            self._normalized[item] = normalized
+            self._phonetic[item] = phonetic
+            self._by_normalized[normalized] = item
+            self._by_phonetic.setdefault(phonetic, item)
+            for token in set(normalized.split()) | set(phonetic.split()):
+                self._by_token.setdefault(token, []).append(item)
+
+    @staticmethod
+    def _token_similarity(a: str, b: str) -> float:
+        """Similarity of two tokens (max of spelling and phonetic ratio)."""
+        if a == b:
+            return 1.0
+        if a.isdigit() or b.isdigit():
+            return 0.0
+        text_score = difflib.SequenceMatcher(None, a, b).ratio()
+        sound_score = difflib.SequenceMatcher(None, phonetic_key(a), phonetic_key(b)).ratio()
+        return max(text_score, sound_score)
+
+    def _score(self, item: MenuItem, query_tokens: List[str]) -> float:
+        """
+        Symmetric token-alignment score between a query and an item.
+
+        Returns 0 if any query token has no close counterpart in the item,
+        so 'mutton biryani' never resolves to 'Chicken Biryani'.
+        """
+        item_tokens = self._normalized[item].split()
+        query_best = [max(self._token_similarity(q, t) for t in item_tokens) for q in query_tokens]
+        if min(query_best) < self.token_cutoff:
+            return 0.0
+        item_best = [max(self._token_similarity(t, q) for q in query_tokens) for t in item_tokens]
+        # Unspoken item tokens count as misses, not partial matches
+        item_best = [score if score >= self.token_cutoff else 0.0 for score in item_best]
+        return (sum(query_best) + sum(item_best)) / (len(query_best) + len(item_best))
+
+    def lookup(self, text: str) -> Optional[MenuItem]:
+        """
+        Resolve free text (as heard) to a menu item.
+
+        Args:
+            text: Item name, e.g. 'lam biryani' or 'Chilli Gobi'
+
+        Returns:
+            Best matching MenuItem, or None if nothing is close enough
+        """
+        normalized = normalize_name(text)
+        if not normalized:
+            return None
+        if normalized in self._lookups:
+            return self._lookups[normalized]
+        match = self._resolve(normalized)
+        if len(self._lookups) >= _LOOKUP_CACHE_SIZE:
+            del self._lookups[next(iter(self._lookups))]
+        self._lookups[normalized] = match
+        return match
+
+    def _resolve(self, normalized: str) -> Optional[MenuItem]:
+        if normalized in self._by_normalized:
+            return self._by_normalized[normalized]
+        phonetic = phonetic_key(normalized)
+        if phonetic in self._by_phonetic:
+            return self._by_phonetic[phonetic]
+
+        candidates = set()
+        for token in set(normalized.split()) | set(phonetic.split()):
+            candidates.update(self._by_token.get(token, ()))
+        if not candidates:
+            candidates = set(self.items)
+
+        query_tokens = normalized.split()
+        scored = sorted(
+            ((self._score(item, query_tokens), item) for item in candidates),
+            key=lambda pair: pair[0],
+            reverse=True
+        )
+        best_score, best = scored[0]
+        runner_up = scored[1][0] if len(scored) > 1 else 0.0
+        # Refuse to guess between near-equal candidates (e.g. just "biryani")
+        if best_score < self.cutoff or best_score - runner_up < self.margin:
+            return None
+        return best
+
+    def in_category(self, category: str) -> List[MenuItem]:
+        """Get items in a category (case-insensitive, e.g. 'veg biryanis')."""
+        category = category.strip().upper()
+        return [item for item in self.items if item.category == category]
+
+
+def split_spice_level(name: str) -> Tuple[str, Optional[str]]:
+    """
+    Split 'Lamb Biryani - hot' into ('Lamb Biryani', 'hot').
+
+    Returns:
+        (item text, spice level or None)
+    """
+    base, sep, suffix = name.rpartition(" - ")
+    if sep:
+        spice = suffix.strip().lower()
+        if spice in {level.lower() for level in SPICE_LEVELS}:
+            return base.strip(), spice
+    return name.strip(), None
+
+
+def resolve_order_item(name: str) -> Tuple[Optional[MenuItem], str]:
+    """
+    Resolve an order line's name against the catalog.
+
+    Args:
+        name: Name as emitted by the model, optionally with ' - <spice>'
+
+    Returns:
+        (matched MenuItem or None, canonical line name including spice level
+        when the item takes one; the original name if unmatched)
+    """
+    text, spice = split_spice_level(name)
+    item = get_menu_index().lookup(text)
+    if item is None:
+        return None, name
+    if spice and item.needs_spice:
+        return item, f"{item.name} - {spice}"
+    return item, item.name
+
+
+def render_menu_markdown() -> str:
+    """Render the menu as the markdown section used in the prompt."""
+    lines = []
+    for category, entries in _MENU_DATA:
+        lines.append(f"## {category}")
+        for name, price in entries:
+            lines.append(f"- {name} (${price:.2f})")
+        lines.append("")
+    return "\n".join(lines).rstrip("\n")
+
+
+# Singleton index (built once per process)
+_menu_index = None
+
+
+def get_menu_index() -> MenuIndex:
+    """
+    Get or build the singleton menu index.
+
+    Returns:
+        MenuIndex over MENU_ITEMS
+    """
+    global _menu_index
+    if _menu_index is None:
+        _menu_index = MenuIndex(MENU_ITEMS)
+    return _menu_index
+
+
+def _format_item(item: MenuItem) -> str:
+    """One-line description of an item for spoken answers."""
+    spice = "ask spice level" if item.needs_spice else "no spice level"
+    return f"{item.name} ${item.price:.2f} ({spice})"
+
+
+def answer_menu_query(query: str) -> str:
+    """
+    Answer a menu, price or spice-eligibility question from the catalog.
+
+    Args:
+        query: A dish name, a category (e.g. 'veg biryanis'), or 'menu' / 'categories'
+
+    Returns:
+        Short plain-text answer for the model to relay
+    """
+    index = get_menu_index()
+    text = (query or "").strip()
+    normalized = normalize_name(text)
+
+    if normalized in ("", "menu", "full menu", "categories", "everything", "all"):
+        return "; ".join(
+            f"{category.title()}: {', '.join(item.name for item in index.in_category(category))}"
+            for category in CATEGORIES
+        )
+
+    for category in CATEGORIES:
+        category_key = normalize_name(category)
+        if normalized in (category_key, category_key.rstrip("s"), category_key.replace("-", " ")):
+            return "; ".join(_format_item(item) for item in index.in_category(category))
+
+    item_text, _ = split_spice_level(text)
+    item = index.lookup(item_text)
+    if item is not None:
+        return _format_item(item)
+
+    # Partial names like "paneer" or "biryani" -> every item containing the words
+    words = set(normalized.split())
+    matches = [item for item in index.items if words and words <= set(normalize_name(item.name).split())]
+    if matches:
+        return "; ".join(_format_item(item) for item in matches)
+
+    return f"'{query}' is not on the menu. Categories: {', '.join(c.title() for c in CATEGORIES)}."
@@ -0,0 +1,217 @@
+# Order Timestamps and Daily Rollups
+#
+# Orders carry a UTC BSON date in created_at plus the restaurant-local
+# business_day ("YYYY-MM-DD") and business_hour (0-23), so date-range queries
+# use the created_at / business_day indexes instead of comparing strings.
+#
+# Every saved order also increments one document per business day in the
+# "order_rollups" collection:
+#
+#   {_id: "2026-10-18", timezone, orders, revenue,
+#    hours: {"19": {orders, revenue}, ...},
+#    items: {"Lamb Biryani": {quantity, revenue}, ...}, updated_at}
+#
+# so an end-of-day report reads one document instead of scanning orders.
+#
+# Existing orders (ISO-string created_at) are converted and the rollups
+# rebuilt with:  python order_rollups.py --backfill
+# The rebuild goes into a scratch collection that is renamed over
+# order_rollups, and it refuses to run while orders are still arriving.
+import os
+import sys
+import argparse
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+from typing import Dict, Any, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from customer_profiles import mongo_field_key
+
+# Load environment variables
+load_dotenv()
+
+# Timezone the restaurant's business day is counted in
+RESTAURANT_TIMEZONE = ZoneInfo(os.getenv("RESTAURANT_TIMEZONE", "Asia/Kolkata"))
+# The backfill refuses to run if an order was saved within this many seconds
+BACKFILL_QUIET_SECONDS = float(os.getenv("BACKFILL_QUIET_SECONDS", "300"))
+
+
+def business_time(created_at: datetime) -> Tuple[str, int]:
+    """
+    Restaurant-local business day and hour for a timestamp.
+
+    Args:
+        created_at: Timezone-aware datetime (naive values are taken as UTC,
+            which is how pymongo returns BSON dates)
+
+    Returns:
+        ("YYYY-MM-DD", hour)
+    """
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    local = created_at.astimezone(RESTAURANT_TIMEZONE)
+    return local.strftime("%Y-%m-%d"), local.hour
+
+
+def order_timestamps(now: datetime = None) -> Dict[str, Any]:
+    """created_at (UTC), business_day and business_hour fields for a new order."""
+    now = now or datetime.now(timezone.utc)
+    business_day, business_hour = business_time(now)
+    return {"created_at": now, "business_day": business_day, "business_hour": business_hour}
+
+
+def order_revenue(items: List[Dict[str, Any]]) -> float:
+    return round(sum((item.get("price") or 0) * (item.get("quantity") or 1) for item in items), 2)
+
+
+def build_rollup_update(order: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the upsert that adds an order to its business day's rollup.
+
+    Args:
+        order: Saved order (with business_day / business_hour)
+
+    Returns:
+        Mongo update document for the order_rollups upsert
+    """
+    items = order.get("items", [])
+    revenue = order_revenue(items)
+    hour = f"hours.{order['business_hour']:02d}"
+    inc: Dict[str, float] = {
+        "orders": 1,
+        "revenue": revenue,
+        f"{hour}.orders": 1,
+        f"{hour}.revenue": revenue,
+    }
+    for item in items:
+        if not item.get("name"):
+            continue
+        key = f"items.{mongo_field_key(item['name'])}"
+        quantity = item.get("quantity") or 1
+        inc[f"{key}.quantity"] = inc.get(f"{key}.quantity", 0) + quantity
+        inc[f"{key}.revenue"] = round(inc.get(f"{key}.revenue", 0) + (item.get("price") or 0) * quantity, 2)
+    return {
+        "$inc": inc,
+        "$set": {"updated_at": datetime.now(timezone.utc)},
+        "$setOnInsert": {"timezone": RESTAURANT_TIMEZONE.key},
+    }
+
+
+def _parse_legacy_created_at(value: Any) -> Optional[datetime]:
+    """Old orders stored datetime.now().isoformat() - server-local time, no offset."""
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    # Naive values are interpreted in this machine's local timezone
+    return parsed.astimezone(timezone.utc)
+
+
+def backfill_blockers(orders_collection, now: datetime = None) -> List[str]:
+    """
+    Reasons the rollups cannot be rebuilt safely right now (empty when it is safe).
+
+    Increments applied to order_rollups while the rebuild runs would be lost
+    when the rebuilt collection replaces it, so the rebuild needs a quiet
+    period: no unreplayed outbox entries here and no recently saved orders.
+    """
+    from outbox import OUTBOX_DIR, OrderOutbox, _parse_journal_name
+
+    blockers = []
+    if os.path.isdir(OUTBOX_DIR):
+        pending = sum(
+            len(OrderOutbox(os.path.join(OUTBOX_DIR, filename)).pending())
+            for filename in os.listdir(OUTBOX_DIR)
+            if _parse_journal_name(filename) is not None
+        )
+        if pending:
+            blockers.append(f"{pending} order(s) waiting in the outbox ({OUTBOX_DIR})")
+    now = now or datetime.now(timezone.utc)
+    latest = orders_collection.find_one({"created_at": {"$type": "date"}}, {"created_at": 1}, sort=[("created_at", -1)])
+    if latest is not None:
+        age = (now - latest["created_at"].replace(tzinfo=timezone.utc)).total_seconds()
+        if age < BACKFILL_QUIET_SECONDS:
+            blockers.append(f"an order was saved {age:.0f}s ago (calls may be in progress)")
+    return blockers
+
+
+def backfill(orders_collection, rollups_collection) -> Dict[str, int]:
+    """
+    Convert string created_at values to UTC dates, add business_day/hour, and rebuild all rollups.
+
+    Rollups are recomputed into a scratch collection that then replaces
+    order_rollups in one rename, so readers never see them empty or partial.
+    Check backfill_blockers() first: increments made during the rebuild are lost.
+
+    Returns:
+        {"converted": n, "days": n}
+    """
+    from pymongo import UpdateOne
+
+    converted = 0
+    updates = []
+    for order in orders_collection.find({"created_at": {"$type": "string"}}, {"created_at": 1}):
+        created_at = _parse_legacy_created_at(order["created_at"])
+        if created_at is None:
+            continue
+        business_day, business_hour = business_time(created_at)
+        updates.append(UpdateOne({"_id": order["_id"]}, {"$set": {
+            "created_at": created_at, "business_day": business_day, "business_hour": business_hour,
+        }}))
+        if len(updates) >= 500:
+            converted += orders_collection.bulk_write(updates, ordered=False).modified_count
+            updates = []
+    if updates:
+        converted += orders_collection.bulk_write(updates, ordered=False).modified_count
+
+    # Rebuild from scratch so rollups match the orders exactly
+    scratch = rollups_collection.database[f"{rollups_collection.name}_rebuild"]
+    scratch.drop()
+    days = set()
+    updates = []
+    for order in orders_collection.find({"business_day": {"$exists": True}}, {"items": 1, "business_day": 1, "business_hour": 1}):
+        days.add(order["business_day"])
+        updates.append(UpdateOne({"_id": order["business_day"]}, build_rollup_update(order), upsert=True))
+        if len(updates) >= 500:
+            scratch.bulk_write(updates, ordered=True)
+            updates = []
+    if updates:
+        scratch.bulk_write(updates, ordered=True)
+    if days:
+        scratch.rename(rollups_collection.name, dropTarget=True)
+    else:
+        rollups_collection.delete_many({})
+    return {"converted": converted, "days": len(days)}
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Order timestamp migration and rollup maintenance")
+    parser.add_argument("--backfill", action="store_true", help="Convert legacy created_at strings and rebuild rollups (run with no calls in progress)")
+    parser.add_argument("--force", action="store_true", help="Run --backfill even while orders are still arriving")
+    parser.add_argument("--day", help="Print the rollup for a business day (YYYY-MM-DD)")
+    args = parser.parse_args(argv)
+
+    import db
+
+    if args.backfill:
+        blockers = backfill_blockers(db.orders_collection)
+        if blockers and not args.force:
+            for reason in blockers:
+                print(f"Refusing to rebuild rollups: {reason}", file=sys.stderr)
+            print("Wait until no calls are in progress, or pass --force.", file=sys.stderr)
+            return 1
+        result = backfill(db.orders_collection, db.rollups_collection)
+        print(f"Converted {result['converted']} order(s); rebuilt rollups for {result['days']} day(s)")
+    if args.day:
+        print(db.rollups_collection.find_one({"_id": args.day}))
+    if not (args.backfill or args.day):
+        parser.print_help()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,339 @@
+# Durable Order Outbox Module
+#
+# Orders are appended to a local, fsync'd journal *before* the agent tells the
+# caller the order was placed. A replay worker drains anything that did not
+# reach MongoDB (worker crash, Mongo outage, lost task) with retries. The
+# same loop runs an optional sweep after each pass (db.py uses it to re-queue
+# Clover syncs a dead or draining process never finished).
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Callable, Awaitable
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Logger
+log = logging.getLogger("realtime_restaurant_agent")
+
+# ---------- Outbox settings ----------
+OUTBOX_DIR = os.getenv("OUTBOX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "outbox"))
+# Entries younger than this are still being saved by the live call path
+OUTBOX_REPLAY_GRACE = float(os.getenv("OUTBOX_REPLAY_GRACE", "30"))
+OUTBOX_REPLAY_INTERVAL = float(os.getenv("OUTBOX_REPLAY_INTERVAL", "15"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_RETRY_BASE_DELAY = float(os.getenv("OUTBOX_RETRY_BASE_DELAY", "0.5"))
+OUTBOX_RETRY_MAX_DELAY = float(os.getenv("OUTBOX_RETRY_MAX_DELAY", "10"))
+
+
+class OrderOutbox:
+    """
+    Append-only JSON-lines journal of orders awaiting persistence.
+
+    Each line is either an ``order`` record or an ``ack`` record that marks
+    an earlier order as delivered. Every append is flushed and fsync'd.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize the journal.
+
+        Args:
+            path: Journal file path (created on first append)
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _append_sync(self, record: Dict[str, Any]):
+        """Append one record and fsync it to disk."""
+        line = json.dumps(record, separators=(",", ":"), default=str) + "\n"
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    async def append(self, order: Dict[str, Any]) -> str:
+        """
+        Durably record an order.
+
+        Args:
+            order: Keyword arguments for DatabaseDriver.create_order_with_clover
+
+        Returns:
+            Outbox entry ID (stored on the Mongo document as ``outbox_id``)
+        """
+        entry_id = uuid.uuid4().hex
+        record = {"type": "order", "id": entry_id, "ts": time.time(), "order": order}
+        await asyncio.get_running_loop().run_in_executor(None, self._append_sync, record)
+        return entry_id
+
+    async def ack(self, entry_id: str):
+        """Mark an order as delivered to MongoDB."""
+        record = {"type": "ack", "id": entry_id, "ts": time.time()}
+        await asyncio.get_running_loop().run_in_executor(None, self._append_sync, record)
+
+    def _pending_locked(self) -> List[Dict[str, Any]]:
+        """pending() body - the caller must hold self._lock."""
+        orders: Dict[str, Dict[str, Any]] = {}
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("type") == "order":
+                    orders[record["id"]] = record
+                elif record.get("type") == "ack":
+                    orders.pop(record.get("id"), None)
+        return list(orders.values())
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """
+        Read the journal and return order records that have no ack.
+
+        A torn final line (crash mid-write) is ignored.
+
+        Returns:
+            Pending order records in journal order
+        """
+        with self._lock:
+            return self._pending_locked()
+
+    def compact(self):
+        """Rewrite the journal with only pending orders (removes it when empty)."""
+        # Read and rewrite under one hold of the lock, so an append that
+        # lands in between cannot be overwritten by the replacement file
+        with self._lock:
+            pending = self._pending_locked()
+            if not pending:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                return
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for record in pending:
+                    f.write(json.dumps(record, separators=(",", ":"), default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+    async def pending_async(self) -> List[Dict[str, Any]]:
+        """pending() on the default executor (keeps file I/O off the event loop)."""
+        return await asyncio.get_running_loop().run_in_executor(None, self.pending)
+
+    async def compact_async(self):
+        """compact() on the default executor (it fsyncs)."""
+        await asyncio.get_running_loop().run_in_executor(None, self.compact)
+
+
+def _parse_journal_name(filename: str) -> Optional[tuple]:
+    """
+    Parse a journal file name.
+
+    Returns:
+        (origin pid, owner pid) for orders-<pid>.jsonl and
+        orders-<pid>.claimed-<owner>.jsonl, or None for other files
+    """
+    if not (filename.startswith("orders-") and filename.endswith(".jsonl")):
+        return None
+    stem = filename[len("orders-"):-len(".jsonl")]
+    origin, _, owner = stem.partition(".claimed-")
+    try:
+        origin_pid = int(origin)
+        return origin_pid, int(owner) if owner else origin_pid
+    except ValueError:
+        return None
+
+
+def _pid_alive(pid: int) -> bool:
+    """Check whether a process with the given PID is still running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class OutboxReplayer:
+    """
+    Background worker that drains pending outbox entries.
+
+    Replays this process's entries once they are older than the grace
+    window, and every entry in journals left behind by dead processes.
+    """
+
+    def __init__(
+        self,
+        deliver: Callable[[str, Dict[str, Any]], Awaitable[bool]],
+        outbox_dir: str = None,
+        sweep: Optional[Callable[[], Awaitable[Any]]] = None
+    ):
+        """
+        Initialize the replayer.
+
+        Args:
+            deliver: Async callable(entry_id, order) returning True once persisted
+            outbox_dir: Directory holding journals (defaults to OUTBOX_DIR)
+            sweep: Optional async callable run after every replay pass
+        """
+        self.deliver = deliver
+        self.outbox_dir = outbox_dir or OUTBOX_DIR
+        self.sweep = sweep
+        self._task: Optional[asyncio.Task] = None
+
+    def _journals(self) -> List[OrderOutbox]:
+        """
+        List journals this process is allowed to replay.
+
+        A journal left by a dead process is first claimed by renaming it to
+        orders-<pid>.claimed-<own pid>.jsonl. The rename is atomic, so when
+        several processes find the same dead journal only one of them
+        replays it. A claimed journal whose claimer died is claimed again.
+        """
+        if not os.path.isdir(self.outbox_dir):
+            return []
+        journals = []
+        own_pid = os.getpid()
+        for filename in sorted(os.listdir(self.outbox_dir)):
+            parsed = _parse_journal_name(filename)
+            if parsed is None:
+                continue
+            origin_pid, owner_pid = parsed
+            path = os.path.join(self.outbox_dir, filename)
+            if filename == os.path.basename(get_order_outbox().path):
+                journals.append(get_order_outbox())
+            elif owner_pid == own_pid:
+                journals.append(OrderOutbox(path))
+            elif not _pid_alive(owner_pid):
+                claimed = os.path.join(self.outbox_dir, f"orders-{origin_pid}.claimed-{own_pid}.jsonl")
+                try:
+                    os.rename(path, claimed)
+                except FileNotFoundError:
+                    # Another process claimed it first
+                    continue
+                log.info(f"📥 Claimed outbox journal {filename} for replay")
+                journals.append(OrderOutbox(claimed))
+        return journals
+
+    async def _deliver_with_retry(self, record: Dict[str, Any]) -> bool:
+        """Try to deliver one entry with exponential backoff and jitter."""
+        for attempt in range(OUTBOX_MAX_ATTEMPTS):
+            try:
+                if await self.deliver(record["id"], record["order"]):
+                    return True
+            except Exception as e:
+                log.warning(f"Outbox replay attempt {attempt + 1} failed for {record['id']}: {e}")
+            delay = min(OUTBOX_RETRY_MAX_DELAY, OUTBOX_RETRY_BASE_DELAY * (2 ** attempt))
+            await asyncio.sleep(random.uniform(0, delay))
+        return False
+
+    async def replay_once(self) -> int:
+        """
+        Run a single replay pass over all eligible journals.
+
+        Returns:
+            Number of entries delivered in this pass
+        """
+        delivered = 0
+        now = time.time()
+        own_path = get_order_outbox().path
+        for journal in self._journals():
+            is_own = journal.path == own_path
+            for record in await journal.pending_async():
+                if is_own and now - record.get("ts", now) < OUTBOX_REPLAY_GRACE:
+                    continue
+                if await self._deliver_with_retry(record):
+                    await journal.ack(record["id"])
+                    delivered += 1
+                else:
+                    log.error(f"Outbox entry {record['id']} still pending after {OUTBOX_MAX_ATTEMPTS} attempts")
+            await journal.compact_async()
+        if delivered:
+            log.info(f"✅ Outbox replay delivered {delivered} order(s)")
+        return delivered
+
+    async def run(self):
+        """Replay forever at OUTBOX_REPLAY_INTERVAL until cancelled."""
+        while True:
+            try:
+                await self.replay_once()
+                if self.sweep is not None:
+                    await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error(f"Outbox replay pass failed: {e}")
+            await asyncio.sleep(OUTBOX_REPLAY_INTERVAL)
+
+    def start(self):
+        """Start the replay loop on the running event loop (idempotent)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Cancel the replay loop."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+
+# Per-process instances
+_order_outbox = None
+_outbox_replayer = None
+
+
+def get_order_outbox() -> OrderOutbox:
+    """
+    Get or create this process's outbox journal.
+
+    Returns:
+        OrderOutbox writing to OUTBOX_DIR/orders-<pid>.jsonl
+    """
+    global _order_outbox
+    path = os.path.join(OUTBOX_DIR, f"orders-{os.getpid()}.jsonl")
+    if _order_outbox is None or _order_outbox.path != path:
+        _order_outbox = OrderOutbox(path)
+    return _order_outbox
+
+
+def start_outbox_replayer(
+    deliver: Callable[[str, Dict[str, Any]], Awaitable[bool]],
+    sweep: Optional[Callable[[], Awaitable[Any]]] = None
+) -> OutboxReplayer:
+    """
+    Start the per-process replay worker if it is not already running.
+
+    Args:
+        deliver: Async callable(entry_id, order) returning True once persisted
+        sweep: Optional async callable run after every replay pass
+
+    Returns:
+        The running OutboxReplayer
+    """
+    global _outbox_replayer
+    if _outbox_replayer is None:
+        _outbox_replayer = OutboxReplayer(deliver, sweep=sweep)
+    _outbox_replayer.start()
+    return _outbox_replayer
+
+
+async def stop_outbox_replayer():
+    """Stop the per-process replay worker, if running."""
+    if _outbox_replayer is not None:
+        await _outbox_replayer.stop()
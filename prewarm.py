@@ -0,0 +1,152 @@
+# Worker Prewarm
+#
+# Runs once per job process, before it accepts a call (WorkerOptions.prewarm_fnc),
+# so the first caller on a fresh process does not pay for connecting to Mongo,
+# creating indexes, compiling prompts, building the menu matchers or reading
+# the noise-cancellation model from disk. Each step is timed and reported.
+import os
+import time
+import asyncio
+import logging
+import aiohttp
+from typing import Dict, Any, Callable, Optional
+from dotenv import load_dotenv
+
+from latency_metrics import latency_registry
+
+# Load environment variables
+load_dotenv()
+
+# Logger
+log = logging.getLogger("realtime_restaurant_agent")
+
+# Timeout for each HTTP pool warm-up request (seconds)
+PREWARM_HTTP_TIMEOUT = float(os.getenv("PREWARM_HTTP_TIMEOUT", "3"))
+
+PREWARM_STEP_SECONDS = "agent_prewarm_step_seconds"
+latency_registry.describe(PREWARM_STEP_SECONDS, "Worker prewarm time per resource")
+
+
+def _timed_step(name: str, fn: Callable[[], Any], timings: Dict[str, Optional[float]]) -> Any:
+    """Run one warm-up step, recording its duration (None if it failed)."""
+    started = time.perf_counter()
+    try:
+        result = fn()
+    except Exception as e:
+        timings[name] = None
+        log.warning(f"⚠️ Prewarm step {name} failed: {e}")
+        return None
+    elapsed = time.perf_counter() - started
+    timings[name] = elapsed
+    latency_registry.observe(PREWARM_STEP_SECONDS, elapsed, step=name)
+    return result
+
+
+def _format_timings(timings: Dict[str, Optional[float]]) -> str:
+    return ", ".join(
+        f"{name}={elapsed * 1000:.0f}ms" if elapsed is not None else f"{name}=failed"
+        for name, elapsed in timings.items()
+    )
+
+
+def _read_noise_cancellation_model() -> Any:
+    """Create the BVC options and read the model file so it is in the page cache."""
+    from livekit.plugins import noise_cancellation
+    from livekit.plugins.noise_cancellation.plugin import model_path
+
+    with open(model_path("bvc"), "rb") as f:
+        while f.read(1 << 20):
+            pass
+    return noise_cancellation.BVC()
+
+
+def warm_process(userdata: Dict[str, Any], prompt_variant: str) -> Dict[str, Optional[float]]:
+    """
+    Warm every per-process resource a call needs.
+
+    Stores reusable objects in userdata ("db_driver", "noise_cancellation",
+    "prewarm_timings") for the entrypoint to pick up.
+
+    Args:
+        userdata: JobProcess.userdata
+        prompt_variant: PROMPT_VARIANT the agent will use
+
+    Returns:
+        {step: seconds or None if the step failed}
+    """
+    timings: Dict[str, Optional[float]] = {}
+    started = time.perf_counter()
+
+    import db
+    from db import DatabaseDriver, _get_db_executor
+    from prompts import get_static_instructions
+    from menu import get_menu_index
+    from intents import get_intent_engine
+    from clover import get_clover_client
+    from twilio_client import get_twilio_client
+
+    _timed_step("mongo_ping", lambda: db.client.admin.command("ping"), timings)
+    driver = DatabaseDriver()
+    # Unreachable Mongo: leave index creation to the first order rather than
+    # spend a second server-selection timeout inside the prewarm window
+    if timings["mongo_ping"] is not None:
+        _timed_step("mongo_indexes", driver._ensure_indexes, timings)
+    userdata["db_driver"] = driver
+    _timed_step("db_executor", _get_db_executor, timings)
+
+    _timed_step("prompts", lambda: get_static_instructions(prompt_variant), timings)
+    _timed_step("menu_index", get_menu_index, timings)
+    _timed_step("intent_engine", get_intent_engine, timings)
+
+    # Clients only - their HTTP pools are bound to the job's event loop and
+    # are opened by warm_http_pools() once the job starts
+    if db.CLOVER_ENABLED:
+        _timed_step("clover_client", get_clover_client, timings)
+    if os.getenv("TWILIO_ACCOUNT_SID") and os.getenv("TWILIO_AUTH_TOKEN"):
+        _timed_step("twilio_client", get_twilio_client, timings)
+
+    userdata["noise_cancellation"] = _timed_step("noise_cancellation", _read_noise_cancellation_model, timings)
+
+    userdata["prewarm_timings"] = timings
+    log.info(f"🔥 Prewarm finished in {(time.perf_counter() - started) * 1000:.0f}ms: {_format_timings(timings)}")
+    return timings
+
+
+async def _open_pool(name: str, client, url: str, timings: Dict[str, Optional[float]]):
+    started = time.perf_counter()
+    try:
+        session = client._get_session()
+        async with session.head(url, timeout=aiohttp.ClientTimeout(total=PREWARM_HTTP_TIMEOUT)) as response:
+            await response.read()
+    except Exception as e:
+        timings[name] = None
+        log.debug(f"HTTP pool warm-up for {name} failed: {e}")
+        return
+    timings[name] = time.perf_counter() - started
+    latency_registry.observe(PREWARM_STEP_SECONDS, timings[name], step=name)
+
+
+async def warm_http_pools() -> Dict[str, Optional[float]]:
+    """
+    Open the Clover and Twilio keep-alive connections on the job's event loop.
+
+    One cheap HEAD request per API host does DNS, TCP and TLS up front, so the
+    order sync and the hangup reuse a ready connection. Clients that were not
+    created during prewarm (disabled or missing credentials) are skipped.
+
+    Returns:
+        {pool: seconds or None if the warm-up request failed}
+    """
+    import clover
+    import twilio_client
+
+    timings: Dict[str, Optional[float]] = {}
+    warmups = []
+    if clover._clover_client is not None:
+        warmups.append(_open_pool("clover_pool", clover._clover_client, clover._clover_client.base_url, timings))
+    if twilio_client._twilio_client is not None:
+        warmups.append(_open_pool("twilio_pool", twilio_client._twilio_client, twilio_client._twilio_client.base_url, timings))
+    if warmups:
+        await asyncio.gather(*warmups)
+        log.info(f"🔥 HTTP pools warmed: {_format_timings(timings)}")
+    return timings
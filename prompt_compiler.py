@@ -0,0 +1,195 @@
+# Prompt Compiler Module
+#
+# Builds the agent instructions from named sections, reports the token cost of
+# every section, flags content that is repeated across sections, and enforces
+# a token budget. Prompt size is paid on every realtime session, so this runs
+# as a build step:
+#
+#     python prompt_compiler.py            # report, fail if over budget
+#     python prompt_compiler.py --strict   # also fail on duplicate content
+import os
+import re
+import sys
+import math
+import logging
+from dataclasses import dataclass, field
+from typing import List, Dict, Tuple, Optional
+
+# Logger
+log = logging.getLogger("realtime_restaurant_agent")
+
+# Optional exact tokenizer - falls back to a character estimate
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _ENCODING = None
+
+# ---------- Budget settings ----------
+# Token budget for the combined instructions sent to each realtime session
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "7000"))
+# Lines shorter than this are too generic to count as duplicated content
+PROMPT_DUPLICATE_MIN_CHARS = int(os.getenv("PROMPT_DUPLICATE_MIN_CHARS", "40"))
+
+
+class PromptBudgetExceeded(Exception):
+    """Raised when compiled instructions exceed the token budget."""
+
+
+@dataclass(frozen=True)
+class PromptSection:
+    """A named block of prompt text."""
+    name: str
+    text: str
+
+
+@dataclass
+class CompiledPrompt:
+    """Result of compiling a list of sections."""
+    name: str
+    text: str
+    sections: List[PromptSection]
+    section_tokens: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def tokens(self) -> int:
+        return count_tokens(self.text)
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count tokens in text.
+
+    Uses tiktoken (o200k_base, the realtime models' encoding) when installed,
+    otherwise estimates ~4 characters per token.
+    """
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def compile_prompt(name: str, sections: List[PromptSection]) -> CompiledPrompt:
+    """
+    Join sections into one prompt string.
+
+    Args:
+        name: Prompt name used in reports (e.g. "AGENT_INSTRUCTION")
+        sections: Ordered sections; each is stripped and separated by a blank line
+
+    Returns:
+        CompiledPrompt with the text and per-section token counts
+    """
+    seen = set()
+    for section in sections:
+        if section.name in seen:
+            raise ValueError(f"Duplicate section name in {name}: {section.name}")
+        seen.add(section.name)
+
+    text = "\n" + "\n\n".join(section.text.strip("\n") for section in sections) + "\n"
+    return CompiledPrompt(
+        name=name,
+        text=text,
+        sections=sections,
+        section_tokens={section.name: count_tokens(section.text) for section in sections},
+    )
+
+
+def _normalize_line(line: str) -> str:
+    """Normalize a line for duplicate detection (markdown and case insensitive)."""
+    line = re.sub(r"^[\s\-\*\d\.\)]+", "", line)
+    line = line.replace("**", "").replace("`", "")
+    return " ".join(line.lower().split())
+
+
+def find_duplicates(prompts: List[CompiledPrompt]) -> List[Tuple[str, List[str]]]:
+    """
+    Find lines whose content appears more than once across the given prompts.
+
+    Headings and short lines are ignored.
+
+    Returns:
+        [(line, ["PROMPT.section", ...]), ...] for every repeated line
+    """
+    locations: Dict[str, List[str]] = {}
+    originals: Dict[str, str] = {}
+    for prompt in prompts:
+        for section in prompt.sections:
+            for line in section.text.splitlines():
+                if line.lstrip().startswith("#"):
+                    continue
+                key = _normalize_line(line)
+                if len(key) < PROMPT_DUPLICATE_MIN_CHARS:
+                    continue
+                locations.setdefault(key, []).append(f"{prompt.name}.{section.name}")
+                originals.setdefault(key, line.strip())
+    return [(originals[key], where) for key, where in locations.items() if len(where) > 1]
+
+
+def check_budget(prompts: List[CompiledPrompt], budget: Optional[int] = None) -> int:
+    """
+    Enforce the token budget over the combined prompts.
+
+    Args:
+        prompts: Prompts that are sent together
+        budget: Token budget (defaults to PROMPT_TOKEN_BUDGET)
+
+    Returns:
+        Total token count
+
+    Raises:
+        PromptBudgetExceeded: If the total exceeds the budget
+    """
+    budget = PROMPT_TOKEN_BUDGET if budget is None else budget
+    total = sum(prompt.tokens for prompt in prompts)
+    if total > budget:
+        raise PromptBudgetExceeded(f"Prompt uses {total} tokens, budget is {budget}")
+    return total
+
+
+def format_report(prompts: List[CompiledPrompt], budget: Optional[int] = None) -> str:
+    """Human-readable per-section token report with duplicate content."""
+    budget = PROMPT_TOKEN_BUDGET if budget is None else budget
+    tokenizer = "tiktoken o200k_base" if _ENCODING is not None else "estimate, ~4 chars/token"
+    lines = [f"Prompt token report ({tokenizer})", ""]
+    total = 0
+    for prompt in prompts:
+        lines.append(f"{prompt.name}: {prompt.tokens} tokens, {len(prompt.text)} chars")
+        for section in prompt.sections:
+            lines.append(f"  {section.name:<32} {prompt.section_tokens[section.name]:>6}")
+        total += prompt.tokens
+        lines.append("")
+    lines.append(f"TOTAL: {total} / {budget} tokens ({'OK' if total <= budget else 'OVER BUDGET'})")
+
+    duplicates = find_duplicates(prompts)
+    if duplicates:
+        lines.append("")
+        lines.append(f"Duplicate content ({len(duplicates)} line(s)):")
+        for line, where in duplicates:
+            lines.append(f"  {line[:80]}")
+            lines.append(f"    in: {', '.join(where)}")
+    return "\n".join(lines)
+
+
+def main(argv: List[str] = None) -> int:
+    """Build step entry point - prints a report per prompt variant and returns an exit code."""
+    argv = sys.argv[1:] if argv is None else argv
+    from prompts import PROMPT_VARIANTS
+
+    exit_code = 0
+    for variant, prompts in PROMPT_VARIANTS.items():
+        print(f"===== PROMPT_VARIANT={variant} =====")
+        print(format_report(prompts))
+        try:
+            check_budget(prompts)
+        except PromptBudgetExceeded as e:
+            print(f"FAILED: {e}")
+            exit_code = 1
+        if "--strict" in argv and find_duplicates(prompts):
+            print("FAILED: duplicate prompt content (--strict)")
+            exit_code = 1
+        print()
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+# Background Task Supervisor
+#
+# Fire-and-forget work (order saves, the hangup sequence, the greeting,
+# instruction refreshes, HTTP pool warm-up) used to be started with bare
+# asyncio.create_task. The loop only keeps weak references to tasks, so an
+# unreferenced task can be garbage-collected mid-flight, and its exception is
+# only reported, if at all, as "Task exception was never retrieved".
+#
+# One TaskSupervisor per call:
+#
+#   - holds a strong reference to every task until it finishes
+#   - enforces an optional per-task deadline (the task is cancelled and
+#     counted as timed out when it passes)
+#   - logs failures with their traceback as soon as they happen
+#   - on aclose() gives in-flight tasks a short grace period, then cancels
+#     the stragglers so nothing outlives the call
+#   - exports in-flight / outcome counts and per-task run time through the
+#     latency registry
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, Any, Optional, Coroutine, Set
+from dotenv import load_dotenv
+
+from latency_metrics import latency_registry
+
+# Load environment variables
+load_dotenv()
+
+# Logger
+log = logging.getLogger("realtime_restaurant_agent")
+
+# Seconds in-flight tasks get to finish when the call ends before being cancelled
+TASK_SHUTDOWN_GRACE = float(os.getenv("TASK_SHUTDOWN_GRACE", "3"))
+
+# Task outcomes
+OK = "ok"
+FAILED = "failed"
+TIMEOUT = "timeout"
+CANCELLED = "cancelled"
+
+BACKGROUND_TASK_SECONDS = "agent_background_task_seconds"
+BACKGROUND_TASKS = "agent_background_tasks_total"
+BACKGROUND_TASKS_IN_FLIGHT = "agent_background_tasks_in_flight"
+latency_registry.describe(BACKGROUND_TASK_SECONDS, "Background task run time")
+latency_registry.describe(BACKGROUND_TASKS, "Finished background tasks by outcome")
+latency_registry.describe(BACKGROUND_TASKS_IN_FLIGHT, "Background tasks currently running")
+
+
+class TaskSupervisor:
+    """Owns the background tasks of one call."""
+
+    def __init__(self, labels: Dict[str, str] = None):
+        """
+        Initialize the supervisor.
+
+        Args:
+            labels: Metric labels added to every series (e.g. call_id, worker)
+        """
+        self.labels = labels or {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._deadline_hit: Set[asyncio.Task] = set()
+        self._daemons: Set[asyncio.Task] = set()
+        self._closed = False
+        self.outcomes: Dict[str, Dict[str, int]] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    def spawn(self, coro: Coroutine, name: str, timeout: float = None, daemon: bool = False) -> Optional[asyncio.Task]:
+        """
+        Run a coroutine in the background under supervision.
+
+        Args:
+            coro: Coroutine to run
+            name: Task name (metric label and log prefix)
+            timeout: Cancel the task after this many seconds (None = no deadline)
+            daemon: Runs until cancelled (e.g. a periodic export) - aclose() cancels it without waiting
+
+        Returns:
+            The task, or None if the supervisor is already closed
+        """
+        if self._closed:
+            coro.close()
+            log.warning(f"⚠️ Background task {name} not started - call is shutting down")
+            return None
+        task = asyncio.create_task(coro, name=name)
+        started = time.perf_counter()
+        self._tasks.add(task)
+        if daemon:
+            self._daemons.add(task)
+        self._publish_in_flight()
+
+        timer = None
+        if timeout is not None:
+            timer = asyncio.get_running_loop().call_later(timeout, self._expire, task)
+        task.add_done_callback(lambda t: self._on_done(t, name, started, timeout, timer))
+        return task
+
+    def _expire(self, task: asyncio.Task):
+        if not task.done():
+            self._deadline_hit.add(task)
+            task.cancel()
+
+    def _on_done(self, task: asyncio.Task, name: str, started: float, timeout: Optional[float], timer):
+        if timer is not None:
+            timer.cancel()
+        self._tasks.discard(task)
+        self._daemons.discard(task)
+        elapsed = time.perf_counter() - started
+
+        if task in self._deadline_hit:
+            self._deadline_hit.discard(task)
+            outcome = TIMEOUT
+            log.warning(f"⏰ Background task {name} cancelled after its {timeout:g}s deadline")
+        elif task.cancelled():
+            outcome = CANCELLED
+        elif task.exception() is not None:
+            outcome = FAILED
+            error = task.exception()
+            log.error(f"❌ Background task {name} failed: {error!r}", exc_info=error)
+        else:
+            outcome = OK
+
+        counts = self.outcomes.setdefault(name, {})
+        counts[outcome] = counts.get(outcome, 0) + 1
+        latency_registry.increment(BACKGROUND_TASKS, task=name, outcome=outcome, **self.labels)
+        latency_registry.observe(BACKGROUND_TASK_SECONDS, elapsed, task=name, **self.labels)
+        self._publish_in_flight()
+
+    def _publish_in_flight(self):
+        latency_registry.set_gauge(BACKGROUND_TASKS_IN_FLIGHT, len(self._tasks), **self.labels)
+
+    async def aclose(self, grace: float = None):
+        """
+        Stop accepting tasks, wait up to grace seconds for in-flight ones, then cancel the rest.
+
+        Daemon tasks are cancelled straight away.
+
+        Args:
+            grace: Seconds to wait before cancelling (defaults to TASK_SHUTDOWN_GRACE)
+        """
+        self._closed = True
+        grace = TASK_SHUTDOWN_GRACE if grace is None else grace
+        daemons = list(self._daemons)
+        for task in daemons:
+            task.cancel()
+        pending = [t for t in self._tasks if t is not asyncio.current_task() and t not in self._daemons]
+        if pending and grace > 0:
+            _, pending = await asyncio.wait(pending, timeout=grace)
+        if pending:
+            names = ", ".join(sorted(t.get_name() for t in pending))
+            log.warning(f"⚠️ Cancelling {len(pending)} background task(s) still running at call end: {names}")
+            for task in pending:
+                task.cancel()
+        await asyncio.gather(*pending, *daemons, return_exceptions=True)
+
+    def summary(self) -> Dict[str, Any]:
+        """Outcome counts per task name plus tasks still running."""
+        return {
+            "in_flight": sorted(t.get_name() for t in self._tasks),
+            "outcomes": {name: dict(counts) for name, counts in self.outcomes.items()},
+        }
@@ -0,0 +1,251 @@
+# Call Teardown Engine
+#
+# Ends a call by running independent teardown strategies concurrently under a
+# single deadline. Hang-up strategies are cancelled as soon as the SIP leg is
+# confirmed gone; strategies marked required are always given the remaining
+# time. Closing the session and ending the job happen after the engine
+# returns (RestaurantAgent._release_call), never alongside the hang-up. Every run records which strategy did what
+# and how long it took, so the strategy list can be pruned from real data.
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Callable, Awaitable
+from dotenv import load_dotenv
+
+from latency_metrics import latency_registry
+
+# Load environment variables
+load_dotenv()
+
+# Logger
+log = logging.getLogger("realtime_restaurant_agent")
+
+# ---------- Teardown settings ----------
+# Overall deadline (seconds) for the whole teardown, across all strategies
+TEARDOWN_DEADLINE = float(os.getenv("TEARDOWN_DEADLINE", "8"))
+
+# Strategy outcomes
+OK = "ok"
+UNAVAILABLE = "unavailable"
+ERROR = "error"
+CANCELLED = "cancelled"
+TIMEOUT = "timeout"
+
+TEARDOWN_STRATEGY_SECONDS = "agent_teardown_strategy_seconds"
+TEARDOWN_SECONDS = "agent_teardown_seconds"
+latency_registry.describe(TEARDOWN_STRATEGY_SECONDS, "Time spent in each call teardown strategy, by outcome")
+latency_registry.describe(TEARDOWN_SECONDS, "Start of teardown to SIP leg gone (or deadline)")
+
+
+class StrategyUnavailable(Exception):
+    """Raised by a strategy whose target API/attribute does not exist in this session."""
+
+
+@dataclass
+class TeardownStrategy:
+    """
+    One way of ending (part of) a call.
+
+    Attributes:
+        name: Stable name used in logs and metrics
+        run: Async callable; raise StrategyUnavailable if it does not apply
+        confirms_hangup: Success means the SIP leg is gone (e.g. Twilio call completed)
+        required: Keep running after the SIP leg is gone (frees local resources)
+    """
+    name: str
+    run: Callable[[], Awaitable[Any]]
+    confirms_hangup: bool = False
+    required: bool = False
+
+
+@dataclass
+class StrategyResult:
+    name: str
+    outcome: str
+    duration: float
+    error: Optional[str] = None
+
+
+@dataclass
+class TeardownReport:
+    results: List[StrategyResult] = field(default_factory=list)
+    elapsed: float = 0.0
+    sip_gone: bool = False
+    sip_gone_after: Optional[float] = None
+    confirmed_by: Optional[str] = None
+
+    def summary(self) -> str:
+        """One log line: outcome and duration per strategy."""
+        parts = ", ".join(f"{r.name}={r.outcome}({r.duration * 1000:.0f}ms)" for r in self.results)
+        gone = f"SIP gone after {self.sip_gone_after:.2f}s via {self.confirmed_by}" if self.sip_gone else "SIP leg NOT confirmed gone"
+        return f"{gone}; total {self.elapsed:.2f}s; {parts}"
+
+
+class TeardownStats:
+    """Process-wide per-strategy outcome counters (for pruning the strategy list)."""
+
+    def __init__(self):
+        self.runs = 0
+        self.confirmed = 0
+        self.outcomes: Dict[str, Dict[str, int]] = {}
+        self.confirmed_by: Dict[str, int] = {}
+
+    def record(self, report: TeardownReport):
+        self.runs += 1
+        if report.sip_gone:
+            self.confirmed += 1
+            self.confirmed_by[report.confirmed_by] = self.confirmed_by.get(report.confirmed_by, 0) + 1
+        for result in report.results:
+            counts = self.outcomes.setdefault(result.name, {})
+            counts[result.outcome] = counts.get(result.outcome, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a point-in-time copy of the counters."""
+        return {
+            "runs": self.runs,
+            "confirmed": self.confirmed,
+            "confirmed_by": dict(self.confirmed_by),
+            "outcomes": {name: dict(counts) for name, counts in self.outcomes.items()},
+        }
+
+
+teardown_stats = TeardownStats()
+
+
+class TeardownEngine:
+    """Runs teardown strategies concurrently under one deadline."""
+
+    def __init__(
+        self,
+        strategies: List[TeardownStrategy],
+        sip_gone: Callable[[], bool],
+        room=None,
+        deadline: float = None,
+        labels: Dict[str, str] = None
+    ):
+        """
+        Initialize the engine.
+
+        Args:
+            strategies: Strategies to run (names must be unique)
+            sip_gone: Returns True once no SIP participant is left in the room
+            room: rtc.Room to watch for participant_disconnected (optional)
+            deadline: Overall deadline in seconds (defaults to env var)
+            labels: Extra metric labels (e.g. call_id)
+        """
+        self.strategies = strategies
+        self._sip_gone = sip_gone
+        self.room = room
+        self.deadline = TEARDOWN_DEADLINE if deadline is None else deadline
+        self.labels = labels or {}
+
+    async def _run_strategy(self, strategy: TeardownStrategy, started: float) -> StrategyResult:
+        try:
+            await strategy.run()
+            return StrategyResult(strategy.name, OK, time.perf_counter() - started)
+        except StrategyUnavailable:
+            return StrategyResult(strategy.name, UNAVAILABLE, time.perf_counter() - started)
+        except Exception as e:
+            return StrategyResult(strategy.name, ERROR, time.perf_counter() - started, error=str(e) or type(e).__name__)
+
+    def _check_sip_gone(self) -> bool:
+        try:
+            return bool(self._sip_gone())
+        except Exception:
+            return False
+
+    async def run(self) -> TeardownReport:
+        """
+        Run all strategies and wait until the SIP leg is gone and the required
+        strategies have finished, or the deadline passes.
+
+        Returns:
+            TeardownReport with one result per strategy
+        """
+        report = TeardownReport()
+        started = time.perf_counter()
+        deadline_at = started + self.deadline
+        sip_event = asyncio.Event()
+
+        def _on_participant_disconnected(participant):
+            if self._check_sip_gone():
+                sip_event.set()
+
+        if self.room is not None:
+            self.room.on("participant_disconnected", _on_participant_disconnected)
+
+        tasks = {
+            asyncio.create_task(self._run_strategy(strategy, started)): strategy
+            for strategy in self.strategies
+        }
+        results: Dict[str, StrategyResult] = {}
+        sip_waiter = asyncio.create_task(sip_event.wait())
+        pending = set(tasks)
+
+        def _mark_sip_gone(confirmed_by: str):
+            if not report.sip_gone:
+                report.sip_gone = True
+                report.sip_gone_after = time.perf_counter() - started
+                report.confirmed_by = confirmed_by
+                sip_event.set()
+
+        try:
+            if self._check_sip_gone():
+                _mark_sip_gone("room_state")
+
+            while pending:
+                remaining = deadline_at - time.perf_counter()
+                if remaining <= 0:
+                    break
+                waiting_on = pending if sip_event.is_set() else pending | {sip_waiter}
+                done, _ = await asyncio.wait(waiting_on, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done & pending:
+                    result = task.result()
+                    results[result.name] = result
+                    if result.outcome == OK and tasks[task].confirms_hangup:
+                        _mark_sip_gone(result.name)
+                pending -= done
+
+                if not report.sip_gone and (sip_event.is_set() or self._check_sip_gone()):
+                    _mark_sip_gone("participant_disconnected")
+
+                if report.sip_gone:
+                    # Hang-up is done - stop the remaining hang-up strategies
+                    for task in [t for t in pending if not tasks[t].required]:
+                        task.cancel()
+                        pending.discard(task)
+                        results[tasks[task].name] = StrategyResult(
+                            tasks[task].name, CANCELLED, time.perf_counter() - started
+                        )
+        finally:
+            for task in pending:
+                task.cancel()
+                results[tasks[task].name] = StrategyResult(tasks[task].name, TIMEOUT, time.perf_counter() - started)
+            sip_waiter.cancel()
+            if self.room is not None:
+                self.room.off("participant_disconnected", _on_participant_disconnected)
+
+        report.elapsed = time.perf_counter() - started
+        report.results = [results[strategy.name] for strategy in self.strategies]
+        self._record(report)
+        return report
+
+    def _record(self, report: TeardownReport):
+        teardown_stats.record(report)
+        for result in report.results:
+            if result.outcome != UNAVAILABLE:
+                latency_registry.observe(
+                    TEARDOWN_STRATEGY_SECONDS, result.duration,
+                    strategy=result.name, outcome=result.outcome, **self.labels
+                )
+        latency_registry.observe(TEARDOWN_SECONDS, report.sip_gone_after if report.sip_gone else report.elapsed, **self.labels)
+        for result in report.results:
+            if result.outcome == ERROR:
+                log.debug(f"Teardown strategy {result.name} failed: {result.error}")
+        if report.sip_gone:
+            log.info(f"✅ Call teardown: {report.summary()}")
+        else:
+            log.warning(f"⚠️ Call teardown: {report.summary()}")
@@ -77,6 +77,11 @@ async def test_create_order():
             print(f"\n✅ Order created successfully!")
             print(f"   MongoDB ID: {order.get('_id')}")
             
+            # Clover sync runs in the background - wait for it, then re-read the order
+            await db_driver.drain_clover_sync(timeout=60)
+            from bson.objectid import ObjectId
+            order = db_driver.collection.find_one({"_id": ObjectId(order["_id"])}) or order
+            
             if order.get('clover_order_id'):
                 print(f"   Clover Order ID: {order['clover_order_id']}")
                 print(f"\n🎉 Integration successful! Order synced to both systems!")
@@ -0,0 +1,97 @@
+"""
+Tests for the group-commit order writer.
+
+Checks that one unordered insert_many batch hands every caller its own
+result: the ObjectId for documents that were inserted, and the matching
+write error (DuplicateKeyError for duplicate keys) for those that were not.
+
+Run with: python -m pytest test_group_commit.py
+"""
+
+import asyncio
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from group_commit import GroupCommitWriter
+
+
+class FakeInsertMany:
+    """insert_many(ordered=False) that fails the documents at the given indexes."""
+
+    def __init__(self, write_errors=None):
+        self.write_errors = write_errors or []
+        self.calls = []
+
+    async def __call__(self, docs):
+        self.calls.append(list(docs))
+        for doc in docs:
+            doc.setdefault("_id", ObjectId())
+        if self.write_errors:
+            raise BulkWriteError({"writeErrors": self.write_errors, "nInserted": len(docs) - len(self.write_errors)})
+        return type("InsertManyResult", (), {"inserted_ids": [doc["_id"] for doc in docs]})()
+
+
+async def _insert_all(writer, docs):
+    return await asyncio.gather(*(writer.insert(doc) for doc in docs), return_exceptions=True)
+
+
+def test_batch_returns_each_id():
+    insert_many = FakeInsertMany()
+    writer = GroupCommitWriter(insert_many, window_ms=5, max_batch=10)
+    docs = [{"n": n} for n in range(4)]
+
+    results = asyncio.run(_insert_all(writer, docs))
+
+    assert len(insert_many.calls) == 1
+    assert results == [doc["_id"] for doc in docs]
+
+
+def test_mixed_write_errors_map_to_their_documents():
+    insert_many = FakeInsertMany(write_errors=[
+        {"index": 1, "code": 11000, "errmsg": "E11000 duplicate key error: outbox_id"},
+        {"index": 3, "code": 121, "errmsg": "Document failed validation"},
+    ])
+    writer = GroupCommitWriter(insert_many, window_ms=5, max_batch=10)
+    docs = [{"n": n} for n in range(5)]
+
+    results = asyncio.run(_insert_all(writer, docs))
+
+    assert len(insert_many.calls) == 1
+    assert results[0] == docs[0]["_id"]
+    assert isinstance(results[1], DuplicateKeyError)
+    assert results[2] == docs[2]["_id"]
+    assert isinstance(results[3], BulkWriteError)
+    assert results[3].details["writeErrors"][0]["code"] == 121
+    assert results[4] == docs[4]["_id"]
+    assert writer.stats()["documents"] == 5
+
+
+def test_other_errors_fail_the_whole_batch():
+    async def insert_many(docs):
+        raise ConnectionError("no primary")
+
+    writer = GroupCommitWriter(insert_many, window_ms=5, max_batch=10)
+
+    results = asyncio.run(_insert_all(writer, [{"n": n} for n in range(3)]))
+
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert writer.stats()["batches"] == 0
+
+
+def test_flush_writes_pending_batch_without_waiting_for_the_window():
+    insert_many = FakeInsertMany()
+    # A window far longer than the test: only flush() can write the batch
+    writer = GroupCommitWriter(insert_many, window_ms=60_000, max_batch=10)
+
+    async def run():
+        pending = asyncio.ensure_future(_insert_all(writer, [{"n": 0}, {"n": 1}]))
+        while writer.stats()["pending"] < 2:
+            await asyncio.sleep(0)
+        await writer.flush()
+        return await asyncio.wait_for(pending, timeout=1)
+
+    results = asyncio.run(run())
+
+    assert len(insert_many.calls) == 1
+    assert all(isinstance(result, ObjectId) for result in results)
+    assert writer.stats()["pending"] == 0
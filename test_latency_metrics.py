@@ -0,0 +1,44 @@
+"""
+Tests for the latency histogram quantiles and per-call series cleanup.
+
+Run with: python -m pytest test_latency_metrics.py
+"""
+
+from latency_metrics import Histogram, LatencyRegistry
+
+
+def _histogram(values):
+    histogram = Histogram()
+    for value in values:
+        histogram.observe(value)
+    return histogram
+
+
+def test_quantile_uses_nearest_rank():
+    # Nearest rank: the ceil(q * n)-th smallest sample
+    assert _histogram([1, 2]).quantile(0.5) == 1
+    assert _histogram([1, 2, 3]).quantile(0.5) == 2
+    assert _histogram(range(1, 7)).quantile(0.5) == 3
+    assert _histogram(range(1, 11)).quantile(0.95) == 10
+    assert _histogram(range(1, 101)).quantile(0.95) == 95
+    assert _histogram(range(1, 101)).quantile(0.99) == 99
+
+
+def test_quantile_edges():
+    assert Histogram().quantile(0.5) is None
+    assert _histogram([7]).quantile(0.5) == 7
+    assert _histogram([7]).quantile(0.99) == 7
+    assert _histogram([3, 1, 2]).quantile(0.0) == 1
+    assert _histogram([3, 1, 2]).quantile(1.0) == 3
+
+
+def test_remove_drops_only_the_calls_series():
+    registry = LatencyRegistry()
+    registry.observe("turn", 0.1, call_id="a", worker="w")
+    registry.observe("turn", 0.2, call_id="b", worker="w")
+    registry.increment("tasks", call_id="a", worker="w")
+
+    assert registry.remove(call_id="a") == 2
+    assert registry.get("turn", call_id="a", worker="w") is None
+    assert registry.get("turn", call_id="b", worker="w").count == 1
+    assert registry.value("tasks", call_id="a", worker="w") is None
@@ -0,0 +1,206 @@
+# Twilio REST Integration Module
+import os
+import time
+import random
+import asyncio
+import logging
+import aiohttp
+from typing import Dict, Any, Optional, Tuple
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Logger
+log = logging.getLogger("realtime_restaurant_agent")
+
+# ---------- Connection pool settings ----------
+# One pooled session per worker process keeps DNS, TCP and TLS to Twilio warm,
+# so a burst of call endings does not pay a fresh handshake per hangup
+TWILIO_POOL_LIMIT = int(os.getenv("TWILIO_POOL_LIMIT", "20"))
+TWILIO_DNS_CACHE_TTL = int(os.getenv("TWILIO_DNS_CACHE_TTL", "300"))
+TWILIO_KEEPALIVE_TIMEOUT = float(os.getenv("TWILIO_KEEPALIVE_TIMEOUT", "60"))
+
+# ---------- Retry settings ----------
+# Per-attempt timeout and the total budget across all attempts of one call
+TWILIO_REQUEST_TIMEOUT = float(os.getenv("TWILIO_REQUEST_TIMEOUT", "3"))
+TWILIO_TIMEOUT_BUDGET = float(os.getenv("TWILIO_TIMEOUT_BUDGET", "6"))
+TWILIO_MAX_ATTEMPTS = int(os.getenv("TWILIO_MAX_ATTEMPTS", "4"))
+TWILIO_RETRY_BASE_DELAY = float(os.getenv("TWILIO_RETRY_BASE_DELAY", "0.2"))
+TWILIO_RETRY_MAX_DELAY = float(os.getenv("TWILIO_RETRY_MAX_DELAY", "2"))
+
+# HTTP statuses worth retrying (rate limited or transient server errors)
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TwilioClient:
+    """
+    Twilio REST API client for call control (ending a call's SIP leg).
+
+    Requests go through one pooled session and are retried with full-jitter
+    backoff on 429/5xx and network errors, within a total timeout budget.
+    """
+
+    def __init__(
+        self,
+        account_sid: str = None,
+        auth_token: str = None,
+        base_url: str = None
+    ):
+        """
+        Initialize Twilio API client.
+
+        Args:
+            account_sid: Twilio account SID (defaults to env var)
+            auth_token: Twilio auth token (defaults to env var)
+            base_url: Twilio API base URL (defaults to env var or api.twilio.com)
+        """
+        self.account_sid = account_sid or os.getenv("TWILIO_ACCOUNT_SID")
+        self.auth_token = auth_token or os.getenv("TWILIO_AUTH_TOKEN")
+        self.base_url = base_url or os.getenv("TWILIO_BASE_URL", "https://api.twilio.com")
+
+        if not self.account_sid or not self.auth_token:
+            raise ValueError("TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN environment variables must be set")
+
+        # Shared HTTP session (created lazily on first request)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+        Get the pooled HTTP session, creating it on first use.
+
+        The session is bound to the running event loop, so a new one is
+        created if the previous session was closed or belongs to another loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=TWILIO_POOL_LIMIT,
+                ttl_dns_cache=TWILIO_DNS_CACHE_TTL,
+                keepalive_timeout=TWILIO_KEEPALIVE_TIMEOUT,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                auth=aiohttp.BasicAuth(self.account_sid, self.auth_token),
+            )
+            self._session_loop = loop
+        return self._session
+
+    async def close(self):
+        """Close the pooled HTTP session (call on worker shutdown)."""
+        session = self._session
+        self._session = None
+        self._session_loop = None
+        if session is not None and not session.closed:
+            await session.close()
+
+    def _backoff_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Retry-After if Twilio sent one, otherwise full-jitter exponential backoff."""
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return random.uniform(0, min(TWILIO_RETRY_MAX_DELAY, TWILIO_RETRY_BASE_DELAY * (2 ** attempt)))
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        data: Dict[str, Any] = None,
+        budget: float = None
+    ) -> Tuple[Optional[int], Any]:
+        """
+        Send a form-encoded request to the account's REST resources, with retries.
+
+        Args:
+            method: HTTP method
+            path: Path under /2010-04-01/Accounts/{sid}/ (e.g. "Calls/CA123.json")
+            data: Form fields
+            budget: Total seconds across all attempts (defaults to env var)
+
+        Returns:
+            (status, body) of the last attempt - body is parsed JSON when
+            possible; status is None if no response was received
+        """
+        url = f"{self.base_url}/2010-04-01/Accounts/{self.account_sid}/{path}"
+        deadline = time.monotonic() + (TWILIO_TIMEOUT_BUDGET if budget is None else budget)
+        status, body = None, None
+
+        for attempt in range(TWILIO_MAX_ATTEMPTS):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            retry_after = None
+            try:
+                session = self._get_session()
+                timeout = aiohttp.ClientTimeout(total=min(TWILIO_REQUEST_TIMEOUT, remaining))
+                async with session.request(method, url, data=data, timeout=timeout) as response:
+                    status = response.status
+                    try:
+                        body = await response.json(content_type=None)
+                    except ValueError:
+                        body = await response.text()
+                    if status not in _RETRY_STATUSES:
+                        return status, body
+                    retry_after = response.headers.get("Retry-After")
+                    log.warning(f"⚠️ Twilio {method} {path} returned {status} (attempt {attempt + 1})")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status, body = None, str(e) or type(e).__name__
+                log.warning(f"⚠️ Twilio {method} {path} failed: {body} (attempt {attempt + 1})")
+
+            delay = self._backoff_delay(attempt, retry_after)
+            if attempt + 1 >= TWILIO_MAX_ATTEMPTS or time.monotonic() + delay >= deadline:
+                break
+            await asyncio.sleep(delay)
+
+        return status, body
+
+    async def end_call(self, call_sid: str, budget: float = None) -> bool:
+        """
+        Complete (hang up) an in-progress call.
+
+        Args:
+            call_sid: Twilio call SID
+            budget: Total seconds for all attempts (defaults to env var)
+
+        Returns:
+            True if Twilio confirmed the call is completed
+        """
+        status, body = await self._request("POST", f"Calls/{call_sid}.json", {"Status": "completed"}, budget)
+        if status == 200:
+            log.info(f"✅ Twilio call {call_sid} terminated.")
+            return True
+        log.warning(f"⚠️ Twilio API failed: {status} - {body}")
+        return False
+
+
+# Singleton instance (one pooled client per worker process)
+_twilio_client = None
+
+
+def get_twilio_client() -> TwilioClient:
+    """
+    Get or create singleton Twilio client instance.
+
+    Returns:
+        TwilioClient instance
+
+    Raises:
+        ValueError: If Twilio credentials are not configured
+    """
+    global _twilio_client
+    if _twilio_client is None:
+        _twilio_client = TwilioClient()
+    return _twilio_client
+
+
+async def close_twilio_client():
+    """
+    Close the singleton Twilio client's connection pool, if one was created.
+
+    Safe to call when Twilio was never used (e.g. missing credentials).
+    """
+    if _twilio_client is not None:
+        await _twilio_client.close()
@@ -0,0 +1,114 @@
+# Worker Load Reporting
+#
+# Custom WorkerOptions.load_fnc for the inbound agent. The default load is
+# host CPU only; a worker can be "idle" by that measure while it already runs
+# as many realtime sessions as it can carry. Load here is the worse of two
+# signals:
+#
+#   calls     active jobs, scaled so WORKER_MAX_CALLS lands exactly on the
+#             threshold (1.0 at the cap)
+#   cpu       moving average of CPU use (cgroup-aware, includes noise cancellation)
+#
+# Once load reaches load_threshold the worker is marked full and LiveKit
+# dispatches new calls to other workers. Event-loop lag is not a signal: the
+# calls run on their job processes' loops (see loop_monitor.py), not on the
+# worker's loop this function is called from.
+import os
+import logging
+import threading
+from typing import Dict, Any, Optional
+from dotenv import load_dotenv
+
+from livekit.agents.utils import MovingAverage
+from livekit.agents.utils.hw import get_cpu_monitor
+
+# Load environment variables
+load_dotenv()
+
+# Logger
+log = logging.getLogger("realtime_restaurant_agent")
+
+# ---------- Load settings ----------
+# Maximum concurrent calls per worker (each call runs in its own job process)
+WORKER_MAX_CALLS = int(os.getenv("WORKER_MAX_CALLS", "8"))
+# Load at which the worker stops accepting calls (must be < 1 in production);
+# the CPU share that counts as full, and where the call count reaches the cap
+WORKER_LOAD_THRESHOLD = float(os.getenv("WORKER_LOAD_THRESHOLD", "0.75"))
+# Seconds between CPU samples
+WORKER_LOAD_SAMPLE_INTERVAL = float(os.getenv("WORKER_LOAD_SAMPLE_INTERVAL", "0.5"))
+
+
+class WorkerLoadMonitor:
+    """Samples CPU on a background thread."""
+
+    def __init__(self, window: int = 5):
+        self._cpu_monitor = get_cpu_monitor()
+        self._cpu_avg = MovingAverage(window)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="worker_load_monitor")
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            cpu = self._cpu_monitor.cpu_percent(interval=WORKER_LOAD_SAMPLE_INTERVAL)
+            with self._lock:
+                self._cpu_avg.add_sample(cpu)
+
+    @property
+    def cpu(self) -> float:
+        with self._lock:
+            return self._cpu_avg.get_avg()
+
+
+_monitor: Optional[WorkerLoadMonitor] = None
+_monitor_lock = threading.Lock()
+_last_snapshot: Dict[str, Any] = {}
+
+
+def _get_monitor() -> WorkerLoadMonitor:
+    global _monitor
+    if _monitor is None:
+        with _monitor_lock:
+            if _monitor is None:
+                _monitor = WorkerLoadMonitor()
+    return _monitor
+
+
+def compute_load(active_calls: int, cpu: float) -> float:
+    """
+    Combine the load signals into one 0..1 value.
+
+    Args:
+        active_calls: Jobs currently running on this worker
+        cpu: CPU utilisation 0..1
+
+    Returns:
+        Worker load (1.0 when the call cap is reached; below the threshold
+        for any call count under the cap)
+    """
+    if active_calls >= WORKER_MAX_CALLS:
+        return 1.0
+    return min(1.0, max(active_calls / WORKER_MAX_CALLS * WORKER_LOAD_THRESHOLD, cpu))
+
+
+def worker_load(worker) -> float:
+    """WorkerOptions.load_fnc - called periodically from a worker executor thread."""
+    global _last_snapshot
+    monitor = _get_monitor()
+
+    active_calls = len(worker.active_jobs)
+    cpu = monitor.cpu
+    load = compute_load(active_calls, cpu)
+
+    snapshot = {"load": load, "active_calls": active_calls, "cpu": cpu}
+    was_full = _last_snapshot.get("load", 0.0) >= WORKER_LOAD_THRESHOLD
+    if (load >= WORKER_LOAD_THRESHOLD) != was_full:
+        state = "FULL - not accepting calls" if load >= WORKER_LOAD_THRESHOLD else "accepting calls"
+        log.info(f"⚖️ Worker {state}: load={load:.2f} calls={active_calls}/{WORKER_MAX_CALLS} cpu={cpu:.0%}")
+    _last_snapshot = snapshot
+    return load
+
+
+def get_worker_load_snapshot() -> Dict[str, Any]:
+    """Last computed load and its inputs."""
+    return dict(_last_snapshot)